@@ -0,0 +1,69 @@
+# newsdata/cache.py
+import hashlib
+import json
+
+from django.core.cache import caches
+
+from stockcompass.singleflight import SingleFlight
+
+# Counters for this process; the cache itself may be shared between workers.
+stats = {"hits": 0, "misses": 0}
+_flights = SingleFlight()
+
+
+def explanation_key(provider, stock, start, end):
+    """Cache key for one explanation request; the parts are hashed to keep keys backend-safe."""
+    raw = json.dumps([provider, stock.upper(), start, end])
+    return "news:explanation:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def lookup_explanation(provider, stock, start, end, count=True):
+    """
+    The cached explanation for (provider, stock, start, end), or None (counted as a
+    miss). ``count=False`` is for rechecks of a request that was already counted.
+    """
+    result = await caches["news"].aget(explanation_key(provider, stock, start, end))
+    if count:
+        stats["hits" if result is not None else "misses"] += 1
+    return result
+
+
+async def store_explanation(provider, stock, start, end, result):
+    await caches["news"].aset(explanation_key(provider, stock, start, end), result)
+
+
+async def cached_explanation(provider, stock, start, end, compute, cacheable=lambda result: True,
+                             count_lookup=True):
+    """
+    Return the explanation for (provider, stock, start, end) from the "news" cache,
+    or compute it with ``await compute()`` and store it.
+
+    Concurrent misses for the same key share a single ``compute()`` call. Results
+    for which ``cacheable(result)`` is false (e.g. a provider's error fallback) are
+    returned but not stored. ``count_lookup=False`` leaves the hit/miss counters to
+    a caller that has already looked the key up.
+    """
+    result = await lookup_explanation(provider, stock, start, end, count=count_lookup)
+    if result is not None:
+        return result
+
+    async def compute_and_store():
+        value = await compute()
+        if value is not None and cacheable(value):
+            await store_explanation(provider, stock, start, end, value)
+        return value
+
+    return await _flights.do(explanation_key(provider, stock, start, end), compute_and_store)
+
+
+def cache_stats():
+    """Hit/miss counters for this process, plus how many misses were coalesced."""
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_rate": stats["hits"] / lookups if lookups else None,
+        "upstream_calls": _flights.stats["leaders"],
+        "coalesced": _flights.stats["joined"],
+        "in_flight": _flights.in_flight(),
+    }
@@ -1,4 +1,8 @@
 import os
+import re
+import json
+import uuid
+import threading
 import pandas as pd
 import numpy as np
 import asyncio
@@ -6,65 +10,263 @@ import yfinance as yf
 import scipy.stats
 from arch import arch_model
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 #############################################
-# 1. Market Data Access and Calculation
+# 1. Market Data Access and Storage
 #############################################
 
+# Index history is kept per (symbol, interval) as one raw little-endian array file
+# per column plus meta.json, which names the current generation of those files and
+# its length. Workers map the files read-only (np.memmap), so every process shares
+# the same page cache instead of holding its own parsed copy.
+#
+# Files are never modified once published: an update writes a new generation next
+# to the old one and switches meta.json over with os.replace, so a process still
+# mapping the old generation keeps a consistent view. Updates are serialized with
+# an fcntl lock where available; elsewhere (Windows) concurrent updates stay
+# consistent, the last one to publish wins and an old generation that is still
+# mapped is left on disk.
+MARKET_COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+_COLUMN_FILES = {"time": "i8", **{name.lower(): "f8" for name in MARKET_COLUMNS}}
+
+# Process-wide loader cache: directory -> (meta.json inode and mtime, MarketData)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def market_data_dir(index_symbol="^GSPC", interval="1d", data_dir=None):
+    """Directory holding the stored history of ``index_symbol`` at ``interval``."""
+    if data_dir is None:
+        from django.conf import settings
+        data_dir = settings.MARKET_DATA_DIR
+    return os.path.join(data_dir, re.sub(r"[^A-Za-z0-9.-]", "_", index_symbol) + "_" + interval)
+
+
+def _column_path(directory, column, generation):
+    """The file of ``column`` ("time", "close", ...) in a generation (None: stores from before generations)."""
+    suffix = _COLUMN_FILES[column]
+    name = f"{column}.{suffix}" if generation is None else f"{column}.{generation}.{suffix}"
+    return os.path.join(directory, name)
+
+
+class MarketData:
+    """
+    Read-only view of a stored index history.
+
+    Attributes:
+        times (np.ndarray): datetime64[ns] bar timestamps (UTC), ascending.
+        columns (dict): "Open"/"High"/"Low"/"Close"/"Volume" float64 arrays.
+        timezone (str): Exchange timezone of the bars.
+    """
+
+    def __init__(self, directory, length, timezone, generation=None):
+        self.directory = directory
+        self.length = length
+        self.timezone = timezone
+        self.generation = generation
+        self.times = np.memmap(_column_path(directory, "time", generation), dtype="<i8", mode="r",
+                               shape=(length,)).view("M8[ns]")
+        self.columns = {
+            name: np.memmap(_column_path(directory, name.lower(), generation), dtype="<f8", mode="r", shape=(length,))
+            for name in MARKET_COLUMNS
+        }
+        self._frame = None
+        self._dates = None
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def dates(self):
+        """datetime64[D] exchange-local date of every bar."""
+        if self._dates is None:
+            index = pd.DatetimeIndex(self.times).tz_localize("UTC").tz_convert(self.timezone).tz_localize(None)
+            self._dates = index.to_numpy().astype("M8[D]")
+        return self._dates
+
+    def frame(self):
+        """
+        The history as a DataFrame indexed by exchange-local timestamps, with the
+        daily return (in percent) and its 30-bar rolling volatility added.
+        Built once per loaded version.
+        """
+        if self._frame is None:
+            index = pd.DatetimeIndex(self.times, name="Date").tz_localize("UTC").tz_convert(self.timezone)
+            data = pd.DataFrame({name: np.asarray(values) for name, values in self.columns.items()}, index=index)
+            data['daily_return'] = data['Close'].pct_change() * 100
+            data['volatility'] = data['daily_return'].rolling(window=30).std()
+            self._frame = data
+        return self._frame
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, "meta.json")) as f:
+        return json.load(f)
+
+
+def _write_generation(directory, stored, data, first_row, timezone):
+    """
+    Publish rows ``first_row`` onward from ``data``, after the first ``first_row``
+    rows of ``stored``, as a new generation of the column files.
+
+    The new files are complete on disk before meta.json is atomically replaced to
+    point at them; the replaced generation is removed afterwards (readers that
+    still map it keep their pages on POSIX).
+    """
+    os.makedirs(directory, exist_ok=True)
+    times = data.index.tz_convert("UTC").tz_localize(None).to_numpy(dtype="M8[ns]").view("<i8")
+    arrays = {"time": (stored.times.view("<i8") if stored is not None else None, times)}
+    for name in MARKET_COLUMNS:
+        arrays[name.lower()] = (stored.columns[name] if stored is not None else None, data[name].to_numpy(dtype="<f8"))
+
+    generation = uuid.uuid4().hex[:12]
+    for column, (old, new) in arrays.items():
+        with open(_column_path(directory, column, generation), "wb") as f:
+            if old is not None and first_row:
+                f.write(np.asarray(old[:first_row]).tobytes())
+            f.write(new.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    meta_path = os.path.join(directory, "meta.json")
+    with open(meta_path + f".{generation}.tmp", "w") as f:
+        json.dump({"length": first_row + len(data), "timezone": timezone, "generation": generation}, f)
+    os.replace(meta_path + f".{generation}.tmp", meta_path)
+
+    if stored is not None:
+        for column in _COLUMN_FILES:
+            try:
+                os.remove(_column_path(directory, column, stored.generation))
+            except OSError:
+                pass  # Already gone, or still mapped on Windows
+
+
+def _store_history(directory, data):
+    """Merge freshly downloaded bars into the store (under an exclusive lock where available)."""
+    timezone = str(data.index.tz)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            stored = load_market_series(directory=directory)
+        except FileNotFoundError:
+            stored = None
+        if stored is not None and len(stored):
+            last = stored.times[-1]
+            new_times = data.index.tz_convert("UTC").tz_localize(None).to_numpy(dtype="M8[ns]")
+            keep = new_times >= last
+            data = data[keep]
+            # The last stored bar may have been still forming; the new generation replaces it.
+            first_row = len(stored) - 1 if len(data) and new_times[keep][0] == last else len(stored)
+        else:
+            first_row = 0
+        if len(data):
+            _write_generation(directory, stored, data, first_row, timezone)
+        return first_row, len(data)
+
+
 async def fetch_and_store_market_data(
     index_symbol="^GSPC",  # S&P 500 ticker in yfinance; use "^DJI" for DJIA if preferred
     period="max",          # Get full historical data
     interval="1d",
-    csv_file="market_data.csv"
+    data_dir=None
 ):
     """
-    Asynchronously fetch market index data, calculate daily returns and rolling volatility,
-    and store the results in a CSV file.
+    Asynchronously fetch market index data and add it to the columnar store.
+
+    The first call downloads ``period`` of history; later calls only download the
+    bars from the last stored one onward and append them.
     
     Parameters:
         index_symbol (str): Market index ticker (default is S&P500).
-        period (str): Time period for the data.
+        period (str): Time period for the initial download.
         interval (str): Data interval.
-        csv_file (str): File path to store the CSV.
+        data_dir (str): Root of the store (default settings.MARKET_DATA_DIR).
         
     Returns:
-        pd.DataFrame: The fetched and computed market data.
+        MarketData: The stored history.
     """
+    directory = market_data_dir(index_symbol, interval, data_dir)
     ticker = yf.Ticker(index_symbol)
+    try:
+        stored = load_market_series(directory=directory)
+    except FileNotFoundError:
+        stored = None
+
     # Fetch historical data asynchronously.
-    data = await asyncio.to_thread(ticker.history, period=period, interval=interval)
-    
-    if data.empty:
-        raise ValueError(f"No data found for {index_symbol}")
-    
-    # Calculate daily returns (in percentage).
-    data['daily_return'] = data['Close'].pct_change() * 100
-    # Calculate rolling volatility (using a 30-day window, for example).
-    data['volatility'] = data['daily_return'].rolling(window=30).std()
-    
-    # Store the data to CSV.
-    data.to_csv(csv_file)
-    print(f"Market data for {index_symbol} saved to {csv_file}")
-    return data
+    if stored is not None and len(stored):
+        last = pd.Timestamp(stored.times[-1]).tz_localize("UTC").tz_convert(stored.timezone)
+        data = await asyncio.to_thread(ticker.history, start=last.date().isoformat(), interval=interval)
+        if data.empty:
+            return stored
+    else:
+        data = await asyncio.to_thread(ticker.history, period=period, interval=interval)
+        if data.empty:
+            raise ValueError(f"No data found for {index_symbol}")
+
+    os.makedirs(directory, exist_ok=True)
+    first_row, written = await asyncio.to_thread(_store_history, directory, data)
+    print(f"Market data for {index_symbol}: {written} bars written from row {first_row} in {directory}")
+    return load_market_series(directory=directory)
 
 #############################################
-# 2. Load Market Data from CSV
+# 2. Load Market Data
 #############################################
 
-def load_market_data(csv_file="market_data.csv"):
+def load_market_series(index_symbol="^GSPC", interval="1d", data_dir=None, directory=None):
+    """
+    The stored history of ``index_symbol`` as memory-mapped arrays.
+
+    Cached for the whole process: repeat calls only stat meta.json and return the
+    same MarketData until an update publishes new rows.
+
+    Raises:
+        FileNotFoundError: Nothing has been stored yet.
+    """
+    directory = directory or market_data_dir(index_symbol, interval, data_dir)
+    meta_path = os.path.join(directory, "meta.json")
+    try:
+        stat = os.stat(meta_path)
+        version = (stat.st_ino, stat.st_mtime_ns)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"{directory} does not exist. Please run fetch_and_store_market_data first.") from None
+
+    cached = _loaded.get(directory)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _loaded_lock:
+        for attempt in range(2):
+            with open(meta_path) as f:
+                stat = os.fstat(f.fileno())
+                meta = json.load(f)
+            try:
+                data = MarketData(directory, meta["length"], meta["timezone"], meta.get("generation"))
+                break
+            except FileNotFoundError:
+                # An update replaced this generation between reading meta.json and mapping it.
+                if attempt:
+                    raise
+        _loaded[directory] = ((stat.st_ino, stat.st_mtime_ns), data)
+    return data
+
+
+def load_market_data(index_symbol="^GSPC", interval="1d", data_dir=None):
     """
-    Load market data from a CSV file.
+    Load market data as a DataFrame (see MarketData.frame).
     
     Parameters:
-        csv_file (str): Path to the CSV file.
+        index_symbol (str): Market index ticker.
+        interval (str): Data interval.
+        data_dir (str): Root of the store (default settings.MARKET_DATA_DIR).
         
     Returns:
         pd.DataFrame: The market data.
     """
-    if os.path.exists(csv_file):
-        data = pd.read_csv(csv_file, index_col=0, parse_dates=True)
-        return data
-    else:
-        raise FileNotFoundError(f"{csv_file} does not exist. Please run fetch_and_store_market_data first.")
+    return load_market_series(index_symbol, interval, data_dir).frame()
 
 #############################################
 # 3. Compare Stock vs. Market Movement
@@ -102,6 +304,82 @@ def analyze_stock_vs_market_direction(stock_data, market_data, start_date, end_d
     same_direction = (stock_return * market_return) > 0
     return same_direction
 
+
+def _range_returns(dates, closes, starts, ends):
+    """
+    Return over each [start, end] date range, from the first to the last bar inside
+    it, for ``dates`` sorted ascending. NaN where a range holds no bar.
+    """
+    first = np.searchsorted(dates, starts, side="left")
+    last = np.searchsorted(dates, ends, side="right") - 1
+    valid = first <= last
+    if not valid.any():
+        return np.full(len(starts), np.nan)
+    first, last = np.where(valid, first, 0), np.where(valid, last, 0)
+    return np.where(valid, closes[last] / closes[first] - 1, np.nan)
+
+
+def market_beta(stock_dates, stock_prices, market_dates, market_closes):
+    """
+    Beta of the stock's daily returns against the market's, over the dates both
+    series have. Intraday stock series are reduced to their last bar per day.
+    NaN when fewer than two common returns are available.
+    """
+    day_ends = np.r_[np.flatnonzero(stock_dates[1:] != stock_dates[:-1]), len(stock_dates) - 1]
+    _, stock_idx, market_idx = np.intersect1d(stock_dates[day_ends], market_dates, assume_unique=True, return_indices=True)
+    if len(stock_idx) < 3:
+        return np.nan
+    stock_returns = np.diff(stock_prices[day_ends][stock_idx]) / stock_prices[day_ends][stock_idx][:-1]
+    market_returns = np.diff(market_closes[market_idx]) / market_closes[market_idx][:-1]
+    variance = np.var(market_returns)
+    if variance == 0:
+        return np.nan
+    return float(np.mean((stock_returns - stock_returns.mean()) * (market_returns - market_returns.mean())) / variance)
+
+
+def analyze_ranges_vs_market(stock_times, stock_prices, ranges, market, max_excess_ratio=0.5):
+    """
+    Vectorized analyze_stock_vs_market_direction over many ranges of one stock.
+
+    Every range is located in the stock and market date arrays with searchsorted,
+    so the whole batch is a handful of array operations.
+
+    Parameters:
+        stock_times (array-like): Bar timestamps or "YYYY-MM-DD" strings, ascending.
+        stock_prices (array-like): Closing prices for ``stock_times``.
+        ranges (list): (start, end) date pairs, both inclusive.
+        market (MarketData): Stored index history (see load_market_series).
+        max_excess_ratio (float): A same-direction range counts as market-driven when
+            its beta-adjusted excess return is at most this fraction of the stock's move.
+    Returns:
+        dict: "beta" (float) and, one entry per range, the arrays "stock_return",
+              "market_return", "excess_return" (stock_return - beta * market_return),
+              "same_direction" and "market_driven". Ranges without bars on either
+              side get NaN returns and False flags.
+    """
+    stock_dates = np.asarray(stock_times, dtype="datetime64").astype("M8[D]")
+    stock_prices = np.asarray(stock_prices, dtype=float)
+    market_closes = np.asarray(market.columns["Close"])
+    bounds = np.asarray(ranges, dtype="datetime64[D]").reshape(-1, 2)
+    starts, ends = bounds[:, 0], bounds[:, 1]
+
+    stock_return = _range_returns(stock_dates, stock_prices, starts, ends)
+    market_return = _range_returns(market.dates, market_closes, starts, ends)
+    beta = market_beta(stock_dates, stock_prices, market.dates, market_closes)
+
+    excess_return = stock_return - beta * market_return
+    with np.errstate(invalid="ignore"):
+        same_direction = (stock_return * market_return) > 0
+        market_driven = same_direction & (np.abs(excess_return) <= max_excess_ratio * np.abs(stock_return))
+    return {
+        "beta": beta,
+        "stock_return": stock_return,
+        "market_return": market_return,
+        "excess_return": excess_return,
+        "same_direction": same_direction,
+        "market_driven": market_driven,
+    }
+
 #############################################
 # Example Usage
 #############################################
@@ -113,7 +391,7 @@ def analyze_stock_vs_market_direction(stock_data, market_data, start_date, end_d
 # Suppose you already have a DataFrame `stock_data` for your single stock.
 # And you have an abnormal period identified, e.g., start_date and end_date (strings in "YYYY-MM-DD" format).
 
-# Load market data from CSV.
+# Load market data from the store.
 # market_df = load_market_data()
 
 # Compare the movement in the given period.
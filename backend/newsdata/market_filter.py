@@ -0,0 +1,67 @@
+# newsdata/market_filter.py
+"""
+Cheap pre-filter in front of the paid explanation chain (SerpAPI + Claude).
+
+Many unusual ranges just follow the index. Before /api/news/ asks an LLM about a
+range, the stock's stored daily bars are compared with the stored market index
+(stockdata.utils.ranges_vs_market); a market-driven range gets a templated
+explanation in the same JSON shape the LLM returns, and no LLM is called.
+
+Only data already stored is used: a request never waits on a Yahoo download for
+the filter, which is skipped while the stock or the index is not stored yet.
+"""
+import json
+
+from django.conf import settings
+
+from stockdata.utils import bar_dates, ranges_vs_market, stored_price_data
+
+
+async def range_vs_market(stock, start, end):
+    """
+    The market comparison for one (start, end) range of ``stock`` (see
+    ranges_vs_market), or None when no bars are stored for it.
+
+    Raises:
+        FileNotFoundError: The market index is not stored yet.
+    """
+    price_data = await stored_price_data(stock, "1d")
+    if price_data is None or price_data.empty:
+        return None
+    data = {"time": bar_dates(price_data), "price": price_data["Close"].to_numpy(dtype=float)}
+    result = await ranges_vs_market(data, [(start, end)], fetch_market=False)
+    return dict(result["ranges"][0], beta=result["beta"])
+
+
+def market_explanation(stock, analysis):
+    """An explanation (JSON string, like the LLM's) for a market-driven range."""
+    index = settings.MARKET_INDEX_SYMBOL
+    start, end = analysis["start"], analysis["end"]
+    stock_return, market_return = analysis["stock_return"], analysis["market_return"]
+    return json.dumps({
+        "explanations": [
+            f"{stock.upper()} moved {stock_return:+.2%} between {start} and {end} while the market index "
+            f"({index}) moved {market_return:+.2%}. With a beta of {analysis['beta']:.2f} to the index, "
+            f"only {analysis['excess_return']:+.2%} of the move is specific to {stock.upper()}."
+        ],
+        "reasons": ["Broad market movement"],
+        "references": [],
+        "text_summary": f"The move in {stock.upper()} from {start} to {end} tracked the overall market "
+                        f"and does not point to company-specific news.",
+    })
+
+
+async def market_driven_explanation(stock, start, end):
+    """
+    The templated explanation if the range is market-driven, else None (the range
+    needs a real explanation). Missing stored data and failures also return None,
+    so the caller falls back to the LLM chain.
+    """
+    try:
+        analysis = await range_vs_market(stock, start, end)
+    except Exception as e:
+        print(f"⚠️ Market filter skipped for {stock} {start}..{end}: {e}")
+        return None
+    if analysis is None or not analysis["market_driven"]:
+        return None
+    return market_explanation(stock, analysis)
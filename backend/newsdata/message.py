@@ -1,19 +1,21 @@
 import os
 import json
+import asyncio
 import yfinance as yf
 from argparse import ArgumentParser
-import requests
-from openai import OpenAI
+from .upstream import request, upstream_url, anthropic_client, openai_client
+from .store import uncovered_ranges, record_search, source_name, stored_results
+from stockcompass.db import run_orm
 
-def send_post_request(url, payload, headers):
-    response = requests.post(url, json=payload, headers=headers)
+async def send_post_request(url, payload, headers):
+    response = await request("POST", url, json=payload, headers=headers)
     try:
         return response.json()
     except json.decoder.JSONDecodeError:
         return {"error": "Invalid JSON", "status_code": response.status_code, "response_text": response.text}
 
-def api_data_request(api_key, stock, start, end):
-    url = "https://api.perplexity.ai/chat/completions"
+async def api_data_request(api_key, stock, start, end):
+    url = upstream_url("perplexity")
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -30,7 +32,7 @@ def api_data_request(api_key, stock, start, end):
         "top_p": 0.9,
         "presence_penalty": 2,
     }
-    full_data = send_post_request(url, payload, headers)
+    full_data = await send_post_request(url, payload, headers)
     if full_data.get('choices'):
         return {
             "citations": full_data.get("citations", []),
@@ -38,8 +40,8 @@ def api_data_request(api_key, stock, start, end):
         }
     return {"citations": [], "content": []}
 
-def api_enhancement_request(api_key, stock, start, end, explanations, references):
-    url = "https://api.deepseek.com/v1/chat/completions"
+async def api_enhancement_request(api_key, stock, start, end, explanations, references):
+    url = upstream_url("deepseek")
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -56,10 +58,10 @@ def api_enhancement_request(api_key, stock, start, end, explanations, references
         "messages": [{"role": "system", "content": setting}, {"role": "user", "content": query}],
         "response_format": {"type": 'json_object'},
     }
-    return send_post_request(url, payload, headers)
+    return await send_post_request(url, payload, headers)
 
-def api_enhancement_request_openai(api_key, stock, start, end, explanations, references):
-    client = OpenAI(api_key=api_key)
+async def api_enhancement_request_openai(api_key, stock, start, end, explanations, references):
+    client = openai_client(api_key)
     
     setting =  """ You will be provided with a list of citations to various news sources and a text string describing possible explanations for a drop in stock performance. Your job is to analyze this string and then rethink the provided explanations. Check each of the sites and enhance the explanations by providing additional details and context. Feel free to remove explanations that don't make much sense. YOU WILL BE EXPECTED TO FIND MORE RESOURCES. You will be evaluated on the quality and novelty of your enhancements in that order. Quality is measured by the degree to which your data is supported by the references you present. Novelty is the likelihood that another model would not present this information. Be concise and to the point. If any of the explanations appear weak, ignore them and focus on improving the others. DO NOT MENTION UNSUPPORTED HYPOTHETICAL CLAIMS. YOUR OUTPUT MUST BE IN THE JSON FORMAT: {\"explanations\": [\"explanation1\", \"explanation2\"], \"reasons\": [\"reason1\", \"reason2\"], \"references\": [\"reference1\", \"reference2\"], \"text_summary\": \"summary\"}"""
     
@@ -73,7 +75,7 @@ def api_enhancement_request_openai(api_key, stock, start, end, explanations, ref
         "messages": [{"role": "system", "content": setting}, {"role": "user", "content": query}],
         "response_format": {"type": 'json_object'},
     }
-    const_response = client.chat.completions.create(
+    const_response = await client.chat.completions.create(
         model='gpt-4o',
         messages=[
             {'role':'system', "content": setting},
@@ -83,20 +85,22 @@ def api_enhancement_request_openai(api_key, stock, start, end, explanations, ref
     )
     return const_response
 
-def generate_data(api_key_1, api_key_2, stock, start, end):
-    simple_explanations = api_data_request(api_key_1, stock, start, end)
-    complex_explanations = api_enhancement_request(api_key_2, stock, start, end, simple_explanations['content'], simple_explanations["citations"])
+async def generate_data(api_key_1, api_key_2, stock, start, end):
+    simple_explanations = await api_data_request(api_key_1, stock, start, end)
+    complex_explanations = await api_enhancement_request(api_key_2, stock, start, end, simple_explanations['content'], simple_explanations["citations"])
     choices = complex_explanations.get('choices')
     if choices and isinstance(choices, list) and choices[0].get('message'):
         return choices[0]['message'].get('content', 'No content available')
     return "No valid complex explanation returned."
 
-def generate_data_openai(api_key_1, api_key_2, stock, start, end):
-    simple_explanations = api_data_request(api_key_1, stock, start, end)
-    complex_explanations = api_enhancement_request_openai(api_key_2, stock, start, end, simple_explanations['content'], simple_explanations["citations"])
+async def generate_data_openai(api_key_1, api_key_2, stock, start, end):
+    simple_explanations = await api_data_request(api_key_1, stock, start, end)
+    complex_explanations = await api_enhancement_request_openai(api_key_2, stock, start, end, simple_explanations['content'], simple_explanations["citations"])
     return complex_explanations.choices[0].message.content
 
 if __name__ == "__main__":
+    from django.conf import settings
+    settings.configure()
     parser = ArgumentParser()
     parser.add_argument("--api_key_1", type=str, required=True, help="API key for FDP")
     parser.add_argument("--api_key_2", type=str, required=True, help="API key for LLM")
@@ -105,17 +109,18 @@ if __name__ == "__main__":
     parser.add_argument("--end", type=str, required=True, help="End date in YYYY-MM-DD format")
     
     args = parser.parse_args()
-    print(generate_data_openai(args.api_key_1, args.api_key_2, args.stock, args.start, args.end))
+    print(asyncio.run(generate_data_openai(args.api_key_1, args.api_key_2, args.stock, args.start, args.end)))
 
-# Example usage:
-# python message.py --api_key_1 YOUR_PERPLEXITY_KEY --api_key_2 YOUR_OPENAI_KEY --stock AAPL --start "2022-01-01" --end "2022-01-31"
+# Example usage (from backend/):
+# python -m newsdata.message --api_key_1 YOUR_PERPLEXITY_KEY --api_key_2 YOUR_OPENAI_KEY --stock AAPL --start "2022-01-01" --end "2022-01-31"
 
-def serpapi_news_search(api_key, stock, start_date, end_date):
+async def serpapi_news_results(api_key, stock, start_date, end_date):
     """
-    Clean SerpAPI news search for financial data.
-    Searches Google News for stock-related articles in specified date range.
+    Raw Google News results from SerpAPI for the stock in the date range
+    (dicts with "title", "snippet", "link", "source" and "date").
+    Raises on HTTP errors.
     """
-    url = "https://serpapi.com/search"
+    url = upstream_url("serpapi")
     query = f"{stock} stock earnings financial news"
     
     # Convert to Google's date format (MM/DD/YYYY)  
@@ -135,42 +140,68 @@ def serpapi_news_search(api_key, stock, start_date, end_date):
         "tbs": f"cdr:1,cd_min:{start_formatted},cd_max:{end_formatted}"
     }
     
-    try:
-        response = requests.get(url, params=params)
-        data = response.json()
+    response = await request("GET", url, params=params)
+    response.raise_for_status()
+    return response.json().get("news_results", [])
+
+def format_news_results(articles):
+    """Turn news results into the {"citations": [...], "content": [...]} the LLM prompts take."""
+    content = []
+    citations = []
+    
+    for article in articles:
+        title = article.get("title", "")
+        snippet = article.get("snippet", "")
+        link = article.get("link", "")
+        source = source_name(article.get("source"))
+        date = article.get("date", "")
         
-        if "news_results" in data:
-            content = []
-            citations = []
-            
-            for article in data["news_results"]:
-                title = article.get("title", "")
-                snippet = article.get("snippet", "")
-                link = article.get("link", "")
-                source = article.get("source", "")
-                date = article.get("date", "")
-                
-                if title and snippet:
-                    content.append(f"{title}: {snippet} (Source: {source}, Date: {date})")
-                if link:
-                    citations.append(link)
-            
-            return {"citations": citations, "content": content}
-        else:
-            return {"citations": [], "content": []}
-            
+        if title and snippet:
+            content.append(f"{title}: {snippet} (Source: {source}, Date: {date})")
+        if link:
+            citations.append(link)
+    
+    return {"citations": citations, "content": content}
+
+async def serpapi_news_search(api_key, stock, start_date, end_date):
+    """
+    Clean SerpAPI news search for financial data.
+    Searches Google News for stock-related articles in specified date range.
+    """
+    try:
+        return format_news_results(await serpapi_news_results(api_key, stock, start_date, end_date))
     except Exception as e:
         print(f"SerpAPI error: {e}")
         return {"citations": [], "content": []}
 
-def api_enhancement_request_claude(api_key, stock, start, end, explanations, references):
+async def news_search(api_key, stock, start_date, end_date):
     """
-    Clean Claude Sonnet 4 financial analysis.
+    News for the stock in the date range, answered from the local NewsData store.
+    SerpAPI is only queried for the parts of the range that have not been searched
+    before, and its results are stored for later requests.
     """
-    from anthropic import Anthropic
-    
-    client = Anthropic(api_key=api_key)
-    
+    ticker = stock.upper()
+    gaps = await run_orm(uncovered_ranges, ticker, start_date, end_date)
+    searches = await asyncio.gather(*[
+        serpapi_news_results(api_key, stock, gap_start.isoformat(), gap_end.isoformat())
+        for gap_start, gap_end in gaps
+    ], return_exceptions=True)
+    for (gap_start, gap_end), results in zip(gaps, searches):
+        if isinstance(results, Exception):
+            # Leave the range uncovered so the next request retries it.
+            print(f"SerpAPI error: {results}")
+            continue
+        await run_orm(record_search, ticker, gap_start, gap_end, results)
+
+    return format_news_results(await run_orm(stored_results, ticker, start_date, end_date))
+
+# Returned in place of an analysis when the Claude call fails.
+CLAUDE_FALLBACK_RESPONSE = '{"explanations": [], "reasons": [], "references": [], "text_summary": "Analysis temporarily unavailable"}'
+
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+
+def claude_request_params(stock, start, end, explanations, references):
+    """Message parameters for the Claude analysis, shared by the blocking and streaming calls."""
     system_prompt = """You are a world-class financial analyst. Analyze stock performance explanations and provide enhanced insights.
     
     Return valid JSON format:
@@ -188,29 +219,38 @@ PROVIDED REFERENCES: {references}
 
 Enhance these explanations with specific financial insights, company events, and market factors."""
 
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": 2000,
+        "temperature": 0.1,
+        "system": system_prompt,
+        "messages": [{"role": "user", "content": user_prompt}],
+    }
+
+async def api_enhancement_request_claude(api_key, stock, start, end, explanations, references):
+    """
+    Clean Claude Sonnet 4 financial analysis.
+    """
+    client = anthropic_client(api_key)
     try:
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2000,
-            temperature=0.1,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_prompt}]
+        response = await client.messages.create(
+            **claude_request_params(stock, start, end, explanations, references)
         )
         return response.content[0].text
     except Exception as e:
         print(f"Claude API error: {e}")
-        return '{"explanations": [], "reasons": [], "references": [], "text_summary": "Analysis temporarily unavailable"}'
+        return CLAUDE_FALLBACK_RESPONSE
 
-def generate_data_claude_serpapi_stateless(serpapi_key, claude_key, stock, start, end):
+async def generate_data_claude_serpapi_stateless(serpapi_key, claude_key, stock, start, end):
     """
-    Stateless news analysis using SerpAPI + Claude.
-    No database storage - pure in-memory processing.
+    News analysis using SerpAPI + Claude. The analysis itself is not stored;
+    the articles come from the local store, topped up from SerpAPI (see news_search).
     """
-    # Step 1: Get news from SerpAPI
-    news_data = serpapi_news_search(serpapi_key, stock, start, end)
+    # Step 1: Get news from the local store / SerpAPI
+    news_data = await news_search(serpapi_key, stock, start, end)
     
     # Step 2: Enhance with Claude
-    enhanced_analysis = api_enhancement_request_claude(
+    enhanced_analysis = await api_enhancement_request_claude(
         claude_key, stock, start, end,
         news_data['content'], 
         news_data['citations']
@@ -218,6 +258,47 @@ def generate_data_claude_serpapi_stateless(serpapi_key, claude_key, stock, start
     
     return enhanced_analysis
 
+async def stream_data_claude_serpapi(serpapi_key, claude_key, stock, start, end):
+    """
+    Streaming variant of generate_data_claude_serpapi_stateless.
+
+    Yields (event, data) pairs as soon as each piece is available:
+      ("search", {"citations": [...], "content": [...]})  the news_search results
+      ("token", "...")                                      each chunk of Claude's text
+      ("result", "...")                                     the complete analysis text
+    """
+    news_data = await news_search(serpapi_key, stock, start, end)
+    yield "search", news_data
+
+    client = anthropic_client(claude_key)
+    chunks = []
+    try:
+        async with client.messages.stream(
+            **claude_request_params(stock, start, end, news_data['content'], news_data['citations'])
+        ) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                yield "token", text
+    except Exception as e:
+        print(f"Claude API error: {e}")
+        yield "result", CLAUDE_FALLBACK_RESPONSE
+        return
+    yield "result", "".join(chunks)
+
+def parse_analysis(text):
+    """
+    Parse the JSON analysis out of an LLM reply, tolerating a ```json fence around it.
+    Returns None when the reply is not valid JSON.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
 def validate_news_item(data):
     required_fields = ['title', 'url']
     for field in required_fields:
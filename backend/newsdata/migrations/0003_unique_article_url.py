@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-17 00:11
+
+from django.db import migrations, models
+
+
+def drop_duplicate_urls(apps, schema_editor):
+    """Keep only the newest row per URL so the unique constraint can be added."""
+    NewsData = apps.get_model('newsdata', 'NewsData')
+    newest = (NewsData.objects.exclude(url=None).values('url')
+              .annotate(keep=models.Max('id')).values_list('keep', flat=True))
+    NewsData.objects.exclude(url=None).exclude(id__in=list(newest)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsdata', '0002_alter_newsdata_banner_image_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_urls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='newsdata',
+            name='url',
+            field=models.URLField(max_length=2048, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-17 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsdata', '0003_unique_article_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=32)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('fetched_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='newsdata',
+            name='ticker',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='newsdata',
+            name='url',
+            field=models.URLField(max_length=2048, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='newsdata',
+            index=models.Index(fields=['ticker', 'time_published'], name='news_ticker_time'),
+        ),
+        migrations.AddIndex(
+            model_name='newsdata',
+            index=models.Index(fields=['source'], name='news_source'),
+        ),
+        migrations.AddConstraint(
+            model_name='newsdata',
+            constraint=models.UniqueConstraint(fields=('ticker', 'url'), name='unique_ticker_article'),
+        ),
+        migrations.AddIndex(
+            model_name='newscoverage',
+            index=models.Index(fields=['ticker', 'start'], name='news_coverage_ticker_start'),
+        ),
+    ]
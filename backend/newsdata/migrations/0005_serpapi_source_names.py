@@ -0,0 +1,27 @@
+import ast
+
+from django.db import migrations
+
+
+def source_names(apps, schema_editor):
+    """Replace SerpAPI sources stored as str(dict) with the publisher name."""
+    NewsData = apps.get_model('newsdata', 'NewsData')
+    for article in NewsData.objects.filter(source__startswith="{'").only('id', 'source'):
+        try:
+            source = ast.literal_eval(article.source)
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(source, dict):
+            article.source = source.get('name') or ''
+            article.save(update_fields=['source'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsdata', '0004_ticker_article_store'),
+    ]
+
+    operations = [
+        migrations.RunPython(source_names, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,43 @@
 from django.db import models
 
 class NewsData(models.Model):
+    ticker = models.CharField(max_length=32, default="")  # "" for articles not fetched for a ticker
     title = models.CharField(null=True, max_length=2048)
-    url = models.URLField(null=True)
+    # Articles are upserted on (ticker, url) (see utils.upsert_news).
+    url = models.URLField(null=True, max_length=2048)
     time_published = models.DateTimeField(null=True)
     summary = models.TextField(null=True)
     banner_image = models.URLField(null=True)
     source = models.CharField(null=True, max_length=2048)
     overall_sentiment_score = models.FloatField(null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ticker", "url"], name="unique_ticker_article"),
+        ]
+        indexes = [
+            models.Index(fields=["ticker", "time_published"], name="news_ticker_time"),
+            models.Index(fields=["source"], name="news_source"),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class NewsCoverage(models.Model):
+    """
+    A date range (inclusive) for which a ticker's articles have been searched and
+    stored, so later queries inside it can be answered from NewsData alone.
+    """
+    ticker = models.CharField(max_length=32)
+    start = models.DateField()
+    end = models.DateField()
+    fetched_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["ticker", "start"], name="news_coverage_ticker_start"),
+        ]
+
+    def __str__(self):
+        return f"{self.ticker} {self.start} - {self.end}"
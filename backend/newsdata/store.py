@@ -0,0 +1,140 @@
+# newsdata/store.py
+"""
+Query API over the ticker-tagged NewsData store.
+
+NewsCoverage records which date ranges have already been searched for a ticker, so
+the explanation pipeline (message.news_search) only goes to SerpAPI for the parts
+of a request that are not covered yet. All functions here are synchronous ORM code;
+call them through stockcompass.db.run_orm from async code.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NewsData, NewsCoverage
+from .utils import upsert_news
+
+# Date formats SerpAPI uses for Google News results, newest first.
+SERPAPI_DATE_FORMATS = ("%m/%d/%Y, %I:%M %p, %z UTC", "%m/%d/%Y", "%b %d, %Y", "%d %b %Y")
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def check_range(start, end):
+    """
+    Parse ``start`` and ``end`` (dates or "YYYY-MM-DD" strings) as an inclusive range.
+
+    Raises:
+        ValueError: A date does not parse, or ``start`` is after ``end``.
+    """
+    start, end = _as_date(start), _as_date(end)
+    if start > end:
+        raise ValueError(f"start ({start}) is after end ({end})")
+    return start, end
+
+
+def source_name(source):
+    """The publisher name of a news result's "source" (SerpAPI sends {"name": ..., "icon": ...})."""
+    if isinstance(source, dict):
+        return source.get("name") or ""
+    return source or ""
+
+
+def _day_start(day):
+    return datetime.combine(day, time(), tzinfo=dt_timezone.utc)
+
+
+def articles_between(ticker, start, end):
+    """
+    Stored articles for ``ticker`` published between ``start`` and ``end`` (dates or
+    "YYYY-MM-DD" strings, both inclusive), oldest first. Served by the
+    (ticker, time_published) index.
+    """
+    return NewsData.objects.filter(
+        ticker=ticker.upper(),
+        time_published__gte=_day_start(_as_date(start)),
+        time_published__lt=_day_start(_as_date(end) + timedelta(days=1)),
+    ).order_by("time_published")
+
+
+def uncovered_ranges(ticker, start, end):
+    """
+    The parts of [start, end] (inclusive dates) not yet searched for ``ticker``.
+
+    Returns:
+        List of (date, date) tuples in ascending order; empty when fully covered.
+
+    Raises:
+        ValueError: See check_range.
+    """
+    start, end = check_range(start, end)
+    covered = NewsCoverage.objects.filter(
+        ticker=ticker.upper(), start__lte=end, end__gte=start,
+    ).order_by("start").values_list("start", "end")
+
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start - timedelta(days=1)))
+        cursor = max(cursor, covered_end + timedelta(days=1))
+        if cursor > end:
+            return gaps
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _published_at(text, fallback):
+    for fmt in SERPAPI_DATE_FORMATS:
+        try:
+            published = datetime.strptime(text, fmt)
+        except (TypeError, ValueError):
+            continue
+        return published if published.tzinfo else published.replace(tzinfo=dt_timezone.utc)
+    return fallback
+
+
+def record_search(ticker, start, end, results):
+    """
+    Store SerpAPI news results for ``ticker`` searched over [start, end] and mark the
+    range as covered.
+
+    Results whose date cannot be parsed (e.g. "3 days ago") are filed at ``start``,
+    which keeps them inside the searched range. Days from today onward are not marked
+    as covered, since more news can still appear for them.
+    """
+    ticker = ticker.upper()
+    start, end = _as_date(start), _as_date(end)
+    rows = [{
+        "ticker": ticker,
+        "title": result.get("title"),
+        "url": result.get("link"),
+        "time_published": _published_at(result.get("date"), _day_start(start)),
+        "summary": result.get("snippet"),
+        "source": source_name(result.get("source")),
+    } for result in results]
+
+    covered_end = min(end, timezone.now().date() - timedelta(days=1))
+    with transaction.atomic():
+        upsert_news(rows)
+        if covered_end >= start:
+            NewsCoverage.objects.create(ticker=ticker, start=start, end=covered_end)
+
+
+def stored_results(ticker, start, end, limit=20):
+    """
+    Up to ``limit`` stored articles for ``ticker`` in [start, end], most recent
+    first, shaped like SerpAPI news results (see message.format_news_results).
+    """
+    articles = articles_between(ticker, start, end).order_by("-time_published")[:limit]
+    return [{
+        "title": article.title,
+        "snippet": article.summary,
+        "link": article.url,
+        "source": article.source,
+        "date": article.time_published.date().isoformat(),
+    } for article in articles]
@@ -0,0 +1,539 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import httpx
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from . import cache as news_cache
+from . import market_direction
+from . import upstream
+from .message import api_enhancement_request_claude, serpapi_news_search
+from .message import news_search
+from .models import NewsData
+from .store import articles_between, uncovered_ranges
+from .utils import get_news_data, iter_feed_items
+from stockdata.utils import load_price_data
+
+
+class ExplanationCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["news"].clear()
+
+    def test_concurrent_misses_share_one_call(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "explained"
+
+        async def request_many():
+            return await asyncio.gather(*[
+                news_cache.cached_explanation("claude+serpapi", "aapl", "2025-01-01", "2025-01-10", compute)
+                for _ in range(5)
+            ])
+
+        self.assertEqual(async_to_sync(request_many)(), ["explained"] * 5)
+        self.assertEqual(len(calls), 1)
+
+        hits = news_cache.stats["hits"]
+        result = async_to_sync(news_cache.cached_explanation)("claude+serpapi", "AAPL", "2025-01-01", "2025-01-10", compute)
+        self.assertEqual(result, "explained")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(news_cache.stats["hits"], hits + 1)
+
+    def test_uncacheable_results_are_not_stored(self):
+        async def compute():
+            return "fallback"
+
+        for _ in range(2):
+            async_to_sync(news_cache.cached_explanation)(
+                "claude+serpapi", "AAPL", "2025-02-01", "2025-02-05", compute,
+                cacheable=lambda result: result != "fallback",
+            )
+        key = news_cache.explanation_key("claude+serpapi", "AAPL", "2025-02-01", "2025-02-05")
+        self.assertIsNone(caches["news"].get(key))
+
+    @override_settings(API_CLAUDE="claude-key", SERPAPI_KEY="serp-key", NEWS_MARKET_FILTER=False)
+    def test_news_api_serves_repeat_requests_from_cache(self):
+        with mock.patch("newsdata.views.generate_data_claude_serpapi_stateless", new_callable=mock.AsyncMock, return_value='{"explanations": []}') as generate:
+            for _ in range(2):
+                response = self.client.get("/api/news/", {"stockname": "MSFT", "start": "2025-03-01", "end": "2025-03-04"})
+                self.assertEqual(response.json()["complex"], '{"explanations": []}')
+        self.assertEqual(generate.call_count, 1)
+        stats = self.client.get("/api/news/cache_stats/").json()["cache"]
+        self.assertGreaterEqual(stats["hits"], 1)
+
+
+@override_settings(NEWS_UPSTREAM_URLS={"serpapi": "http://stub.local/search", "anthropic": "http://stub.local"})
+class UpstreamClientTests(SimpleTestCase):
+    """Runs the upstream calls against an in-process stub server."""
+
+    def setUp(self):
+        self.seen = []
+        upstream.configure_transport(httpx.MockTransport(self.stub))
+        self.addCleanup(upstream.configure_transport, None)
+
+    def stub(self, request):
+        self.seen.append(request)
+        if request.url.path == "/search":
+            return httpx.Response(200, json={"news_results": [
+                {"title": "Apple beats", "snippet": "Record quarter", "link": "https://news/1", "source": "Wire", "date": "1/30"},
+            ]})
+        if request.url.path == "/v1/messages":
+            return httpx.Response(200, json={
+                "id": "msg_1", "type": "message", "role": "assistant", "model": "claude",
+                "content": [{"type": "text", "text": '{"explanations": ["beat"]}'}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": 1, "output_tokens": 1},
+            })
+        return httpx.Response(404)
+
+    def test_serpapi_search_goes_through_shared_client(self):
+        async def search_twice():
+            first = await serpapi_news_search("serp-key", "AAPL", "2025-01-01", "2025-01-31")
+            client = upstream.get_client()
+            await serpapi_news_search("serp-key", "AAPL", "2025-01-01", "2025-01-31")
+            return first, client is upstream.get_client()
+
+        result, reused = async_to_sync(search_twice)()
+        self.assertEqual(result["citations"], ["https://news/1"])
+        self.assertEqual(result["content"], ["Apple beats: Record quarter (Source: Wire, Date: 1/30)"])
+        self.assertTrue(reused)
+        self.assertEqual(len(self.seen), 2)
+        self.assertEqual(self.seen[0].url.params["tbs"], "cdr:1,cd_min:01/01/2025,cd_max:01/31/2025")
+
+    def test_anthropic_client_is_reused_per_key(self):
+        async def analyse():
+            text = await api_enhancement_request_claude("claude-key", "AAPL", "2025-01-01", "2025-01-31", [], [])
+            return text, upstream.anthropic_client("claude-key") is upstream.anthropic_client("claude-key")
+
+        text, reused = async_to_sync(analyse)()
+        self.assertEqual(json.loads(text), {"explanations": ["beat"]})
+        self.assertTrue(reused)
+        self.assertEqual(self.seen[0].headers["x-api-key"], "claude-key")
+
+    @override_settings(NEWS_HTTP_MAX_CONNECTIONS_PER_HOST=1)
+    def test_host_limit_covers_sdk_calls(self):
+        in_flight, peak = set(), []
+
+        async def slow_stub(request):
+            in_flight.add(id(request))
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.discard(id(request))
+            return self.stub(request)
+
+        upstream.configure_transport(httpx.MockTransport(slow_stub))
+
+        async def analyse():
+            client = upstream.anthropic_client("claude-key")
+            await asyncio.gather(*[client.messages.create(
+                model="claude", max_tokens=1, messages=[{"role": "user", "content": "hi"}]) for _ in range(3)])
+
+        async_to_sync(analyse)()
+        self.assertEqual(peak, [1, 1, 1])
+
+    def test_lifespan_shutdown_closes_the_pool(self):
+        from stockcompass.asgi import application
+
+        async def serve():
+            client = upstream.get_client()
+            messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+            sent = []
+
+            async def receive():
+                return next(messages)
+
+            async def send(message):
+                sent.append(message["type"])
+
+            with override_settings(PREFETCH_IN_PROCESS=False):
+                await application({"type": "lifespan"}, receive, send)
+            return client.is_closed, sent, client is upstream.get_client()
+
+        closed, sent, reused = async_to_sync(serve)()
+        self.assertTrue(closed)
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertFalse(reused)
+
+
+def claude_stream_body(chunks):
+    """An Anthropic Messages streaming response emitting ``chunks`` as text deltas."""
+    events = [("message_start", {"type": "message_start", "message": {
+        "id": "msg_1", "type": "message", "role": "assistant", "model": "claude", "content": [],
+        "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 1, "output_tokens": 0}}}),
+        ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})]
+    events += [("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}})
+               for chunk in chunks]
+    events += [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+               ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                  "usage": {"output_tokens": len(chunks)}}),
+               ("message_stop", {"type": "message_stop"})]
+    return "".join(f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events).encode()
+
+
+def parse_sse(body):
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@override_settings(API_CLAUDE="claude-key", SERPAPI_KEY="serp-key", NEWS_MARKET_FILTER=False,
+                   NEWS_UPSTREAM_URLS={"serpapi": "http://stub.local/search", "anthropic": "http://stub.local"})
+class NewsStreamTests(TransactionTestCase):
+    chunks = ['```json\n{"explanations": ["Earnings beat"], ', '"reasons": [], "references": [], ', '"text_summary": "Up"}\n```']
+
+    def setUp(self):
+        caches["news"].clear()
+        self.calls = 0
+        upstream.configure_transport(httpx.MockTransport(self.stub))
+        self.addCleanup(upstream.configure_transport, None)
+
+    def stub(self, request):
+        self.calls += 1
+        if request.url.path == "/search":
+            return httpx.Response(200, json={"news_results": [
+                {"title": "Earnings", "snippet": "Beat", "link": "https://news/2", "source": "Wire", "date": "3/2"},
+            ]})
+        return httpx.Response(200, content=claude_stream_body(self.chunks),
+                              headers={"content-type": "text/event-stream"})
+
+    def read_events(self):
+        response = self.client.get("/api/news/", {"stockname": "MSFT", "start": "2025-03-01", "end": "2025-03-04", "stream": "1"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        async def read():
+            return b"".join([chunk.encode() if isinstance(chunk, str) else chunk
+                             async for chunk in response.streaming_content])
+        return parse_sse(async_to_sync(read)())
+
+    def test_search_then_tokens_then_result(self):
+        events = self.read_events()
+        self.assertEqual([name for name, _ in events], ["search"] + ["token"] * 3 + ["result"])
+        self.assertEqual(events[0][1]["citations"], ["https://news/2"])
+        self.assertEqual("".join(data["text"] for name, data in events if name == "token"), "".join(self.chunks))
+        result = events[-1][1]
+        self.assertEqual(result["complex"], "".join(self.chunks))
+        self.assertEqual(result["analysis"]["explanations"], ["Earnings beat"])
+
+        # The streamed explanation is cached, so the next request is a single event.
+        calls = self.calls
+        self.assertEqual([name for name, _ in self.read_events()], ["result"])
+        self.assertEqual(self.calls, calls)
+
+    def test_concurrent_streams_share_one_explanation(self):
+        params = {"stockname": "MSFT", "start": "2025-03-01", "end": "2025-03-04", "stream": "1"}
+
+        async def read(response):
+            return parse_sse(b"".join([chunk.encode() if isinstance(chunk, str) else chunk
+                                       async for chunk in response.streaming_content]))
+
+        async def run():
+            responses = await asyncio.gather(*[self.async_client.get("/api/news/", params) for _ in range(3)])
+            return await asyncio.gather(*[read(response) for response in responses])
+
+        streams = async_to_sync(run)()
+        self.assertEqual(self.calls, 2)  # One search, one Claude call
+        self.assertEqual(sorted(len(events) for events in streams), [1, 1, 5])
+        self.assertTrue(all(events[-1][1]["complex"] == "".join(self.chunks) for events in streams))
+
+
+def alpha_vantage_body(articles):
+    feed = [{"title": title, "url": f"https://news/{n}", "time_published": "20250208T162713",
+             "summary": "s", "banner_image": None, "source": "Wire", "overall_sentiment_score": 0.1 * n}
+            for n, title in articles]
+    return json.dumps({"items": str(len(feed)), "sentiment_score_definition": "x <= -0.35: Bearish", "feed": feed}, indent=1)
+
+
+class NewsIngestTests(TransactionTestCase):
+    def setUp(self):
+        self.body = alpha_vantage_body([(1, "One"), (2, "Two"), (3, "Three")])
+        upstream.configure_transport(httpx.MockTransport(lambda request: httpx.Response(200, text=self.body)))
+        self.addCleanup(upstream.configure_transport, None)
+
+    def test_feed_parser_handles_any_chunking(self):
+        async def parse(size):
+            async def chunks():
+                for i in range(0, len(self.body), size):
+                    yield self.body[i:i + size]
+            return [item async for item in iter_feed_items(chunks())]
+
+        expected = json.loads(self.body)["feed"]
+        for size in (1, 7, 64, len(self.body)):
+            self.assertEqual(async_to_sync(parse)(size), expected)
+
+        async def truncated():
+            async def chunks():
+                yield self.body[:-40]
+            return [item async for item in iter_feed_items(chunks())]
+        with self.assertRaises(ValueError):
+            async_to_sync(truncated)()
+
+    @override_settings(NEWS_INGEST_BATCH_SIZE=2)
+    def test_ingest_upserts_on_url(self):
+        articles = async_to_sync(get_news_data)(tickers="AAPL", apikey="av-key")
+        self.assertEqual([a["title"] for a in articles], ["One", "Two", "Three"])
+        self.assertEqual(articles[0]["time_published"], "20250208T162713")
+        self.assertEqual(NewsData.objects.count(), 3)
+
+        self.body = alpha_vantage_body([(2, "Two (updated)"), (4, "Four")])
+        async_to_sync(get_news_data)(tickers="AAPL", apikey="av-key")
+        self.assertEqual(NewsData.objects.count(), 4)
+        self.assertEqual(NewsData.objects.get(url="https://news/2").title, "Two (updated)")
+        self.assertEqual(NewsData.objects.get(url="https://news/1").title, "One")
+
+    def test_missing_feed_stores_nothing(self):
+        self.body = json.dumps({"Information": "API rate limit reached"})
+        self.assertEqual(async_to_sync(get_news_data)(apikey="av-key"), [])
+        self.assertEqual(NewsData.objects.count(), 0)
+
+
+@override_settings(NEWS_UPSTREAM_URLS={"serpapi": "http://stub.local/search"})
+class NewsStoreTests(TransactionTestCase):
+    def setUp(self):
+        self.searches = []
+        upstream.configure_transport(httpx.MockTransport(self.stub))
+        self.addCleanup(upstream.configure_transport, None)
+
+    def stub(self, request):
+        self.searches.append(request.url.params["tbs"])
+        day = request.url.params["tbs"].split("cd_min:")[1].split(",")[0]
+        return httpx.Response(200, json={"news_results": [
+            {"title": f"News {day}", "snippet": "Moved", "link": f"https://news/{day}", "source": "Wire", "date": day},
+        ]})
+
+    def test_only_uncovered_days_go_to_serpapi(self):
+        first = async_to_sync(news_search)("serp-key", "aapl", "2025-01-06", "2025-01-10")
+        self.assertEqual(self.searches, ["cdr:1,cd_min:01/06/2025,cd_max:01/10/2025"])
+        self.assertEqual(first["citations"], ["https://news/01/06/2025"])
+
+        # Same range: answered locally.
+        self.assertEqual(async_to_sync(news_search)("serp-key", "AAPL", "2025-01-06", "2025-01-10"), first)
+        self.assertEqual(len(self.searches), 1)
+
+        # Wider range: only the uncovered edges are searched.
+        wider = async_to_sync(news_search)("serp-key", "AAPL", "2025-01-01", "2025-01-15")
+        self.assertEqual(sorted(self.searches[1:]), [
+            "cdr:1,cd_min:01/01/2025,cd_max:01/05/2025",
+            "cdr:1,cd_min:01/11/2025,cd_max:01/15/2025",
+        ])
+        self.assertEqual(len(wider["citations"]), 3)
+        self.assertEqual(uncovered_ranges("AAPL", "2025-01-01", "2025-01-15"), [])
+        self.assertEqual(articles_between("aapl", "2025-01-06", "2025-01-06").count(), 1)
+        self.assertEqual(articles_between("MSFT", "2025-01-01", "2025-01-15").count(), 0)
+
+    def test_serpapi_source_is_stored_by_name(self):
+        upstream.configure_transport(httpx.MockTransport(lambda request: httpx.Response(200, json={"news_results": [
+            {"title": "Apple beats", "snippet": "Record quarter", "link": "https://news/1",
+             "source": {"name": "Reuters", "icon": "https://icon"}, "date": "01/30/2025"},
+        ]})))
+        result = async_to_sync(news_search)("serp-key", "AAPL", "2025-01-27", "2025-01-31")
+        self.assertEqual(NewsData.objects.get().source, "Reuters")
+        self.assertEqual(result["content"], ["Apple beats: Record quarter (Source: Reuters, Date: 2025-01-30)"])
+
+    def test_reversed_range_is_rejected(self):
+        with self.assertRaises(ValueError):
+            uncovered_ranges("AAPL", "2025-01-10", "2025-01-06")
+        response = self.client.get("/api/news/", {"stockname": "AAPL", "start": "2025-01-10", "end": "2025-01-06"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status_code"], 400)
+        self.assertEqual(self.searches, [])
+
+    def test_failed_search_leaves_range_uncovered(self):
+        upstream.configure_transport(httpx.MockTransport(lambda request: httpx.Response(500)))
+        result = async_to_sync(news_search)("serp-key", "AAPL", "2025-02-03", "2025-02-07")
+        self.assertEqual(result, {"citations": [], "content": []})
+        self.assertEqual(len(uncovered_ranges("AAPL", "2025-02-03", "2025-02-07")), 1)
+
+
+class FakeIndexTicker:
+    """Stands in for yf.Ticker("^GSPC"), serving a fixed daily history."""
+
+    def __init__(self, history):
+        self.full_history = history
+        self.calls = []
+
+    def history(self, period=None, interval=None, start=None):
+        self.calls.append({"period": period, "start": start})
+        if start is not None:
+            return self.full_history[self.full_history.index >= pd.Timestamp(start, tz=self.full_history.index.tz)]
+        return self.full_history
+
+
+def index_history(periods, seed=0):
+    index = pd.date_range("2024-01-01", periods=periods, freq="D", tz="America/New_York", name="Date")
+    close = 4000 + np.cumsum(np.random.default_rng(seed).normal(0, 10, periods))
+    return pd.DataFrame({"Open": close - 1, "High": close + 5, "Low": close - 5, "Close": close,
+                         "Volume": np.full(periods, 1e9), "Dividends": 0.0, "Stock Splits": 0.0}, index=index)
+
+
+class MarketDataStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.history = index_history(60)
+        self.ticker = FakeIndexTicker(self.history.iloc[:50])
+        patcher = mock.patch("newsdata.market_direction.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self):
+        return async_to_sync(market_direction.fetch_and_store_market_data)(data_dir=self.data_dir)
+
+    def test_updates_append_and_rewrite_only_the_last_bar(self):
+        stored = self.fetch()
+        self.assertEqual(len(stored), 50)
+        self.assertEqual(self.ticker.calls[-1]["period"], "max")
+
+        # The last bar changes (still forming) and ten more arrive.
+        updated = self.history.copy()
+        updated.iloc[49, updated.columns.get_loc("Close")] += 7
+        self.ticker.full_history = updated
+        stored = self.fetch()
+        self.assertEqual(self.ticker.calls[-1]["start"], "2024-02-19")
+        self.assertEqual(len(stored), 60)
+
+        frame = market_direction.load_market_data(data_dir=self.data_dir)
+        pd.testing.assert_series_equal(frame["Close"], updated["Close"], check_freq=False)
+        self.assertTrue(frame.index.equals(updated.index))
+        pd.testing.assert_series_equal(frame["daily_return"], updated["Close"].pct_change() * 100,
+                                       check_names=False, check_freq=False)
+
+    def test_loader_is_cached_until_the_store_changes(self):
+        self.fetch()
+        first = market_direction.load_market_series(data_dir=self.data_dir)
+        self.assertIs(market_direction.load_market_series(data_dir=self.data_dir), first)
+        self.assertIsInstance(first.columns["Close"], np.memmap)
+
+        last_close = first.columns["Close"][-1]
+        updated = self.history.copy()
+        updated.iloc[49, updated.columns.get_loc("Close")] += 7
+        self.ticker.full_history = updated
+        self.fetch()
+        self.assertEqual(len(market_direction.load_market_series(data_dir=self.data_dir)), 60)
+        # A reader of the old version is not affected by the rewritten last bar.
+        self.assertEqual(len(first), 50)
+        self.assertEqual(first.columns["Close"][-1], last_close)
+        self.assertEqual(len(os.listdir(self.data_dir + "/_GSPC_1d")), len(market_direction.MARKET_COLUMNS) + 3)
+
+    def test_missing_store(self):
+        with self.assertRaises(FileNotFoundError):
+            market_direction.load_market_data(data_dir=self.data_dir)
+
+
+class RangesVsMarketTests(SimpleTestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.market_history = index_history(120)
+        with mock.patch("newsdata.market_direction.yf.Ticker", return_value=FakeIndexTicker(self.market_history)):
+            self.market = async_to_sync(market_direction.fetch_and_store_market_data)(data_dir=self.data_dir)
+
+    def test_matches_single_range_analysis(self):
+        rng = np.random.default_rng(3)
+        stock = self.market_history[["Close"]].copy()
+        stock["Close"] = 150 + np.cumsum(rng.normal(0, 2, len(stock)))
+        dates = stock.index.strftime("%Y-%m-%d")
+        picks = np.sort(rng.choice(len(dates), size=(20, 2)), axis=1)
+        ranges = [(dates[a], dates[b]) for a, b in picks if a != b]
+
+        result = market_direction.analyze_ranges_vs_market(list(dates), stock["Close"].to_numpy(), ranges, self.market)
+        market_frame = market_direction.load_market_data(data_dir=self.data_dir)
+        for i, (start, end) in enumerate(ranges):
+            expected = market_direction.analyze_stock_vs_market_direction(stock, market_frame, start, end)
+            self.assertEqual(bool(result["same_direction"][i]), bool(expected))
+            period = stock.loc[start:end, "Close"]
+            self.assertAlmostEqual(result["stock_return"][i], period.iloc[-1] / period.iloc[0] - 1)
+
+    def test_ranges_outside_the_data(self):
+        result = market_direction.analyze_ranges_vs_market(
+            ["2024-01-02", "2024-01-03"], [10.0, 11.0], [("2023-01-01", "2023-01-05")], self.market)
+        self.assertTrue(np.isnan(result["stock_return"][0]))
+        self.assertFalse(result["market_driven"][0])
+
+
+@override_settings(API_CLAUDE="claude-key", SERPAPI_KEY="serp-key")
+class MarketFilterTests(TransactionTestCase):
+    def setUp(self):
+        caches["news"].clear()
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        market = index_history(200)
+        # MSFT follows the index; TSLA has a jump of its own on day 100.
+        own_moves = np.zeros(len(market))
+        own_moves[100] = 0.2
+        tsla = market.copy()
+        tsla["Close"] = market["Close"] * np.cumprod(1 + own_moves)
+        tickers = {"^GSPC": FakeIndexTicker(market), "MSFT": FakeIndexTicker(market), "TSLA": FakeIndexTicker(tsla)}
+        for ticker in tickers.values():
+            ticker.info = {"sharesOutstanding": 1_000}
+        patcher = mock.patch("yfinance.Ticker", side_effect=lambda symbol: tickers[symbol])
+        self.yahoo = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dates = market.index.strftime("%Y-%m-%d")
+
+    def warm_store(self, *stocks):
+        with override_settings(MARKET_DATA_DIR=self.data_dir):
+            async_to_sync(market_direction.fetch_and_store_market_data)()
+        for stock in stocks:
+            async_to_sync(load_price_data)(stock, "max", "1d")
+        self.yahoo.reset_mock()
+
+    def get(self, stock, start, end, **params):
+        with override_settings(MARKET_DATA_DIR=self.data_dir):
+            return self.client.get("/api/news/", {"stockname": stock, "start": start, "end": end, **params})
+
+    def test_market_driven_range_skips_the_llm(self):
+        self.warm_store("MSFT", "TSLA")
+        with mock.patch("newsdata.views.generate_data_claude_serpapi_stateless", new_callable=mock.AsyncMock,
+                        return_value='{"explanations": ["news"]}') as generate:
+            body = self.get("MSFT", self.dates[20], self.dates[40]).json()
+            self.assertTrue(body["market_driven"])
+            self.assertEqual(json.loads(body["complex"])["reasons"], ["Broad market movement"])
+            self.assertEqual(generate.call_count, 0)
+
+            body = self.get("TSLA", self.dates[99], self.dates[101]).json()
+            self.assertNotIn("market_driven", body)
+            self.assertEqual(generate.call_count, 1)
+
+            self.get("MSFT", self.dates[20], self.dates[40], market_filter="0")
+            self.assertEqual(generate.call_count, 2)
+
+    def test_cold_store_skips_the_filter_without_loading(self):
+        with mock.patch("newsdata.views.generate_data_claude_serpapi_stateless", new_callable=mock.AsyncMock,
+                        return_value='{"explanations": ["news"]}') as generate:
+            body = self.get("MSFT", self.dates[20], self.dates[40]).json()
+        self.assertNotIn("market_driven", body)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(self.yahoo.call_count, 0)
+
+    def test_cached_explanation_is_served_before_the_filter(self):
+        self.warm_store("MSFT")
+        async_to_sync(news_cache.store_explanation)("claude+serpapi", "MSFT", self.dates[20], self.dates[40], "cached")
+        with mock.patch("newsdata.views.market_driven_explanation", new_callable=mock.AsyncMock) as market_filter:
+            body = self.get("MSFT", self.dates[20], self.dates[40]).json()
+        self.assertEqual(body["complex"], "cached")
+        self.assertEqual(market_filter.call_count, 0)
+
+    def test_stream_of_market_driven_range_is_one_event(self):
+        self.warm_store("MSFT")
+        response = self.get("MSFT", self.dates[20], self.dates[40], stream="1")
+
+        async def read():
+            return b"".join([chunk.encode() if isinstance(chunk, str) else chunk
+                             async for chunk in response.streaming_content])
+        events = parse_sse(async_to_sync(read)())
+        self.assertEqual([name for name, _ in events], ["result"])
+        self.assertTrue(events[0][1]["market_driven"])
+        self.assertEqual(events[0][1]["analysis"]["reasons"], ["Broad market movement"])
@@ -0,0 +1,196 @@
+# newsdata/upstream.py
+"""
+Shared async HTTP layer for every upstream call in newsdata (SerpAPI, Perplexity,
+DeepSeek, Alpha Vantage, Anthropic, OpenAI).
+
+One pooled ``httpx.AsyncClient`` per event loop keeps connections alive between
+requests, so only the first call to a host pays the TCP+TLS handshake. The SDK
+clients are built once per API key on top of the same client, and the per-host
+limit sits in its transport, so SDK calls count against it too. ``aclose()``
+closes the pool at server shutdown (see stockcompass/asgi.py).
+
+Tunable through settings (defaults in brackets):
+    NEWS_HTTP_TIMEOUT [60]                  read/write timeout in seconds
+    NEWS_HTTP_CONNECT_TIMEOUT [5]           connect timeout in seconds
+    NEWS_HTTP_MAX_CONNECTIONS [100]         connections across all hosts
+    NEWS_HTTP_MAX_CONNECTIONS_PER_HOST [10] concurrent requests to one host
+    NEWS_HTTP_KEEPALIVE_EXPIRY [30]         seconds an idle connection is kept
+    NEWS_UPSTREAM_URLS                      per-service URL overrides, e.g. a local stub server
+"""
+import asyncio
+import contextlib
+import weakref
+
+import httpx
+from django.conf import settings
+
+DEFAULT_UPSTREAM_URLS = {
+    "serpapi": "https://serpapi.com/search",
+    "perplexity": "https://api.perplexity.ai/chat/completions",
+    "deepseek": "https://api.deepseek.com/v1/chat/completions",
+    "alphavantage": "https://www.alphavantage.co/query",
+    "anthropic": "https://api.anthropic.com",
+    "openai": "https://api.openai.com/v1",
+}
+
+# Per event loop: {"client": AsyncClient, "sdk": {key: client}}
+_state = weakref.WeakKeyDictionary()
+_transport = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def upstream_url(name):
+    """The URL for an upstream service, honouring NEWS_UPSTREAM_URLS overrides."""
+    return _setting("NEWS_UPSTREAM_URLS", {}).get(name, DEFAULT_UPSTREAM_URLS[name])
+
+
+def configure_transport(transport):
+    """
+    Route all clients created from now on through ``transport`` (e.g. an
+    ``httpx.MockTransport`` in tests); ``None`` restores the network.
+    """
+    global _transport
+    _transport = transport
+    _state.clear()
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """A response body that gives its host slot back once it is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a transport so that at most ``per_host`` requests to one host are in
+    flight; a slot is held until the response body is closed (or, for a body
+    already in memory, until the response arrives).
+    """
+
+    def __init__(self, transport, per_host):
+        self._transport = transport
+        self._per_host = per_host
+        self._hosts = {}
+
+    def _limit(self, host):
+        limit = self._hosts.get(host)
+        if limit is None:
+            limit = self._hosts[host] = asyncio.Semaphore(self._per_host)
+        return limit
+
+    async def handle_async_request(self, request):
+        limit = self._limit(request.url.netloc)
+        await limit.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            limit.release()
+            raise
+        if isinstance(response.stream, httpx.ByteStream):
+            limit.release()
+        else:
+            response.stream = _ReleasingStream(response.stream, limit.release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _loop_state():
+    loop = asyncio.get_running_loop()
+    state = _state.get(loop)
+    if state is None:
+        timeout = _setting("NEWS_HTTP_TIMEOUT", 60)
+        transport = _transport or httpx.AsyncHTTPTransport(limits=httpx.Limits(
+            max_connections=_setting("NEWS_HTTP_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_setting("NEWS_HTTP_MAX_CONNECTIONS", 100),
+            keepalive_expiry=_setting("NEWS_HTTP_KEEPALIVE_EXPIRY", 30),
+        ))
+        state = {
+            "client": httpx.AsyncClient(
+                timeout=httpx.Timeout(timeout, connect=_setting("NEWS_HTTP_CONNECT_TIMEOUT", 5)),
+                transport=HostLimitedTransport(transport, _setting("NEWS_HTTP_MAX_CONNECTIONS_PER_HOST", 10)),
+            ),
+            "sdk": {},
+        }
+        _state[loop] = state
+    return state
+
+
+def get_client():
+    """The pooled ``httpx.AsyncClient`` for the running event loop."""
+    return _loop_state()["client"]
+
+
+async def aclose():
+    """Close the running event loop's pooled client (and with it the SDK clients built on it)."""
+    state = _state.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state["client"].aclose()
+
+
+async def request(method, url, **kwargs):
+    """
+    Send a request through the shared pool, with at most
+    NEWS_HTTP_MAX_CONNECTIONS_PER_HOST requests in flight per host.
+    """
+    return await get_client().request(method, url, **kwargs)
+
+
+@contextlib.asynccontextmanager
+async def stream(method, url, **kwargs):
+    """
+    Like ``request`` but yields the response before its body is read, for
+    consuming large payloads with ``response.aiter_text()``.
+    """
+    async with get_client().stream(method, url, **kwargs) as response:
+        yield response
+
+
+def anthropic_client(api_key):
+    """An ``AsyncAnthropic`` client for ``api_key`` sharing the connection pool."""
+    from anthropic import AsyncAnthropic
+
+    sdk = _loop_state()["sdk"]
+    key = ("anthropic", api_key)
+    if key not in sdk:
+        sdk[key] = AsyncAnthropic(
+            api_key=api_key,
+            base_url=upstream_url("anthropic"),
+            http_client=get_client(),
+            timeout=_setting("NEWS_HTTP_TIMEOUT", 60),
+        )
+    return sdk[key]
+
+
+def openai_client(api_key):
+    """An ``AsyncOpenAI`` client for ``api_key`` sharing the connection pool."""
+    from openai import AsyncOpenAI
+
+    sdk = _loop_state()["sdk"]
+    key = ("openai", api_key)
+    if key not in sdk:
+        sdk[key] = AsyncOpenAI(
+            api_key=api_key,
+            base_url=upstream_url("openai"),
+            http_client=get_client(),
+            timeout=_setting("NEWS_HTTP_TIMEOUT", 60),
+        )
+    return sdk[key]
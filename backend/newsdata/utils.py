@@ -1,9 +1,15 @@
 # newsdata/utils.py
-import asyncio
-import requests
+import json
+import re
 from datetime import datetime
+from django.conf import settings
 from django.db import connection
 from .models import NewsData
+from .upstream import stream, upstream_url
+from stockcompass.db import run_orm
+
+# Columns refreshed when an article already stored for the ticker is ingested again.
+NEWS_UPDATE_FIELDS = ["title", "time_published", "summary", "banner_image", "source", "overall_sentiment_score"]
 
 def reset_table(model):
     """
@@ -24,11 +30,84 @@ def reset_table(model):
         else:
             cursor.execute(f"DELETE FROM {table_name};")
 
+_json_decoder = json.JSONDecoder()
+_FEED_START = re.compile(r'"feed"\s*:\s*\[')
+
+async def iter_feed_items(chunks):
+    """
+    Incrementally parse an Alpha Vantage NEWS_SENTIMENT response body.
+
+    Parameters:
+        chunks: Async iterable of text chunks (e.g. ``response.aiter_text()``).
+    Yields:
+        dict: Each article of the top-level "feed" array as soon as it has been
+        received completely, so a large feed is never held as one parsed document.
+    Raises:
+        ValueError: The body has no "feed" array (e.g. a rate-limit notice) or ends
+        before the array is closed.
+    """
+    buffer = ""
+    pos = None
+    async for chunk in chunks:
+        buffer += chunk
+        if pos is None:
+            match = _FEED_START.search(buffer)
+            if match is None:
+                continue
+            pos = match.end()
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                item, pos = _json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The article is still arriving.
+                break
+            yield item
+        buffer, pos = buffer[pos:], 0
+    if pos is None:
+        raise ValueError(f"'feed' key not found in Alpha Vantage response: {buffer[:500]}")
+    raise ValueError("Alpha Vantage response ended inside the 'feed' array")
+
+def upsert_news(rows):
+    """
+    Synchronously store articles, inserting new (ticker, url) pairs and updating the
+    ones already stored, without ever emptying the table.
+
+    Rows are written with batched multi-row INSERT ... ON CONFLICT (ticker, url)
+    statements (NEWS_INGEST_BATCH_SIZE rows each) inside a single transaction.
+    Articles without a URL cannot be keyed and are skipped; for repeated keys the
+    last row wins.
+
+    Parameters:
+        rows (List[dict]): NewsData field values, one dict per article.
+    Returns:
+        int: The number of articles written.
+    """
+    by_key = {(row.get("ticker", ""), row["url"]): row for row in rows if row.get("url")}
+    articles = [NewsData(**row) for row in by_key.values()]
+    # bulk_create wraps all of its batches in one transaction.
+    NewsData.objects.bulk_create(
+        articles,
+        batch_size=settings.NEWS_INGEST_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["ticker", "url"],
+        update_fields=NEWS_UPDATE_FIELDS,
+    )
+    return len(articles)
+
 async def get_news_data(tickers=None, topics=None, time_from=None, time_to=None,
                         sort='LATEST', limit=50, apikey=None):
     """
     Asynchronously fetch news data from the Alpha Vantage NEWS_SENTIMENT API,
-    wipe the NewsData table, store the new records, and return the list of articles.
+    upsert the articles into the NewsData table, and return them.
+
+    Articles are stored once for every ticker in ``tickers`` (keyed on ticker and
+    URL), or untagged when no tickers are given.
     
     Parameters:
         tickers (str): Optional. A comma-separated list of tickers (e.g., "AAPL" or "COIN,CRYPTO:BTC,FOREX:USD").
@@ -45,12 +124,8 @@ async def get_news_data(tickers=None, topics=None, time_from=None, time_to=None,
     if not apikey:
         raise ValueError("API key is required.")
 
-    # Wipe the NewsData table asynchronously.
-    await asyncio.to_thread(reset_table, NewsData)
-    print("Existing news data wiped from the database.")
-
     # Build the API request.
-    base_url = "https://www.alphavantage.co/query"
+    base_url = upstream_url("alphavantage")
     params = {
         "function": "NEWS_SENTIMENT",
         "apikey": apikey,
@@ -66,57 +141,40 @@ async def get_news_data(tickers=None, topics=None, time_from=None, time_to=None,
     if time_to:
         params["time_to"] = time_to
 
-    # Make the API request asynchronously using asyncio.to_thread.
-    response = await asyncio.to_thread(requests.get, base_url, params=params)
-    if response.status_code != 200:
-        raise Exception(f"Error fetching news data: HTTP {response.status_code}")
-
-    data = response.json()
-    if "feed" not in data:
-        print("Warning: 'feed' key not found in Alpha Vantage response:", data)
-        return []
-
-    news_feed = data["feed"]
+    rows = []
     news_list = []
+    tags = [t.strip().upper() for t in tickers.split(",")] if tickers else [""]
+
+    # Stream the response through the shared connection pool and parse the feed as it arrives.
+    async with stream("GET", base_url, params=params) as response:
+        if response.status_code != 200:
+            raise Exception(f"Error fetching news data: HTTP {response.status_code}")
 
-    # Process each article in the feed.
-    for item in news_feed:
-        title = item.get("title")
-        url = item.get("url")
-        time_published_str = item.get("time_published")  # e.g., "20250208T162713"
-        summary = item.get("summary")
-        banner_image = item.get("banner_image")
-        source = item.get("source")
-        overall_sentiment_score = item.get("overall_sentiment_score")
-
-        # Convert the custom time format to a datetime object.
         try:
-            time_published = datetime.strptime(time_published_str, "%Y%m%dT%H%M%S")
-        except Exception:
-            time_published = None
-
-        # Store the record asynchronously in the database.
-        await asyncio.to_thread(
-            NewsData.objects.create,
-            title=title,
-            url=url,
-            time_published=time_published,
-            summary=summary,
-            banner_image=banner_image,
-            source=source,
-            overall_sentiment_score=overall_sentiment_score
-        )
-
-        # Append the article dictionary to our return list.
-        news_list.append({
-            "title": title,
-            "url": url,
-            "time_published": time_published_str,
-            "summary": summary,
-            "banner_image": banner_image,
-            "source": source,
-            "overall_sentiment_score": overall_sentiment_score,
-        })
-
-    print("News data fetched from Alpha Vantage and stored successfully.")
+            async for item in iter_feed_items(response.aiter_text()):
+                time_published_str = item.get("time_published")  # e.g., "20250208T162713"
+
+                # Convert the custom time format to a datetime object.
+                try:
+                    time_published = datetime.strptime(time_published_str, "%Y%m%dT%H%M%S")
+                except Exception:
+                    time_published = None
+
+                article = {
+                    "title": item.get("title"),
+                    "url": item.get("url"),
+                    "summary": item.get("summary"),
+                    "banner_image": item.get("banner_image"),
+                    "source": item.get("source"),
+                    "overall_sentiment_score": item.get("overall_sentiment_score"),
+                }
+                rows.extend({**article, "ticker": tag, "time_published": time_published} for tag in tags)
+                news_list.append({**article, "time_published": time_published_str})
+        except ValueError as e:
+            print("Warning:", e)
+            return []
+
+    # Store every article in one transaction with a single thread hop.
+    stored = await run_orm(upsert_news, rows)
+    print(f"News data fetched from Alpha Vantage: {stored} articles stored.")
     return news_list
@@ -1,14 +1,22 @@
-from django.http import JsonResponse
-from .message import generate_data_openai, generate_data_claude_serpapi_stateless
+import asyncio
+import json
+from django.http import JsonResponse, StreamingHttpResponse
+from .message import (
+    generate_data_openai, generate_data_claude_serpapi_stateless, stream_data_claude_serpapi,
+    parse_analysis, CLAUDE_FALLBACK_RESPONSE,
+)
+from .cache import cached_explanation, cache_stats, lookup_explanation
+from .market_filter import market_driven_explanation
+from .store import check_range
 from django.conf import settings
-from asgiref.sync import async_to_sync
-from rest_framework.decorators import api_view, renderer_classes
+from adrf.decorators import api_view
+from rest_framework.decorators import renderer_classes
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
-def news_api(request):
+async def news_api(request):
     try:
         stockname = request.query_params.get('stockname', 'AAPL')
         start = request.query_params.get('start', '2025-01-01')
@@ -17,28 +25,85 @@ def news_api(request):
         # Remove quotes from dates if present
         start = start.replace('"', '')
         end = end.replace('"', '')
+        try:
+            check_range(start, end)
+        except ValueError as e:
+            return Response({
+                "status_code": 400,
+                "error": f"Invalid date range: {e}"
+            }, status=400)
         
         # Use Claude + SerpAPI (preferred) or fallback to OpenAI + Perplexity
         api_claude = getattr(settings, 'API_CLAUDE', None)
         serpapi_key = getattr(settings, 'SERPAPI_KEY', None)
         
+        streaming = request.query_params.get('stream') in ('1', 'true')
+
+        if api_claude and serpapi_key:
+            provider = "claude+serpapi"
+        elif settings.API_PER and settings.API_OPENAI and not streaming:
+            provider = "openai+perplexity"
+        else:
+            provider = None
+
+        # A cached explanation is answered first, before the market filter or any LLM.
+        if provider:
+            cached_res = await lookup_explanation(provider, stockname, start, end)
+            if cached_res is not None:
+                if streaming:
+                    return result_news_response(cached_res)
+                return Response({
+                    "status_code": 200,
+                    "complex": cached_res
+                })
+
+        # Ranges that just tracked the market get a templated explanation without
+        # any LLM call; ?market_filter=0 asks for the full explanation regardless.
+        if settings.NEWS_MARKET_FILTER and request.query_params.get('market_filter') not in ('0', 'false'):
+            market_res = await market_driven_explanation(stockname, start, end)
+            if market_res is not None:
+                if streaming:
+                    return result_news_response(market_res, market_driven=True)
+                return Response({
+                    "status_code": 200,
+                    "complex": market_res,
+                    "market_driven": True
+                })
+
+        if streaming:
+            if not (api_claude and serpapi_key):
+                return Response({
+                    "status_code": 400,
+                    "error": "Streaming needs the Claude+SerpAPI provider"
+                }, status=400)
+            return stream_news_response(serpapi_key, api_claude, stockname, start, end)
+
         if api_claude and serpapi_key:
-            # Use Claude Sonnet 4 + SerpAPI (stateless)
-            complex_res = generate_data_claude_serpapi_stateless(
-                serpapi_key,
-                api_claude,
-                stockname,
-                start,
-                end
+            # Use Claude Sonnet 4 + SerpAPI (stateless), cached per (stock, start, end)
+            complex_res = await cached_explanation(
+                "claude+serpapi", stockname, start, end,
+                lambda: generate_data_claude_serpapi_stateless(
+                    serpapi_key,
+                    api_claude,
+                    stockname,
+                    start,
+                    end
+                ),
+                cacheable=lambda result: result != CLAUDE_FALLBACK_RESPONSE,
+                count_lookup=False,
             )
         elif settings.API_PER and settings.API_OPENAI:
             # Fallback to OpenAI + Perplexity
-            complex_res = generate_data_openai(
-                settings.API_PER,
-                settings.API_OPENAI,
-                stockname,
-                start,
-                end
+            complex_res = await cached_explanation(
+                "openai+perplexity", stockname, start, end,
+                lambda: generate_data_openai(
+                    settings.API_PER,
+                    settings.API_OPENAI,
+                    stockname,
+                    start,
+                    end
+                ),
+                count_lookup=False,
             )
         else:
             return Response({
@@ -61,3 +126,106 @@ def news_api(request):
             "error": str(e)
         }
         return Response(error_data, status=500)
+
+
+def sse_event(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_news_response(serpapi_key, api_claude, stockname, start, end):
+    """
+    Server-sent events for /api/news/?stream=1:
+
+      event: search  {"citations": [...], "content": [...]}   articles for the range
+      event: token   {"text": "..."}                          Claude output as it is generated
+      event: result  {"status_code": 200, "complex": "...", "analysis": {...}}
+
+    ``result`` is always the last event; ``complex`` is the same string the
+    non-streaming response returns, ``analysis`` its parsed JSON (or null).
+
+    The explanation goes through the same single-flight as the JSON response
+    (``cached_explanation``): while one is being generated for the range, further
+    requests for it, streaming or not, wait for that one instead of calling SerpAPI
+    and Claude again. Only the request that started it gets ``search`` and
+    ``token`` events; the others, and one answered from the cache in the meantime,
+    get a lone ``result`` event.
+    """
+    provider = "claude+serpapi"
+
+    def result_event(complex_res):
+        return sse_event("result", {
+            "status_code": 200,
+            "complex": complex_res,
+            "analysis": parse_analysis(complex_res),
+        })
+
+    def progress_event(event, data):
+        if event == "token":
+            return sse_event("token", {"text": data})
+        return sse_event(event, data)
+
+    async def events():
+        progress = asyncio.Queue()
+
+        async def generate():
+            result = CLAUDE_FALLBACK_RESPONSE
+            async for event, data in stream_data_claude_serpapi(serpapi_key, api_claude, stockname, start, end):
+                if event == "result":
+                    result = data
+                else:
+                    progress.put_nowait((event, data))
+            return result
+
+        explanation = asyncio.ensure_future(cached_explanation(
+            provider, stockname, start, end, generate,
+            cacheable=lambda result: result != CLAUDE_FALLBACK_RESPONSE,
+            count_lookup=False,
+        ))
+        try:
+            while not explanation.done():
+                next_event = asyncio.ensure_future(progress.get())
+                await asyncio.wait({next_event, explanation}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield progress_event(*next_event.result())
+                else:
+                    next_event.cancel()
+            while not progress.empty():
+                yield progress_event(*progress.get_nowait())
+            complex_res = explanation.result()
+        except Exception as e:
+            yield sse_event("result", {"status_code": 500, "error": str(e)})
+            return
+        yield result_event(complex_res)
+
+    return sse_response(events())
+
+
+def result_news_response(complex_res, **extra):
+    """The SSE form of a ready explanation (cached or market-driven): a lone ``result`` event."""
+    async def events():
+        yield sse_event("result", {
+            "status_code": 200,
+            "complex": complex_res,
+            "analysis": parse_analysis(complex_res),
+            **extra,
+        })
+    return sse_response(events())
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Keep reverse proxies (nginx) from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+async def news_cache_stats_api(request):
+    """Hit/miss counters of the news explanation cache for the serving process."""
+    return Response({
+        "status_code": 200,
+        "cache": cache_stats()
+    })
@@ -7,10 +7,54 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stockcompass.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def lifespan(receive, send):
+    """
+    ASGI lifespan protocol (which Django itself does not handle): starts the
+    background prefetch scheduler with the server when PREFETCH_IN_PROCESS is set,
+    and closes the pooled upstream HTTP client on shutdown.
+    """
+    from django.conf import settings
+    from newsdata import upstream
+    from stockdata.prefetch import run_scheduler
+
+    stop = asyncio.Event()
+    scheduler = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if settings.PREFETCH_IN_PROCESS:
+                scheduler = asyncio.create_task(run_scheduler(stop=stop))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            stop.set()
+            if scheduler is not None:
+                await scheduler
+            await upstream.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "websocket":
+        # Django only speaks HTTP; live bar pushes are served by a plain ASGI handler.
+        from stockdata.live import websocket_application
+
+        if scope["path"].rstrip("/") == "/ws/stockdata":
+            await websocket_application(scope, receive, send)
+        else:
+            await receive()
+            await send({"type": "websocket.close", "code": 1000})
+    else:
+        await django_application(scope, receive, send)
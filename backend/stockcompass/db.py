@@ -0,0 +1,30 @@
+"""
+ORM access from async code.
+
+Django only recycles database connections (``close_old_connections``) around
+requests, on the request thread. ORM work handed to the default executor with
+``asyncio.to_thread`` runs on other threads, which would otherwise keep their
+connections open for good, or keep using one the database already dropped.
+``run_orm`` does around each call what a request does.
+"""
+
+import asyncio
+
+from django.db import close_old_connections
+
+
+def _call(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_orm(func, *args, **kwargs):
+    """
+    ``await asyncio.to_thread(func, *args, **kwargs)`` for ORM code: the thread's
+    connection is dropped first if it is broken or past CONN_MAX_AGE, and again
+    afterwards (with the default CONN_MAX_AGE of 0, closed after every call).
+    """
+    return await asyncio.to_thread(_call, func, args, kwargs)
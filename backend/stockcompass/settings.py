@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
     'newsdata',
     'chatbot',
     'rest_framework',
+    'adrf',
     'corsheaders',
 ]
 
@@ -77,6 +80,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'stockcompass.wsgi.application'
+ASGI_APPLICATION = 'stockcompass.asgi.application'  # Production entry point (uvicorn workers)
 
 
 # Database
@@ -99,6 +103,45 @@ else:
     }
 
 
+# Caches
+# "news" holds LLM explanations. LocMemCache evicts least-recently-used entries;
+# culling one entry at a time (CULL_FREQUENCY == MAX_ENTRIES) keeps that strict LRU.
+# Point NEWS_CACHE_BACKEND/NEWS_CACHE_LOCATION at a shared backend to share it
+# between workers; such backends pass OPTIONS to their client, so they take theirs
+# from NEWS_CACHE_OPTIONS (JSON) instead of the LocMemCache culling options.
+NEWS_CACHE_BACKEND = os.getenv('NEWS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+NEWS_CACHE_MAX_ENTRIES = int(os.getenv('NEWS_CACHE_MAX_ENTRIES', '1000'))
+if NEWS_CACHE_BACKEND == 'django.core.cache.backends.locmem.LocMemCache':
+    NEWS_CACHE_OPTIONS = {
+        'MAX_ENTRIES': NEWS_CACHE_MAX_ENTRIES,
+        'CULL_FREQUENCY': NEWS_CACHE_MAX_ENTRIES,
+    }
+else:
+    NEWS_CACHE_OPTIONS = json.loads(os.getenv('NEWS_CACHE_OPTIONS', '{}'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'news': {
+        'BACKEND': NEWS_CACHE_BACKEND,
+        'LOCATION': os.getenv('NEWS_CACHE_LOCATION', 'news'),
+        'TIMEOUT': int(os.getenv('NEWS_CACHE_TTL', str(24 * 60 * 60))),
+        'OPTIONS': NEWS_CACHE_OPTIONS,
+    },
+    # Memoized statistical results (GARCH fits, unusual ranges) keyed by input hash.
+    # Entries are a few arrays per series, so MAX_ENTRIES bounds its memory.
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analytics',
+        'TIMEOUT': int(os.getenv('ANALYTICS_CACHE_TTL', str(60 * 60))),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', '256')),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -164,9 +207,102 @@ if os.getenv('FRONTEND_URL'):
     CORS_ALLOWED_ORIGINS.append(os.getenv('FRONTEND_URL'))
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ["X-Data-Age", "ETag"]
+# Let the frontend revalidate /api/stockdata/ responses itself
+CORS_ALLOW_HEADERS = (*default_headers, "if-none-match")
+
+# Bar store: minimum seconds between incremental Yahoo refreshes of one (ticker, interval)
+STOCKDATA_BAR_REFRESH_SECONDS = int(os.getenv("STOCKDATA_BAR_REFRESH_SECONDS", "60"))
+
+# unusual_ranges: a series that grew by at most this many bars since its last full GARCH
+# fit keeps the fitted parameters and only extends the volatility recursion
+GARCH_EXTEND_MAX_BARS = int(os.getenv("GARCH_EXTEND_MAX_BARS", "5"))
+# The same for the feature store's intraday series. They gain this many bars within
+# hours, parameters fitted over thousands of bars barely move in that time, and each
+# refit rewrites the volatility of every stored bar; the default is a session of 1m bars
+GARCH_INTRADAY_EXTEND_MAX_BARS = int(os.getenv("GARCH_INTRADAY_EXTEND_MAX_BARS", "390"))
+
+# Process pool for CPU-bound statistics (GARCH fits); 0 workers runs them in a thread.
+# New tasks are refused (HTTP 503) once STOCKDATA_MAX_PENDING_TASKS are queued or running.
+STOCKDATA_PROCESS_POOL_WORKERS = int(os.getenv("STOCKDATA_PROCESS_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+STOCKDATA_MAX_PENDING_TASKS = int(os.getenv("STOCKDATA_MAX_PENDING_TASKS", str(8 * max(STOCKDATA_PROCESS_POOL_WORKERS, 1))))
+STOCKDATA_TASK_TIMEOUT = float(os.getenv("STOCKDATA_TASK_TIMEOUT", "30"))
+STOCKDATA_BATCH_MAX_SERIES = int(os.getenv("STOCKDATA_BATCH_MAX_SERIES", "50"))
+# Tickers /api/stockdata/batch/ and /api/unusual_range/batch/ load at the same time (one on SQLite)
+STOCKDATA_BATCH_CONCURRENCY = int(os.getenv("STOCKDATA_BATCH_CONCURRENCY", "8"))
+
+# /api/stockdata/?live=1: latest-bar statistics kept incrementally per (ticker, interval).
+# The anomaly flag needs |z-score| and the move/volatility ratio both above LIVE_ANOMALY_Z.
+LIVE_STATS_WINDOW = int(os.getenv("LIVE_STATS_WINDOW", "30"))
+LIVE_STATS_EWMA_LAMBDA = float(os.getenv("LIVE_STATS_EWMA_LAMBDA", "0.94"))
+LIVE_STATS_WARMUP_BARS = int(os.getenv("LIVE_STATS_WARMUP_BARS", "500"))
+LIVE_ANOMALY_Z = float(os.getenv("LIVE_ANOMALY_Z", "1.96"))
+
+# /ws/stockdata/ (stockdata/live.py): seconds between bar store polls per subscribed
+# (ticker, interval), messages a client may fall behind before it is disconnected, and
+# subscriptions per connection
+LIVE_PUSH_INTERVAL = float(os.getenv("LIVE_PUSH_INTERVAL", "5"))
+LIVE_PUSH_QUEUE_SIZE = int(os.getenv("LIVE_PUSH_QUEUE_SIZE", "100"))
+LIVE_PUSH_MAX_SUBSCRIPTIONS = int(os.getenv("LIVE_PUSH_MAX_SUBSCRIPTIONS", "20"))
+
+# Concurrent identical Yahoo loads share one call per process; name a cache shared by
+# all workers (e.g. "news" with NEWS_CACHE_BACKEND set to Redis/Memcached) to also make
+# workers wait for each other's call
+STOCKDATA_SINGLEFLIGHT_CACHE = os.getenv("STOCKDATA_SINGLEFLIGHT_CACHE") or None
+
+# Metadata responses are cached this long (seconds)
+STOCKDATA_METADATA_TTL = int(os.getenv("STOCKDATA_METADATA_TTL", "300"))
+
+# Stale-while-revalidate: data older than its refresh interval (STOCKDATA_BAR_REFRESH_SECONDS,
+# STOCKDATA_METADATA_TTL) but within these budgets is served at once and refreshed in the
+# background; older data makes the request wait for Yahoo. X-Data-Age reports its age.
+STOCKDATA_STALE_SECONDS = int(os.getenv("STOCKDATA_STALE_SECONDS", "900"))
+STOCKDATA_METADATA_STALE_SECONDS = int(os.getenv("STOCKDATA_METADATA_STALE_SECONDS", "3600"))
+
+# Market index used for stock-vs-market comparisons, and where its history is kept
+MARKET_INDEX_SYMBOL = os.getenv("MARKET_INDEX_SYMBOL", "^GSPC")
+MARKET_DATA_DIR = os.getenv("MARKET_DATA_DIR", str(BASE_DIR / "market_data"))
+# A range that moved with the market counts as market-driven when its beta-adjusted
+# excess return is at most this fraction of the stock's move
+MARKET_DRIVEN_MAX_EXCESS_RATIO = float(os.getenv("MARKET_DRIVEN_MAX_EXCESS_RATIO", "0.5"))
+# /api/news/ answers market-driven ranges with a templated explanation instead of an LLM call
+NEWS_MARKET_FILTER = os.getenv("NEWS_MARKET_FILTER", "1") == "1"
+
+# Background prefetch (stockdata/prefetch.py): `python manage.py prefetch`, or set
+# PREFETCH_IN_PROCESS=1 to run it inside each server process
+PREFETCH_IN_PROCESS = os.getenv("PREFETCH_IN_PROCESS", "0") == "1"
+PREFETCH_TICKERS = [t.strip().upper() for t in os.getenv("PREFETCH_TICKERS", "AAPL,MSFT,NVDA,AMZN,GOOGL,META,TSLA").split(",") if t.strip()]
+PREFETCH_SERIES = [("max", "1d"), ("1d", "60m")]  # (period, interval) pairs the frontend asks for
+PREFETCH_BARS_INTERVAL = float(os.getenv("PREFETCH_BARS_INTERVAL", "60"))
+PREFETCH_METADATA_INTERVAL = float(os.getenv("PREFETCH_METADATA_INTERVAL", "240"))
+PREFETCH_MARKET_INTERVAL = float(os.getenv("PREFETCH_MARKET_INTERVAL", "3600"))
+PREFETCH_JITTER = float(os.getenv("PREFETCH_JITTER", "0.1"))  # +/- fraction of each interval
+PREFETCH_MAX_BACKOFF = float(os.getenv("PREFETCH_MAX_BACKOFF", "1800"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
 
 # API Keys
 API_CLAUDE = os.getenv("API_CLAUDE")    # Claude Sonnet 4 (primary AI)
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")  # SerpAPI (primary news search)
 API_PER = os.getenv("API_PER")          # Perplexity (fallback)
 API_OPENAI = os.getenv("API_OPENAI")    # OpenAI (legacy fallback)
+
+# Shared HTTP pool for news upstream calls (see newsdata/upstream.py)
+NEWS_HTTP_TIMEOUT = float(os.getenv("NEWS_HTTP_TIMEOUT", "60"))
+NEWS_HTTP_CONNECT_TIMEOUT = float(os.getenv("NEWS_HTTP_CONNECT_TIMEOUT", "5"))
+NEWS_HTTP_MAX_CONNECTIONS = int(os.getenv("NEWS_HTTP_MAX_CONNECTIONS", "100"))
+NEWS_HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("NEWS_HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+NEWS_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("NEWS_HTTP_KEEPALIVE_EXPIRY", "30"))
+# Upstream URL overrides, e.g. to run against a local stub server
+NEWS_UPSTREAM_URLS = {
+    name: url for name, url in {
+        "serpapi": os.getenv("SERPAPI_URL"),
+        "perplexity": os.getenv("PERPLEXITY_URL"),
+        "deepseek": os.getenv("DEEPSEEK_URL"),
+        "alphavantage": os.getenv("ALPHAVANTAGE_URL"),
+        "anthropic": os.getenv("ANTHROPIC_BASE_URL"),
+        "openai": os.getenv("OPENAI_BASE_URL"),
+    }.items() if url
+}
+
+# Articles per INSERT when get_news_data upserts an Alpha Vantage feed
+NEWS_INGEST_BATCH_SIZE = int(os.getenv("NEWS_INGEST_BATCH_SIZE", "500"))
@@ -0,0 +1,100 @@
+"""
+Request coalescing.
+
+``SingleFlight.do(key, func)`` runs ``func()`` once per key at a time: callers that
+arrive while a call for the same key is in flight await that call's result instead
+of starting their own.
+
+With ``shared_cache`` (a cache alias) the leader also takes a lock in that cache,
+so a call already running for the key in another worker process is waited for
+before this one starts. The result itself is not passed between processes; the
+caller's ``func`` should read what the other worker stored (bar store, cache)
+before going upstream.
+"""
+
+import asyncio
+import time
+
+from django.core.cache import caches
+
+
+class SingleFlight:
+    def __init__(self, max_tracked_keys=1000, lock_timeout=30, poll_interval=0.05):
+        self._calls = {}
+        self.stats = {"leaders": 0, "joined": 0}
+        # Per-key counters, oldest keys dropped beyond max_tracked_keys.
+        self._key_stats = {}
+        self.max_tracked_keys = max_tracked_keys
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    async def do(self, key, func, shared_cache=None):
+        """
+        Return the result of ``await func()``, sharing one in-flight call per key.
+
+        The shared call runs as its own task, so a caller being cancelled (e.g. the
+        client disconnecting) does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is not None and task.get_loop() is loop and not task.done():
+            self.stats["joined"] += 1
+            self._count(key)["joined"] += 1
+            return await asyncio.shield(task)
+
+        self.stats["leaders"] += 1
+        self._count(key)["leaders"] += 1
+        task = loop.create_task(self._run(key, func, shared_cache))
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    async def _run(self, key, func, shared_cache):
+        counters = self._count(key)
+        lock = None
+        if shared_cache is not None:
+            lock = await self._acquire(caches[shared_cache], f"singleflight:{key}", counters)
+        started = time.perf_counter()
+        try:
+            return await func()
+        except BaseException:
+            counters["errors"] += 1
+            raise
+        finally:
+            counters["seconds"] += time.perf_counter() - started
+            if lock is not None:
+                await lock.adelete(f"singleflight:{key}")
+
+    async def _acquire(self, cache, lock_key, counters):
+        """Take the cross-process lock, waiting for another holder; returns the cache if taken."""
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while not await cache.aadd(lock_key, 1, self.lock_timeout):
+            if not waited:
+                counters["waited"] += 1
+                waited = True
+            if time.monotonic() >= deadline:
+                # The holder has outlived its lock (e.g. the worker died); go ahead.
+                return None
+            await asyncio.sleep(self.poll_interval)
+        return cache
+
+    def _count(self, key):
+        counters = self._key_stats.get(key)
+        if counters is None:
+            if len(self._key_stats) >= self.max_tracked_keys:
+                del self._key_stats[next(iter(self._key_stats))]
+            counters = self._key_stats[key] = {"leaders": 0, "joined": 0, "waited": 0, "errors": 0, "seconds": 0.0}
+        return counters
+
+    def key_stats(self):
+        """Per-key counters: leaders (upstream calls), joined (coalesced callers),
+        waited (leaders that waited on another process), errors, and seconds spent."""
+        return {str(key): dict(counters) for key, counters in self._key_stats.items()}
+
+    def in_flight(self):
+        return sum(1 for task in self._calls.values() if not task.done())
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
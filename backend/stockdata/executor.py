@@ -0,0 +1,118 @@
+# stockdata/executor.py
+"""
+Bounded process pool for the CPU-bound statistics in stockdata (GARCH fits).
+
+Work submitted here runs outside the serving process, so a long fit neither holds
+the worker's GIL nor stalls its event loop. Only picklable, Django-free callables
+(see stockdata/garch.py) should be submitted.
+
+Configured by:
+    STOCKDATA_PROCESS_POOL_WORKERS  pool size; 0 runs tasks in a thread instead
+    STOCKDATA_MAX_PENDING_TASKS     tasks queued or running before new ones are refused
+    STOCKDATA_TASK_TIMEOUT          seconds a caller waits for one task
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+_pool = None
+_pending = 0
+_lock = threading.Lock()
+
+# Seconds between checks for a free slot when a caller waits for one.
+SLOT_POLL_INTERVAL = 0.05
+
+
+class PoolSaturated(RuntimeError):
+    """Raised when the pool already holds STOCKDATA_MAX_PENDING_TASKS tasks."""
+
+
+def get_process_pool():
+    """The process-wide pool, created on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            # "spawn" children start clean instead of inheriting the server's
+            # threads and sockets through fork.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.STOCKDATA_PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def pending_tasks():
+    """Tasks submitted to the pool that have not finished yet."""
+    return _pending
+
+
+def _task_done(_future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _discard_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _reserve_slot(wait):
+    """Count one more pending task, waiting up to ``wait`` seconds for the limit to allow it."""
+    global _pending
+    deadline = time.monotonic() + wait
+    while True:
+        with _lock:
+            if _pending < settings.STOCKDATA_MAX_PENDING_TASKS:
+                _pending += 1
+                return
+            pending = _pending
+        if time.monotonic() >= deadline:
+            raise PoolSaturated(f"Statistics pool is busy ({pending} tasks pending), try again shortly")
+        await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+
+async def run_in_process(func, *args, timeout=None, wait_for_slot=False):
+    """
+    Run ``func(*args)`` in the process pool and await its result.
+
+    With ``wait_for_slot`` a saturated pool is waited on for up to ``timeout``
+    seconds instead of refusing the task straight away, for batch work that
+    should queue rather than fail.
+
+    Raises:
+        PoolSaturated: too many tasks are already queued or running.
+        TimeoutError: the task did not finish within ``timeout`` seconds (default
+            STOCKDATA_TASK_TIMEOUT). A task that has already started keeps its
+            worker until it finishes and still counts towards the queue limit.
+    """
+    timeout = settings.STOCKDATA_TASK_TIMEOUT if timeout is None else timeout
+    if settings.STOCKDATA_PROCESS_POOL_WORKERS == 0:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
+
+    await _reserve_slot(timeout if wait_for_slot else 0)
+    pool = get_process_pool()
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        _task_done(None)
+        _discard_pool(pool)
+        raise
+    future.add_done_callback(_task_done)
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Statistics task exceeded {timeout}s") from None
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time.
+        _discard_pool(pool)
+        raise
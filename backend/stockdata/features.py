@@ -0,0 +1,90 @@
+# stockdata/features.py
+"""
+Derived per-bar series kept next to the bars in the bar store:
+
+    pct_change        close-to-close change in percent
+    volatility_<N>    rolling standard deviation of pct_change over N bars
+    garch_volatility  GARCH(1,1) conditional volatility of the price changes
+
+Like garch.py, nothing here touches Django, so ``compute_features`` can run in a
+worker process.
+"""
+import numpy as np
+import pandas as pd
+
+from .garch import extend_conditional_volatility, fit_conditional_volatility
+
+# About a trading week, month and quarter of daily bars.
+VOLATILITY_WINDOWS = (5, 21, 63)
+FEATURE_FIELDS = ["pct_change", *(f"volatility_{window}" for window in VOLATILITY_WINDOWS), "garch_volatility"]
+
+# Fewer price changes than this are not worth a GARCH fit.
+GARCH_MIN_CHANGES = 10
+
+
+def garch_features(close, known_volatility, params, extended_bars, extend_max_bars):
+    """
+    GARCH(1,1) conditional volatility per bar (NaN for the first bar, which has no
+    change), continuing the previous fit where possible.
+
+    Parameters:
+        close (np.ndarray): Closing prices of the whole series.
+        known_volatility (np.ndarray): Stored volatility of bars 1..k that is still
+            valid, i.e. every close before bar k is unchanged.
+        params (list): [mu, omega, alpha[1], beta[1]] of the last full fit, or None.
+        extended_bars (int): Bars added since that fit without refitting.
+        extend_max_bars (int): Refit once more bars than this were added.
+    Returns:
+        tuple: (volatility array or None when the series cannot be fitted, first bar
+               whose volatility changed, params, extended_bars)
+    """
+    changes = np.diff(close)
+    if len(changes) < GARCH_MIN_CHANGES or not np.isfinite(changes).all():
+        return None, 0, params, extended_bars
+    new_bars = len(changes) - len(known_volatility)
+    if params is not None and len(known_volatility) >= 1 and extended_bars + new_bars <= extend_max_bars:
+        volatility = extend_conditional_volatility(np.asarray(params), changes, known_volatility)
+        first_row, extended_bars = len(known_volatility) + 1, extended_bars + new_bars
+    else:
+        volatility, fitted = fit_conditional_volatility(
+            changes, starting_values=None if params is None else np.asarray(params))
+        first_row, extended_bars, params = 1, 0, fitted.tolist()
+    return np.r_[np.nan, volatility], first_row, params, extended_bars
+
+
+def rolling_features(close, first_row):
+    """
+    pct_change and the rolling volatilities for bars ``first_row`` onward, reading
+    only as many earlier closes as the longest window needs.
+
+    Returns:
+        dict: {field: np.ndarray} with one value per bar from ``first_row`` on.
+    """
+    start = max(0, first_row - max(VOLATILITY_WINDOWS))
+    returns = pd.Series(close[start:]).pct_change() * 100
+    features = {"pct_change": returns}
+    for window in VOLATILITY_WINDOWS:
+        features[f"volatility_{window}"] = returns.rolling(window=window).std()
+    return {name: values.to_numpy()[first_row - start:] for name, values in features.items()}
+
+
+def compute_features(close, first_row, known_volatility, params, extended_bars, extend_max_bars):
+    """
+    Recompute the features of a series whose bars changed from ``first_row`` on.
+
+    A GARCH refit changes the volatility of every bar, in which case everything
+    from bar 0 is returned.
+
+    Returns:
+        dict: {"first_row": int, "features": {field: values from first_row on},
+               "params": list or None, "extended_bars": int}
+    """
+    close = np.asarray(close, dtype=float)
+    volatility, garch_first_row, params, extended_bars = garch_features(
+        close, known_volatility, params, extended_bars, extend_max_bars)
+    if volatility is not None:
+        first_row = min(first_row, garch_first_row)
+    features = rolling_features(close, first_row)
+    features["garch_volatility"] = (np.full(len(close) - first_row, np.nan) if volatility is None
+                                    else volatility[first_row:])
+    return {"first_row": first_row, "features": features, "params": params, "extended_bars": extended_bars}
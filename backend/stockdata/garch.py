@@ -0,0 +1,218 @@
+# stockdata/garch.py
+"""
+Pure statistical routines behind unusual_ranges.
+
+Nothing here touches Django, so these functions can run in worker processes.
+"""
+import warnings
+
+import numpy as np
+import scipy.stats
+from arch import arch_model
+from arch.utility.exceptions import StartingValueWarning
+
+
+def fit_conditional_volatility(daily_changes, starting_values=None):
+    """
+    Fit a GARCH(1,1) model to the daily changes.
+
+    Parameters:
+        daily_changes (np.ndarray): Differences between consecutive prices.
+        starting_values (np.ndarray): Optional parameters of an earlier fit to start
+            the optimizer from, which cuts the iterations needed when the data has
+            only changed a little.
+    Returns:
+        tuple: (conditional volatility array, same length as ``daily_changes``;
+               fitted parameters as [mu, omega, alpha[1], beta[1]])
+    """
+    with warnings.catch_warnings():
+        # Previous parameters on the edge of the stationarity constraint are rejected
+        # by arch, which then falls back to its own starting values; that is fine.
+        warnings.simplefilter("ignore", StartingValueWarning)
+        garch_fit = arch_model(daily_changes, vol='Garch', p=1, q=1).fit(disp='off', starting_values=starting_values)
+    return np.asarray(garch_fit.conditional_volatility), np.asarray(garch_fit.params)
+
+
+def extend_conditional_volatility(params, daily_changes, known_volatility):
+    """
+    Continue the GARCH(1,1) variance recursion with fixed parameters:
+
+        sigma2[t] = omega + alpha * (y[t-1] - mu) ** 2 + beta * sigma2[t-1]
+
+    Parameters:
+        params (np.ndarray): [mu, omega, alpha[1], beta[1]] of an earlier fit.
+        daily_changes (np.ndarray): The full series of daily changes.
+        known_volatility (np.ndarray): Conditional volatility already known for the
+            first ``len(known_volatility)`` changes (at least one).
+    Returns:
+        np.ndarray: Conditional volatility for every change.
+    """
+    mu, omega, alpha, beta = params
+    sigma2 = np.empty(len(daily_changes))
+    known = len(known_volatility)
+    sigma2[:known] = np.square(known_volatility)
+    resid2 = np.square(daily_changes - mu)
+    for t in range(known, len(daily_changes)):
+        sigma2[t] = omega + alpha * resid2[t - 1] + beta * sigma2[t - 1]
+    return np.sqrt(sigma2)
+
+
+def _reusable_prefix(state, times, prices):
+    """
+    Match a new series against the one ``state`` was computed for.
+
+    Returns (offset, stable): the new series starts at index ``offset`` of the old
+    one and its first ``stable`` prices are unchanged. The last overlapping price
+    may differ (a bar that was still forming). Returns None when the new series is
+    not a continuation of the old one.
+    """
+    old_times, old_prices = state["times"], state["prices"]
+    if times.dtype != old_times.dtype:
+        return None
+    offset = int(np.searchsorted(old_times, times[0]))
+    if offset >= len(old_times) or old_times[offset] != times[0]:
+        return None
+    overlap = len(old_times) - offset
+    if len(times) < overlap or not np.array_equal(times[:overlap], old_times[offset:]):
+        return None
+    same = prices[:overlap] == old_prices[offset:]
+    if same.all():
+        return offset, overlap
+    if same[:-1].all():
+        return offset, overlap - 1
+    return None
+
+
+def incremental_conditional_volatility(state, times, prices, extend_max_bars):
+    """
+    Conditional volatility for ``prices``, reusing the fit recorded in ``state``
+    (from an earlier call on the same series) where possible:
+
+    - "extended": the series gained at most ``extend_max_bars`` bars since the last
+      full fit, so the known volatility is kept and the recursion is run forward
+      for the new bars with the fitted parameters unchanged.
+    - "warm": the series continues the old one but grew more than that; it is
+      refit with the optimizer started from the previous parameters.
+    - "cold": no usable state; a full fit from scratch.
+
+    When the series is a sliding window (it starts later than the old one), the
+    reused volatility was conditioned on the bars that dropped off the front; the
+    difference from a fresh fit fades out within a few bars.
+
+    Returns:
+        tuple: (conditional volatility, new state to remember for this series, mode)
+    """
+    daily_changes = np.diff(prices)
+    match = _reusable_prefix(state, times, prices) if state else None
+    if match is not None:
+        offset, stable = match
+        # Change i is prices[i + 1] - prices[i], so the first stable - 1 changes
+        # (and their volatility) are the same as in the old series.
+        known = stable - 1
+        new_bars = len(prices) - stable
+        extended = state["extended_bars"] + new_bars
+        if known >= 1 and extended <= extend_max_bars:
+            forecast = extend_conditional_volatility(
+                state["params"], daily_changes, state["volatility"][offset:offset + known])
+            params, mode = state["params"], "extended"
+        else:
+            forecast, params = fit_conditional_volatility(daily_changes, starting_values=state["params"])
+            extended, mode = 0, "warm"
+    else:
+        forecast, params = fit_conditional_volatility(daily_changes)
+        extended, mode = 0, "cold"
+
+    new_state = {
+        "times": times,
+        "prices": prices,
+        "params": params,
+        "volatility": forecast,
+        "extended_bars": extended,
+    }
+    return forecast, new_state, mode
+
+
+def detect_unusual_ranges(times, daily_changes, forecast):
+    """
+    Combine the GARCH volatility test with a Central Limit Theorem test on the
+    daily changes and group the unusual days into date ranges.
+
+    Parameters:
+        times (np.ndarray): datetime64 dates of the prices (one more than the changes).
+        daily_changes (np.ndarray): Differences between consecutive prices.
+        forecast (np.ndarray): Conditional volatility for each daily change.
+    Returns:
+        List of ("YYYY-MM-DD", "YYYY-MM-DD") tuples, longest range first, each spanning
+        at least 2 days. Empty when no day passes both tests.
+    """
+    # The corresponding dates for the daily changes are the dates from the second element onward.
+    daily_dates = times[1:]
+
+    # Compute the critical value for a two-tailed 95% confidence interval.
+    crit_value = scipy.stats.norm.ppf(1 - 0.05 / 2)
+
+    # Calculate basic statistics.
+    mean = np.mean(daily_changes)
+    stdev = np.std(daily_changes)
+
+    # Apply the combined test to determine unusual days.
+    mask = (np.abs(daily_changes) > (crit_value * forecast))
+    mask = mask & ((np.abs(daily_changes - mean) / stdev) > crit_value)
+    unusual_dates = daily_dates[mask]
+
+    if unusual_dates.size == 0:
+        return []
+
+    # Sort the unusual dates.
+    unusual_dates = np.sort(unusual_dates)
+    # Compute the gaps between consecutive unusual dates.
+    gaps = np.diff(unusual_dates)
+    # Convert gaps to days (as integers) for comparison.
+    gaps_in_days = gaps.astype('timedelta64[D]').astype(int)
+    median_gap = np.median(gaps_in_days)
+    # Identify indices where the gap is greater than the median gap.
+    gap_indices = np.where(gaps_in_days > median_gap)[0]
+
+    # Group consecutive unusual dates into ranges.
+    if gap_indices.size == 0:
+        ranges = [(unusual_dates[0], unusual_dates[-1])]
+    else:
+        start_indices = np.r_[0, gap_indices + 1]
+        end_indices = np.r_[gap_indices, unusual_dates.size - 1]
+        ranges = [(unusual_dates[s], unusual_dates[e]) for s, e in zip(start_indices, end_indices) if s != e]
+
+    # Sort the ranges by duration (in days) in descending order.
+    ranges.sort(key=lambda pair: (pair[1] - pair[0]).astype('timedelta64[D]').astype(int), reverse=True)
+
+    # Convert the numpy.datetime64 objects to strings in "YYYY-MM-DD" format.
+    formatted_ranges = [(str(start.astype('M8[D]')), str(end.astype('M8[D]'))) for start, end in ranges]
+
+    # --- Ensure each range spans at least 2 days ---
+    # Determine the maximum date in the input (to avoid extending beyond available data).
+    max_date = times.max()
+    adjusted_ranges = []
+    for start_str, end_str in formatted_ranges:
+        start_date = np.datetime64(start_str)
+        end_date = np.datetime64(end_str)
+        if start_date == end_date:
+            # If start is not the maximum date, extend by one day.
+            if start_date < max_date:
+                end_date = start_date + np.timedelta64(1, 'D')
+            else:
+                # Otherwise, if start is the maximum date, shift the range back by one day.
+                start_date = start_date - np.timedelta64(1, 'D')
+        adjusted_ranges.append((str(start_date.astype('M8[D]')), str(end_date.astype('M8[D]'))))
+
+    return adjusted_ranges
+
+
+def analyze_series(state, times, prices, extend_max_bars):
+    """
+    The whole CPU-bound part of unusual_ranges in one call (so it can be shipped to a
+    worker process): the incremental GARCH fit followed by range detection.
+
+    Returns:
+        tuple: (unusual ranges, conditional volatility, new series state)
+    """
+    forecast, new_state, _ = incremental_conditional_volatility(state, times, prices, extend_max_bars)
+    return detect_unusual_ranges(times, np.diff(prices), forecast), forecast, new_state
@@ -0,0 +1,277 @@
+# stockdata/live.py
+"""
+WebSocket push of new bars, served at /ws/stockdata/ by stockcompass/asgi.py.
+
+A client subscribes to (ticker, interval) pairs and then only receives the bars
+that changed since the last message, instead of re-downloading the whole series
+from /api/stockdata/. Messages from the client:
+
+    {"action": "subscribe", "ticker": "AAPL", "interval": "5m", "since": "<ISO timestamp>"}
+    {"action": "unsubscribe", "ticker": "AAPL", "interval": "5m"}
+
+``since`` is optional; bars after it that the server already holds are sent
+straight away, e.g. those that arrived between a REST load and the subscription.
+Messages to the client:
+
+    {"type": "bars", "ticker", "interval", "timestamps": [...],
+     "time_series": [...], "fin_data": [...], "live": {...}}
+    {"type": "error", "error": "..."}
+
+``time_series``/``fin_data`` rows are the ones /api/stockdata/ returns for the
+same bars, keyed by ``timestamps`` (the last bar may be sent again as it keeps
+changing until it completes). ``live`` is ``live_bar_stats`` of the latest bar.
+
+Every (ticker, interval) with subscribers in this process has one ``TickerFeed``
+polling the bar store every LIVE_PUSH_INTERVAL seconds and encoding each delta
+once for all its subscribers; it stops with its last subscriber. A client that
+falls LIVE_PUSH_QUEUE_SIZE messages behind is disconnected (close code 1013) and
+should reconnect and resubscribe with ``since`` set to the last bar it received.
+"""
+import asyncio
+import json
+
+import pandas as pd
+from django.conf import settings
+
+from .utils import build_stock_payload, live_bar_stats, load_price_data
+
+LIVE_INTERVALS = {"1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d"}
+# Enough recent bars for every delta; the full series stays with /api/stockdata/.
+LIVE_PERIOD = "5d"
+
+
+def bars_message(ticker, interval, price_data, shares_outstanding, first_row, live=None):
+    """Encode the bars of ``price_data`` from ``first_row`` on as one "bars" message."""
+    # Built over the whole frame so pct_change of the first delta bar is relative
+    # to the bar before it, as in /api/stockdata/.
+    payload = build_stock_payload(price_data, shares_outstanding)
+    return json.dumps({
+        "type": "bars",
+        "ticker": ticker,
+        "interval": interval,
+        "timestamps": [time.isoformat() for time in price_data.index[first_row:]],
+        "time_series": payload["time_series"][first_row:],
+        "fin_data": payload["fin_data"][first_row:],
+        "live": live,
+    }, default=str)
+
+
+class TickerFeed:
+    """One poller for a (ticker, interval), fanning its deltas out to subscribers."""
+
+    def __init__(self, ticker, interval):
+        self.ticker = ticker
+        self.interval = interval
+        self.subscribers = set()
+        self.price_data = None
+        self.shares_outstanding = None
+        self.ready = asyncio.Event()  # Set once the first load finished
+        self.task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"⚠️ Live feed {self.ticker} {self.interval} failed: {e}")
+            self.ready.set()
+            await asyncio.sleep(settings.LIVE_PUSH_INTERVAL)
+
+    async def refresh(self):
+        """Load the latest bars and publish whatever changed since the last load."""
+        price_data, shares_outstanding = await load_price_data(self.ticker, LIVE_PERIOD, self.interval)
+        if price_data is None or price_data.empty:
+            return
+        first_row = self._first_changed_row(price_data)
+        self.price_data, self.shares_outstanding = price_data, shares_outstanding
+        if first_row is None:
+            return
+        live = await live_bar_stats(self.ticker, self.interval, price_data)
+        self.publish(bars_message(self.ticker, self.interval, price_data, shares_outstanding, first_row, live))
+
+    def _first_changed_row(self, price_data):
+        previous = self.price_data
+        if previous is None:
+            return None  # Subscribers get their starting bars from ``since``.
+        last = previous.index[-1]
+        first_row = int(price_data.index.searchsorted(last))
+        if first_row < len(price_data) and price_data.index[first_row] == last:
+            # The previous last bar may have been still forming.
+            if price_data["Close"].iloc[first_row] == previous["Close"].iloc[-1] and \
+                    price_data["Volume"].iloc[first_row] == previous["Volume"].iloc[-1]:
+                first_row += 1
+        return first_row if first_row < len(price_data) else None
+
+    def publish(self, text):
+        for subscriber in list(self.subscribers):
+            subscriber.deliver(text)
+
+    def since(self, timestamp):
+        """A "bars" message with the held bars after ``timestamp``, or None."""
+        if self.price_data is None:
+            return None
+        first_row = int(self.price_data.index.searchsorted(timestamp, side="right"))
+        if first_row >= len(self.price_data):
+            return None
+        return bars_message(self.ticker, self.interval, self.price_data, self.shares_outstanding, first_row)
+
+
+# (ticker, interval) -> TickerFeed for this process
+_feeds = {}
+
+
+def subscribe(subscriber, ticker, interval):
+    """
+    Add ``subscriber`` to the feed of (ticker, interval), starting the feed's poller
+    if needed. Returns at once; ``feed.ready`` is set after the feed's first load.
+    """
+    key = (ticker, interval)
+    feed = _feeds.get(key)
+    if feed is None:
+        feed = _feeds[key] = TickerFeed(ticker, interval)
+    feed.subscribers.add(subscriber)
+    return feed
+
+
+async def send_since(subscriber, feed, since):
+    """Deliver the feed's bars after ``since`` to ``subscriber`` once the first load is done."""
+    # The first load only sets the baseline for deltas (and serves ``since``).
+    await feed.ready.wait()
+    if subscriber in feed.subscribers:
+        backlog = feed.since(since)
+        if backlog is not None:
+            subscriber.deliver(backlog)
+
+
+def unsubscribe(subscriber, ticker, interval):
+    """Remove ``subscriber``; the feed's poller stops with its last subscriber."""
+    key = (ticker, interval)
+    feed = _feeds.get(key)
+    if feed is None:
+        return
+    feed.subscribers.discard(subscriber)
+    if not feed.subscribers:
+        feed.task.cancel()
+        del _feeds[key]
+
+
+def active_feeds():
+    return {f"{ticker}:{interval}": len(feed.subscribers) for (ticker, interval), feed in _feeds.items()}
+
+
+class Subscriber:
+    """One WebSocket connection: the feeds it follows and its outgoing queue."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_PUSH_QUEUE_SIZE)
+        self.feeds = set()
+        self.tasks = set()  # Pending ``since`` deliveries
+
+    def start(self, coroutine):
+        """Run ``coroutine`` without holding up the receive loop; cancelled with the connection."""
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def deliver(self, text):
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            # Too far behind: drop what is queued and close the connection instead.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def close_all(self):
+        for task in list(self.tasks):
+            task.cancel()
+        for ticker, interval in list(self.feeds):
+            unsubscribe(self, ticker, interval)
+        self.feeds.clear()
+
+
+def _origin_allowed(scope):
+    headers = dict(scope.get("headers", []))
+    origin = headers.get(b"origin")
+    return origin is None or origin.decode("latin-1") in settings.CORS_ALLOWED_ORIGINS
+
+
+def _handle(subscriber, text):
+    try:
+        message = json.loads(text)
+        if not isinstance(message, dict):
+            raise TypeError("not an object")
+        action = message["action"]
+        ticker = str(message["ticker"]).strip().upper()
+        interval = message.get("interval", "1d")
+    except (ValueError, KeyError, TypeError):
+        return {"type": "error", "error": "Expected {\"action\", \"ticker\", \"interval\"}"}
+    if not ticker or not isinstance(interval, str) or interval not in LIVE_INTERVALS:
+        return {"type": "error", "error": f"Unsupported ticker or interval: {ticker} {interval}"}
+
+    if action == "unsubscribe":
+        subscriber.feeds.discard((ticker, interval))
+        unsubscribe(subscriber, ticker, interval)
+        return None
+    if action != "subscribe":
+        return {"type": "error", "error": f"Unknown action: {action}"}
+    if (ticker, interval) not in subscriber.feeds and len(subscriber.feeds) >= settings.LIVE_PUSH_MAX_SUBSCRIPTIONS:
+        return {"type": "error", "error": f"At most {settings.LIVE_PUSH_MAX_SUBSCRIPTIONS} subscriptions per connection"}
+
+    since = None
+    if message.get("since"):
+        try:
+            since = pd.Timestamp(message["since"])
+            if since.tzinfo is None:
+                since = since.tz_localize("UTC")
+        except (ValueError, TypeError):
+            return {"type": "error", "error": f"Invalid since: {message['since']}"}
+
+    subscriber.feeds.add((ticker, interval))
+    feed = subscribe(subscriber, ticker, interval)
+    if since is not None:
+        # A cold feed's first load can take a while; keep reading messages meanwhile.
+        subscriber.start(send_since(subscriber, feed, since))
+    return None
+
+
+async def websocket_application(scope, receive, send):
+    """Raw ASGI WebSocket handler for /ws/stockdata/."""
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if not _origin_allowed(scope):
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    await send({"type": "websocket.accept"})
+
+    subscriber = Subscriber()
+
+    async def send_loop():
+        while True:
+            text = await subscriber.queue.get()
+            if text is None:
+                await send({"type": "websocket.close", "code": 1013})
+                return
+            await send({"type": "websocket.send", "text": text})
+
+    sender = asyncio.get_running_loop().create_task(send_loop())
+    receiver = None
+    try:
+        while True:
+            receiver = asyncio.get_running_loop().create_task(receive())
+            done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                return  # Closed for falling behind (or the send failed).
+            message = receiver.result()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message["type"] == "websocket.receive" and message.get("text"):
+                reply = _handle(subscriber, message["text"])
+                if reply is not None:
+                    subscriber.deliver(json.dumps(reply))
+    finally:
+        subscriber.close_all()
+        sender.cancel()
+        if receiver is not None and not receiver.done():
+            receiver.cancel()
@@ -0,0 +1,93 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from stockdata.utils import build_stock_payload
+
+
+def legacy_build_stock_payload(price_data, shares_outstanding):
+    """
+    The original row-by-row implementation of ``build_stock_payload``, kept as the
+    reference the vectorized version is checked and timed against.
+    """
+    from django.utils import timezone
+
+    time_series = []
+    fin_data = []
+
+    price_data = price_data.copy()
+    price_data['pct_change'] = price_data['Close'].pct_change().fillna(0) * 100
+
+    for timestamp, row in price_data.iterrows():
+        dt = timestamp.to_pydatetime()
+        if dt.tzinfo is None:
+            dt = timezone.make_aware(dt, timezone.utc)
+        time_str = dt.strftime("%Y-%m-%d")
+
+        time_series.append({
+            "time": time_str,
+            "close_price": round(float(row['Close']), 2),
+            "volume": int(row['Volume'])
+        })
+
+        if shares_outstanding:
+            market_cap = float(row['Close']) * shares_outstanding
+        else:
+            market_cap = None
+
+        fin_data.append({
+            "time": time_str,
+            "free_cash_flow": 0.0,
+            "eps": None,
+            "profit_margin": None,
+            "market_cap": round(market_cap, 2) if market_cap else None,
+            "pct_change": round(float(row['pct_change']), 2),
+            "pe": 0.0
+        })
+
+    return {
+        "time_series": time_series,
+        "fin_data": fin_data
+    }
+
+
+def synthetic_bars(size, seed=0):
+    """A random-walk daily price frame shaped like ``ticker.history`` output."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("1980-01-01", periods=size, freq="h", tz="America/New_York", name="Date")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size)))
+    return pd.DataFrame({"Close": close, "Volume": rng.integers(1_000, 10_000_000, size)}, index=index)
+
+
+class Command(BaseCommand):
+    help = "Time the vectorized /api/stockdata/ payload builder against the row-by-row original."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        shares_outstanding = 15_000_000_000
+        self.stdout.write(f"{'bars':>8} {'iterrows (s)':>14} {'vectorized (s)':>16} {'speedup':>9}")
+        for size in options["sizes"]:
+            price_data = synthetic_bars(size)
+            legacy = self._best_of(options["repeat"], legacy_build_stock_payload, price_data, shares_outstanding)
+            vectorized = self._best_of(options["repeat"], build_stock_payload, price_data, shares_outstanding)
+
+            expected = json.dumps(legacy_build_stock_payload(price_data, shares_outstanding))
+            actual = json.dumps(build_stock_payload(price_data, shares_outstanding))
+            if expected != actual:
+                self.stderr.write(f"Output mismatch at {size} bars")
+
+            self.stdout.write(f"{size:>8} {legacy:>14.4f} {vectorized:>16.4f} {legacy / vectorized:>8.1f}x")
+
+    def _best_of(self, repeat, func, *args):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
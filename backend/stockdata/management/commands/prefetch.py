@@ -0,0 +1,28 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from stockdata.prefetch import default_jobs, run_all_once, run_scheduler
+
+
+class Command(BaseCommand):
+    help = "Keep bars and metadata for PREFETCH_TICKERS, and the market index data, refreshed in the background."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run every job once and exit.")
+        parser.add_argument("--tickers", nargs="+", help="Override PREFETCH_TICKERS.")
+
+    def handle(self, *args, **options):
+        tickers = [t.upper() for t in options["tickers"]] if options["tickers"] else None
+        jobs = default_jobs(tickers)
+
+        if options["once"]:
+            results = asyncio.run(run_all_once(jobs))
+            for name, error in results.items():
+                self.stdout.write(f"{name}: {'failed: ' + str(error) if error else 'ok'}")
+            return
+
+        try:
+            asyncio.run(run_scheduler(jobs))
+        except KeyboardInterrupt:
+            pass
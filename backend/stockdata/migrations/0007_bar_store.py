@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-16 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stockdata', '0006_remove_stockdata_dividends_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=32)),
+                ('interval', models.CharField(max_length=8)),
+                ('covered_from', models.DateTimeField(null=True)),
+                ('full_history', models.BooleanField(default=False)),
+                ('timezone', models.CharField(default='UTC', max_length=64)),
+                ('shares_outstanding', models.BigIntegerField(default=None, null=True)),
+                ('last_refreshed', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='interval',
+            field=models.CharField(default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='ticker',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='stockdata',
+            name='timestamp',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddConstraint(
+            model_name='stockdata',
+            constraint=models.UniqueConstraint(fields=('ticker', 'interval', 'timestamp'), name='unique_bar'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockseries',
+            constraint=models.UniqueConstraint(fields=('ticker', 'interval'), name='unique_series'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-17 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stockdata', '0007_bar_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeriesFeatures',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=32)),
+                ('interval', models.CharField(max_length=8)),
+                ('dirty_from', models.DateTimeField(null=True)),
+                ('revision', models.IntegerField(default=0)),
+                ('garch_params', models.JSONField(null=True)),
+                ('garch_extended_bars', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='garch_volatility',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='volatility_21',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='volatility_5',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockdata',
+            name='volatility_63',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='seriesfeatures',
+            constraint=models.UniqueConstraint(fields=('ticker', 'interval'), name='unique_series_features'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 
 class StockData(models.Model):
-    timestamp = models.DateTimeField(unique=True)
+    ticker = models.CharField(max_length=32, default="")
+    interval = models.CharField(max_length=8, default="")
+    timestamp = models.DateTimeField()
     open_price = models.FloatField(null=True)
     high_price = models.FloatField(null=True)
     low_price = models.FloatField(null=True)
@@ -13,6 +15,61 @@ class StockData(models.Model):
     profit_margin = models.FloatField(null=True, blank=True, default=None)
     market_cap = models.FloatField(default=None, null=True)
     pe = models.FloatField(default=None,null=True)
+    # Derived series (see stockdata/features.py); pct_change above is the return.
+    volatility_5 = models.FloatField(null=True, default=None)
+    volatility_21 = models.FloatField(null=True, default=None)
+    volatility_63 = models.FloatField(null=True, default=None)
+    garch_volatility = models.FloatField(null=True, default=None)
+
+    class Meta:
+        # One bar per (ticker, interval, timestamp); the constraint doubles as the
+        # index used to read a series back in timestamp order.
+        constraints = [
+            models.UniqueConstraint(fields=["ticker", "interval", "timestamp"], name="unique_bar"),
+        ]
+
+    def __str__(self):
+        return f"{self.ticker} {self.interval} {self.timestamp} - Close: {self.close_price}"
+
+
+class StockSeries(models.Model):
+    """
+    Bookkeeping for one (ticker, interval) series in the bar store: how far back the
+    stored bars are complete and when the series was last refreshed from Yahoo.
+    """
+    ticker = models.CharField(max_length=32)
+    interval = models.CharField(max_length=8)
+    covered_from = models.DateTimeField(null=True)  # Bars are complete from here onward
+    full_history = models.BooleanField(default=False)  # True once period="max" was fetched
+    timezone = models.CharField(max_length=64, default="UTC")  # Exchange timezone of the bars
+    shares_outstanding = models.BigIntegerField(null=True, default=None)
+    last_refreshed = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ticker", "interval"], name="unique_series"),
+        ]
+
+    def __str__(self):
+        return f"{self.ticker} {self.interval}"
+
+
+class SeriesFeatures(models.Model):
+    """
+    Bookkeeping for the derived columns of one (ticker, interval) series in the bar
+    store: from which bar they are out of date, and the GARCH fit they extend.
+    """
+    ticker = models.CharField(max_length=32)
+    interval = models.CharField(max_length=8)
+    dirty_from = models.DateTimeField(null=True)  # Bars from here on need their features recomputed
+    revision = models.IntegerField(default=0)  # Bumped whenever bars are stored
+    garch_params = models.JSONField(null=True)  # [mu, omega, alpha[1], beta[1]] of the last full fit
+    garch_extended_bars = models.IntegerField(default=0)  # Bars added since that fit
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ticker", "interval"], name="unique_series_features"),
+        ]
 
     def __str__(self):
-        return f"{self.timestamp} - Close: {self.close_price}"
\ No newline at end of file
+        return f"{self.ticker} {self.interval} features"
@@ -0,0 +1,168 @@
+# stockdata/prefetch.py
+"""
+Background refresh of popular data, so user requests for it are served warm.
+
+Jobs (built by ``default_jobs`` from settings):
+    bars:<TICKER>      load_price_data for every (period, interval) in PREFETCH_SERIES,
+                       keeping the bar store fresh
+    metadata:<TICKER>  get_stock_metadata_info into the "default" cache
+                       (see cached_stock_metadata)
+    market             fetch_and_store_market_data for MARKET_INDEX_SYMBOL (^GSPC)
+
+Every job reruns after its interval, stretched or shrunk at random by up to
+PREFETCH_JITTER so jobs (and several server processes) do not fire in lockstep.
+A failing job backs off exponentially, up to PREFETCH_MAX_BACKOFF seconds, and at
+most PREFETCH_CONCURRENCY jobs run at once.
+
+Run it as its own process with ``python manage.py prefetch``, or inside every
+server process with PREFETCH_IN_PROCESS (see stockcompass/asgi.py). The bar store
+and the market data store are shared either way; warmed metadata is only shared
+between processes when the "default" cache is.
+"""
+import asyncio
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from newsdata.market_direction import fetch_and_store_market_data
+from .utils import coalesced, load_price_data, get_stock_metadata_info, refresh_in_background
+
+
+def metadata_key(ticker_symbol):
+    return f"stock-metadata:{ticker_symbol.upper()}"
+
+
+async def cached_stock_metadata(ticker_symbol):
+    """
+    get_stock_metadata_info, served from the "default" cache.
+
+    An entry is fresh for STOCKDATA_METADATA_TTL seconds. For
+    STOCKDATA_METADATA_STALE_SECONDS after that it is still served as is while a
+    background download replaces it; past that a request waits for the download.
+    Concurrent misses share one download.
+
+    Returns:
+        tuple: (metadata dict, datetime it was downloaded)
+    """
+    key = metadata_key(ticker_symbol)
+
+    async def cached_or_refresh():
+        # Re-checked here: another process may have filled the cache while this
+        # one waited for its lock.
+        entry = caches["default"].get(key)
+        return entry if entry is not None else await refresh_metadata(ticker_symbol)
+
+    entry = caches["default"].get(key)
+    if entry is None:
+        entry = await coalesced(key, cached_or_refresh)
+    elif (timezone.now() - entry["fetched_at"]).total_seconds() >= settings.STOCKDATA_METADATA_TTL:
+        refresh_in_background(key, lambda: refresh_metadata(ticker_symbol))
+    return entry["data"], entry["fetched_at"]
+
+
+async def refresh_metadata(ticker_symbol):
+    """Download the metadata into the cache; returns the {"data", "fetched_at"} entry."""
+    entry = {"data": await get_stock_metadata_info(ticker_symbol), "fetched_at": timezone.now()}
+    caches["default"].set(metadata_key(ticker_symbol), entry,
+                          settings.STOCKDATA_METADATA_TTL + settings.STOCKDATA_METADATA_STALE_SECONDS)
+    return entry
+
+
+async def refresh_bars(ticker_symbol):
+    for period, interval in settings.PREFETCH_SERIES:
+        price_data, _ = await load_price_data(ticker_symbol, period, interval)
+        if price_data is None:
+            raise ValueError(f"No data found for {ticker_symbol} ({period}, {interval})")
+
+
+async def refresh_market_data():
+    await fetch_and_store_market_data(index_symbol=settings.MARKET_INDEX_SYMBOL)
+
+
+class Job:
+    """A coroutine function rerun every ``interval`` seconds."""
+
+    def __init__(self, name, interval, func, *args):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.failures = 0  # Consecutive failures, drives the backoff
+
+    async def run(self):
+        return await self.func(*self.args)
+
+    def next_delay(self, rng=random):
+        """Seconds until the next run: the interval (doubled per consecutive failure, capped) with jitter."""
+        delay = self.interval
+        if self.failures:
+            delay = min(self.interval * 2 ** self.failures, max(settings.PREFETCH_MAX_BACKOFF, self.interval))
+        jitter = settings.PREFETCH_JITTER
+        return delay * rng.uniform(1 - jitter, 1 + jitter)
+
+    def __repr__(self):
+        return f"Job({self.name!r}, every {self.interval}s)"
+
+
+def default_jobs(tickers=None):
+    """The jobs for ``tickers`` (default PREFETCH_TICKERS) plus the market index job."""
+    jobs = []
+    for ticker_symbol in settings.PREFETCH_TICKERS if tickers is None else tickers:
+        jobs.append(Job(f"bars:{ticker_symbol}", settings.PREFETCH_BARS_INTERVAL, refresh_bars, ticker_symbol))
+        jobs.append(Job(f"metadata:{ticker_symbol}", settings.PREFETCH_METADATA_INTERVAL, refresh_metadata, ticker_symbol))
+    jobs.append(Job("market", settings.PREFETCH_MARKET_INTERVAL, refresh_market_data))
+    return jobs
+
+
+async def run_job_once(job, limit=None):
+    """Run ``job`` once, recording success or failure. Returns the exception or None."""
+    try:
+        if limit is None:
+            await job.run()
+        else:
+            async with limit:
+                await job.run()
+    except Exception as e:
+        job.failures += 1
+        print(f"⚠️ Prefetch {job.name} failed ({job.failures} in a row): {e}")
+        return e
+    job.failures = 0
+    return None
+
+
+async def _stopped_within(stop, delay):
+    """Sleep up to ``delay`` seconds; True if ``stop`` was set meanwhile."""
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def _job_loop(job, stop, limit, rng):
+    # Spread the first runs out instead of starting every job at once.
+    if await _stopped_within(stop, rng.uniform(0, job.interval * settings.PREFETCH_JITTER)):
+        return
+    while True:
+        await run_job_once(job, limit)
+        if await _stopped_within(stop, job.next_delay(rng)):
+            return
+
+
+async def run_scheduler(jobs=None, stop=None, rng=random):
+    """Run ``jobs`` (default: ``default_jobs()``) until ``stop`` is set."""
+    jobs = default_jobs() if jobs is None else jobs
+    stop = asyncio.Event() if stop is None else stop
+    limit = asyncio.Semaphore(settings.PREFETCH_CONCURRENCY)
+    print(f"🔄 Prefetching {len(jobs)} jobs")
+    await asyncio.gather(*[_job_loop(job, stop, limit, rng) for job in jobs])
+
+
+async def run_all_once(jobs=None):
+    """Run every job once, concurrently up to PREFETCH_CONCURRENCY. Returns {name: exception or None}."""
+    jobs = default_jobs() if jobs is None else jobs
+    limit = asyncio.Semaphore(settings.PREFETCH_CONCURRENCY)
+    results = await asyncio.gather(*[run_job_once(job, limit) for job in jobs])
+    return {job.name: error for job, error in zip(jobs, results)}
@@ -0,0 +1,99 @@
+# stockdata/renderers.py
+import json
+import struct
+
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+def columns_to_lists(columns):
+    """Convert NumPy columns to JSON-safe lists (dates as strings, NaN as null)."""
+    encoded = {}
+    for name, values in columns.items():
+        if values.dtype.kind == "M":
+            encoded[name] = values.astype(str).tolist()
+        elif values.dtype.kind == "f":
+            encoded[name] = [None if value != value else value for value in values.tolist()]
+        else:
+            encoded[name] = values.tolist()
+    return encoded
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Selected with ``?format=columnar``. Renders payloads built by
+    ``build_columnar_payload`` as one JSON array per column.
+    """
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and "columns" in data:
+            data = {**data, "format": self.format, "columns": columns_to_lists(data["columns"])}
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class PackedColumnsRenderer(BaseRenderer):
+    """
+    Selected with ``?format=binary``. Renders columnar payloads as packed
+    little-endian arrays:
+
+        b"SCP1" | uint32 header length | UTF-8 JSON header | padding | column buffers
+
+    The header carries every non-column field of the payload plus a ``columns``
+    list of {"name", "dtype", "offset", "length"}. Offsets are relative to the
+    first byte after the header padding and every buffer starts on an 8-byte
+    boundary. ``dtype`` is one of "float64", "int64" or "date32" (int32 days since
+    1970-01-01). Payloads without columns (errors) are sent as a header only.
+    """
+    media_type = "application/vnd.stockcompass.columns"
+    format = "binary"
+    charset = None
+    render_style = "binary"
+
+    MAGIC = b"SCP1"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        header = {key: value for key, value in data.items() if key != "columns"}
+        header["format"] = self.format
+        header["columns"] = []
+        buffers = []
+        offset = 0
+        for name, values in data.get("columns", {}).items():
+            if values.dtype.kind == "M":
+                array, dtype = values.astype("datetime64[D]").astype("<i4"), "date32"
+            elif values.dtype.kind in "iu":
+                array, dtype = values.astype("<i8"), "int64"
+            else:
+                array, dtype = values.astype("<f8"), "float64"
+            raw = array.tobytes()
+            header["columns"].append({"name": name, "dtype": dtype, "offset": offset, "length": len(array)})
+            padding = -len(raw) % 8
+            buffers.append(raw + b"\0" * padding)
+            offset += len(raw) + padding
+
+        encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        prefix = self.MAGIC + struct.pack("<I", len(encoded_header)) + encoded_header
+        prefix += b"\0" * (-len(prefix) % 8)
+        return prefix + b"".join(buffers)
+
+
+def unpack_columns(content):
+    """Decode a ``PackedColumnsRenderer`` body into (header, {name: np.ndarray})."""
+    if content[:4] != PackedColumnsRenderer.MAGIC:
+        raise ValueError("Not a packed columns payload")
+    (header_length,) = struct.unpack("<I", content[4:8])
+    header = json.loads(content[8:8 + header_length])
+    start = 8 + header_length
+    start += -start % 8
+    dtypes = {"float64": "<f8", "int64": "<i8", "date32": "<i4"}
+    columns = {}
+    for column in header["columns"]:
+        values = np.frombuffer(content, dtype=dtypes[column["dtype"]], count=column["length"],
+                               offset=start + column["offset"])
+        if column["dtype"] == "date32":
+            values = values.astype("datetime64[D]")
+        columns[column["name"]] = values
+    return header, columns
@@ -0,0 +1,149 @@
+# stockdata/rolling.py
+"""
+Incremental statistics over a stream of bars, each update O(1):
+
+    RollingMoments   mean and variance over the last N values (Welford's update,
+                     with the value leaving the window removed the same way)
+    EWMAVolatility   exponentially weighted volatility (RiskMetrics)
+    garch_step       one step of the GARCH(1,1) variance recursion
+    LiveBarStats     the three combined over a series' returns, advanced one
+                     completed bar at a time
+
+Nothing here touches Django, so states can be pickled into a cache.
+"""
+import math
+from collections import deque
+
+
+class RollingMoments:
+    """Mean and sample variance of the last ``window`` values pushed."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations from the mean
+
+    def __len__(self):
+        return len(self.values)
+
+    def push(self, value):
+        self.values.append(value)
+        count = len(self.values)
+        delta = value - self.mean
+        self.mean += delta / count
+        self._m2 += delta * (value - self.mean)
+        if count > self.window:
+            old = self.values.popleft()
+            count -= 1
+            delta = old - self.mean
+            self.mean -= delta / count
+            # Rounding can push the sum slightly below zero for a constant window.
+            self._m2 = max(self._m2 - delta * (old - self.mean), 0.0)
+
+    @property
+    def variance(self):
+        return self._m2 / (len(self.values) - 1) if len(self.values) > 1 else None
+
+    @property
+    def std(self):
+        variance = self.variance
+        return None if variance is None else math.sqrt(variance)
+
+    def zscore(self, value):
+        """How many standard deviations ``value`` lies from the window's mean; None
+        until the window is full or when it has no spread."""
+        std = self.std
+        if len(self.values) < self.window or not std:
+            return None
+        return (value - self.mean) / std
+
+
+class EWMAVolatility:
+    """
+    sigma2[t] = lam * sigma2[t-1] + (1 - lam) * r[t-1] ** 2, started from the first
+    squared value. ``volatility`` is the forecast for the next value.
+    """
+
+    def __init__(self, lam=0.94):
+        self.lam = lam
+        self.variance = None
+
+    def push(self, value):
+        if self.variance is None:
+            self.variance = value * value
+        else:
+            self.variance = self.lam * self.variance + (1 - self.lam) * value * value
+
+    @property
+    def volatility(self):
+        return None if self.variance is None else math.sqrt(self.variance)
+
+
+def garch_step(params, variance, change):
+    """
+    The next conditional variance of the GARCH(1,1) recursion used in garch.py:
+
+        sigma2[t] = omega + alpha * (y[t-1] - mu) ** 2 + beta * sigma2[t-1]
+    """
+    mu, omega, alpha, beta = params
+    return omega + alpha * (change - mu) ** 2 + beta * variance
+
+
+class LiveBarStats:
+    """
+    Return statistics of one price series, advanced with ``push`` for every bar
+    once it is complete. ``evaluate`` scores a bar against them without pushing
+    it, so the still-forming last bar can be checked on every request.
+
+    Returns are close-to-close changes in percent. The GARCH part needs the
+    parameters of an earlier fit and the conditional variance of the first price
+    change to come (that of the bar after the first one pushed); without them only
+    the rolling and EWMA parts are kept.
+    """
+
+    def __init__(self, window=30, ewma_lambda=0.94, garch_params=None, garch_variance=None):
+        self.returns = RollingMoments(window)
+        self.ewma = EWMAVolatility(ewma_lambda)
+        self.garch_params = garch_params
+        self.garch_variance = garch_variance if garch_params is not None else None
+        self.last_time = None
+        self.last_close = None
+
+    def push(self, time, close):
+        if self.last_close is not None:
+            pct_change = (close / self.last_close - 1) * 100
+            self.returns.push(pct_change)
+            self.ewma.push(pct_change)
+            if self.garch_variance is not None:
+                self.garch_variance = garch_step(self.garch_params, self.garch_variance, close - self.last_close)
+        self.last_time = time
+        self.last_close = close
+
+    def evaluate(self, close, z_threshold=1.96):
+        """
+        Statistics of a bar closing at ``close`` right after the pushed ones. It is
+        flagged as an anomaly when its return is more than ``z_threshold`` standard
+        deviations from the rolling mean and its move exceeds ``z_threshold`` times
+        the conditional volatility (GARCH when available, EWMA otherwise), the same
+        two tests unusual_ranges combines.
+        """
+        pct_change = (close / self.last_close - 1) * 100
+        change = close - self.last_close
+        zscore = self.returns.zscore(pct_change)
+        ewma_volatility = self.ewma.volatility
+        garch_volatility = None if self.garch_variance is None else math.sqrt(self.garch_variance)
+        if garch_volatility is not None:
+            beyond_volatility = abs(change) > z_threshold * garch_volatility
+        else:
+            beyond_volatility = ewma_volatility is not None and abs(pct_change) > z_threshold * ewma_volatility
+        return {
+            "pct_change": pct_change,
+            "zscore": zscore,
+            "rolling_mean": self.returns.mean if len(self.returns) else None,
+            "rolling_volatility": self.returns.std,
+            "ewma_volatility": ewma_volatility,
+            "garch_volatility": garch_volatility,
+            "anomaly": bool(zscore is not None and abs(zscore) > z_threshold and beyond_volatility),
+            "window_full": len(self.returns) >= self.returns.window,
+        }
@@ -1,3 +1,962 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone as django_timezone
+
+from newsdata.market_direction import load_market_series
+from .models import StockData, StockSeries, SeriesFeatures
+from .utils import (load_price_data, fetch_and_process_stock_data, build_stock_payload, get_stock_metadata_info,
+                    unusual_ranges, update_features, update_features_in_background)
+
+
+def setUpModule():
+    # Features are updated in the background after bars are stored. Once a test
+    # request's event loop is gone that update could still be writing, racing the
+    # next test on the SQLite test database, so tests that need features run
+    # update_features themselves.
+    patcher = mock.patch("stockdata.utils.update_features_in_background")
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+
+
+def make_bars(start, periods, freq="D", tz="America/New_York", seed=0):
+    """Build a yfinance-style history frame."""
+    index = pd.date_range(start, periods=periods, freq=freq, tz=tz, name="Date")
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, periods))
+    return pd.DataFrame({
+        "Open": close - 0.5,
+        "High": close + 1,
+        "Low": close - 1,
+        "Close": close,
+        "Volume": rng.integers(1_000, 10_000, periods),
+        "Dividends": 0.0,
+        "Stock Splits": 0.0,
+    }, index=index)
+
+
+class FakeTicker:
+    """Stands in for yf.Ticker, serving slices of a fixed history frame."""
+
+    def __init__(self, history):
+        self.full_history = history
+        self.calls = []
+        self.info = {"sharesOutstanding": 1_000}
+
+    def get_history_metadata(self):
+        self.calls.append({"metadata": True})
+        return {"currency": "USD", "fullExchangeName": "NasdaqGS", "longName": "Apple Inc."}
+
+    def history(self, period=None, interval=None, start=None):
+        self.calls.append({"period": period, "start": start})
+        if start is not None:
+            return self.full_history[self.full_history.index >= start]
+        return self.full_history
+
+
+class BarStoreTests(TransactionTestCase):
+    def setUp(self):
+        self.history = make_bars("2025-01-01", 40)
+        self.ticker = FakeTicker(self.history)
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, period="5d", interval="1d"):
+        return async_to_sync(load_price_data)("aapl", period, interval)
+
+    def test_orm_threads_close_their_connections(self):
+        from django.db import connections
+        from stockcompass.db import run_orm
+
+        def query():
+            StockSeries.objects.count()
+            return connections["default"]  # The executor thread's own connection
+        with mock.patch.object(type(connections["default"]), "close", autospec=True) as close:
+            thread_connection = async_to_sync(run_orm)(query)
+        self.assertIsNot(thread_connection, connections["default"])
+        # Checked before the query and closed after it (CONN_MAX_AGE is 0).
+        self.assertEqual([call.args[0] for call in close.call_args_list], [thread_connection])
+
+    def test_first_request_backfills_store(self):
+        price_data, shares = self.load(period="max")
+        self.assertEqual(len(price_data), 40)
+        self.assertEqual(shares, 1_000)
+        self.assertEqual(StockData.objects.filter(ticker="AAPL", interval="1d").count(), 40)
+        self.assertTrue(StockSeries.objects.get(ticker="AAPL", interval="1d").full_history)
+
+    @override_settings(STOCKDATA_BAR_REFRESH_SECONDS=3600)
+    def test_repeat_request_is_served_from_store(self):
+        self.load(period="max")
+        price_data, _ = self.load(period="5d")
+        self.assertEqual(len(self.ticker.calls), 1)
+        self.assertEqual(len(price_data), 5)
+        self.assertEqual(price_data.index[-1], self.history.index[-1])
+
+    @override_settings(STOCKDATA_BAR_REFRESH_SECONDS=0, STOCKDATA_STALE_SECONDS=0)
+    def test_refresh_only_fetches_new_bars(self):
+        self.ticker.full_history = self.history.iloc[:30]
+        self.load(period="max")
+        self.ticker.full_history = self.history
+        price_data, _ = self.load(period="max")
+        self.assertEqual(self.ticker.calls[-1]["start"], self.history.index[29])
+        self.assertEqual(len(price_data), 40)
+        np.testing.assert_allclose(price_data["Close"], self.history["Close"])
+
+    def test_uncovered_period_is_backfilled(self):
+        self.load(period="5d")
+        self.assertEqual(StockData.objects.count(), 40)  # FakeTicker ignores the period
+        series = StockSeries.objects.get(ticker="AAPL")
+        self.assertFalse(series.full_history)
+        self.load(period="max")
+        self.assertEqual(self.ticker.calls[-1]["period"], "max")
+
+    def test_processed_payload(self):
+        result = async_to_sync(fetch_and_process_stock_data)("AAPL", "max", "1d")
+        self.assertEqual(len(result["time_series"]), 40)
+        self.assertEqual(result["time_series"][0]["time"], "2025-01-01")
+        self.assertEqual(result["fin_data"][0]["pct_change"], 0.0)
+        self.assertEqual(result["fin_data"][0]["market_cap"], round(self.history["Close"].iloc[0] * 1_000, 2))
+
+
+class StockPayloadTests(SimpleTestCase):
+    def assertMatchesLegacy(self, price_data, shares_outstanding):
+        from .management.commands.benchmark_stock_payload import legacy_build_stock_payload
+        self.assertEqual(
+            json.dumps(build_stock_payload(price_data, shares_outstanding)),
+            json.dumps(legacy_build_stock_payload(price_data, shares_outstanding)),
+        )
+
+    def test_matches_row_by_row_output(self):
+        price_data = make_bars("2024-03-01", 500, freq="h")
+        self.assertMatchesLegacy(price_data, 15_000_000_000)
+        self.assertMatchesLegacy(price_data, None)
+
+    def test_rounding_ties_match_python_round(self):
+        price_data = make_bars("2024-01-01", 6)
+        price_data["Close"] = [1.005, 2.675, 0.125, 1.015, 8.345, 1e-3]
+        self.assertMatchesLegacy(price_data, 3)
+
+
+class StockDataFormatTests(TransactionTestCase):
+    def setUp(self):
+        self.history = make_bars("2020-01-01", 300)
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=FakeTicker(self.history))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        return self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "max", "interval": "1d", **params})
+
+    def test_columnar_matches_rows(self):
+        rows = self.get().json()
+        columnar = self.get(format="columnar").json()
+        self.assertEqual(columnar["length"], 300)
+        self.assertEqual(columnar["columns"]["time"], [row["time"] for row in rows["time_series"]])
+        self.assertEqual(columnar["columns"]["close_price"], [row["close_price"] for row in rows["time_series"]])
+        self.assertEqual(columnar["columns"]["market_cap"], [row["market_cap"] for row in rows["fin_data"]])
+        self.assertEqual(columnar["constants"], {"free_cash_flow": 0.0, "eps": None, "profit_margin": None, "pe": 0.0})
+
+    def test_binary_round_trip(self):
+        from .renderers import unpack_columns
+        rows = self.get().json()
+        response = self.get(format="binary")
+        self.assertEqual(response["Content-Type"], "application/vnd.stockcompass.columns")
+        header, columns = unpack_columns(response.content)
+        self.assertEqual(header["status_code"], 200)
+        self.assertEqual(columns["time"].astype(str).tolist(), [row["time"] for row in rows["time_series"]])
+        self.assertEqual(columns["volume"].tolist(), [row["volume"] for row in rows["time_series"]])
+        self.assertEqual(columns["pct_change"].tolist(), [row["pct_change"] for row in rows["fin_data"]])
+
+
+class StockMetadataTests(SimpleTestCase):
+    def test_changes_derived_from_one_history_download(self):
+        history = make_bars("2024-01-01", 400)
+        ticker = FakeTicker(history)
+        with mock.patch("stockdata.utils.yf.Ticker", return_value=ticker):
+            info = async_to_sync(get_stock_metadata_info)("AAPL")
+
+        self.assertEqual(len([call for call in ticker.calls if "period" in call]), 1)
+        self.assertEqual(info["longName"], "Apple Inc.")
+        self.assertEqual(info["lastClose"], history.index[-1].date())
+        # The same windows as period="1mo" / "1y" from the bar store.
+        closes = history["Close"]
+        year_start = closes[closes.index >= history.index[-1] - pd.DateOffset(years=1)].iloc[0]
+        self.assertAlmostEqual(info["yearly_pct_change"], closes.iloc[-1] / year_start - 1)
+        month_start = closes[closes.index >= history.index[-1] - pd.DateOffset(months=1)].iloc[0]
+        self.assertAlmostEqual(info["montly_pct_change"], closes.iloc[-1] / month_start - 1)
+
+
+def make_series(size=300, seed=1):
+    """A price series with a burst of volatility in the middle, as the frontend posts it."""
+    rng = np.random.default_rng(seed)
+    changes = rng.normal(0, 1, size)
+    changes[size // 2:size // 2 + 5] *= 12
+    times = pd.date_range("2023-01-02", periods=size, freq="D").strftime("%Y-%m-%d").tolist()
+    return {"time": times, "price": (200 + np.cumsum(changes)).tolist()}
+
+
+# Fits run in a thread here so that mocks on stockdata.garch can see them.
+@override_settings(STOCKDATA_PROCESS_POOL_WORKERS=0)
+class UnusualRangesCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["analytics"].clear()
+
+    def test_repeat_series_skips_garch_fit(self):
+        from . import garch
+        data = make_series()
+        with mock.patch("stockdata.garch.fit_conditional_volatility", wraps=garch.fit_conditional_volatility) as fit:
+            first = async_to_sync(unusual_ranges)(data)
+            second = async_to_sync(unusual_ranges)(data)
+            self.assertEqual(fit.call_count, 1)
+            self.assertEqual(first, second)
+            self.assertTrue(first)
+
+            changed = dict(data, price=[data["price"][0] + 1] + data["price"][1:])
+            async_to_sync(unusual_ranges)(changed)
+            self.assertEqual(fit.call_count, 2)
+
+
+@override_settings(STOCKDATA_PROCESS_POOL_WORKERS=0)
+class IncrementalGarchTests(SimpleTestCase):
+    def setUp(self):
+        caches["analytics"].clear()
+
+    def series(self, size):
+        data = make_series(320)
+        return {"time": data["time"][:size], "price": data["price"][:size]}
+
+    @override_settings(GARCH_EXTEND_MAX_BARS=5)
+    def test_appended_bars_reuse_previous_fit(self):
+        from . import garch
+        with mock.patch("stockdata.garch.fit_conditional_volatility", wraps=garch.fit_conditional_volatility) as fit:
+            async_to_sync(unusual_ranges)(self.series(300))
+            self.assertIsNone(fit.call_args.kwargs.get("starting_values"))
+
+            # A few new bars: no optimizer run at all.
+            async_to_sync(unusual_ranges)(self.series(303))
+            self.assertEqual(fit.call_count, 1)
+
+            # Past the threshold: refit, warm-started from the previous parameters.
+            async_to_sync(unusual_ranges)(self.series(310))
+            self.assertEqual(fit.call_count, 2)
+            self.assertIsNotNone(fit.call_args.kwargs["starting_values"])
+
+    def test_extension_matches_fixed_parameter_recursion(self):
+        from .garch import fit_conditional_volatility, extend_conditional_volatility, incremental_conditional_volatility
+        data = self.series(310)
+        times = np.array(data["time"], dtype="datetime64")
+        prices = np.array(data["price"])
+        _, state, _ = incremental_conditional_volatility(None, times[:300], prices[:300], 5)
+        forecast, _, mode = incremental_conditional_volatility(state, times[:305], prices[:305], 5)
+        self.assertEqual(mode, "extended")
+        np.testing.assert_allclose(forecast[:299], state["volatility"])
+        self.assertEqual(len(forecast), 304)
+
+        # Re-running the fitted model over the data reproduces its own volatility.
+        volatility, params = fit_conditional_volatility(np.diff(prices))
+        np.testing.assert_allclose(extend_conditional_volatility(params, np.diff(prices), volatility[:1]), volatility)
+
+
+class BatchUnusualRangesTests(TransactionTestCase):
+    def setUp(self):
+        caches["analytics"].clear()
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=FakeTicker(make_bars("2024-01-01", 250)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_streams_one_result_per_series(self):
+        response = self.client.post("/api/unusual_range/batch/", {
+            "series": {"first": make_series(seed=1), "second": make_series(seed=2), "short": {"time": ["2025-01-01"], "price": [1.0]}},
+            "tickers": ["AAPL"],
+            "period": "max",
+        }, content_type="application/json")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+        lines = [json.loads(line) for line in async_to_sync(read)().decode().splitlines()]
+        results = {line["name"]: line for line in lines}
+        self.assertEqual(set(results), {"first", "second", "short", "AAPL"})
+        self.assertEqual(results["AAPL"]["source"], "ticker")
+        self.assertEqual(results["first"]["source"], "series")
+        self.assertEqual(results["first"]["unusual_ranges"], [list(r) for r in async_to_sync(unusual_ranges)(make_series(seed=1))])
+        self.assertEqual(results["short"]["status_code"], 500)
+        self.assertIn(results["AAPL"]["status_code"], (200, 500))
+
+    @override_settings(STOCKDATA_PROCESS_POOL_WORKERS=1, STOCKDATA_MAX_PENDING_TASKS=2)
+    def test_batch_larger_than_pending_limit_waits_for_the_pool(self):
+        series = {f"series{seed}": make_series(seed=seed) for seed in range(5)}
+        response = self.client.post("/api/unusual_range/batch/", {"series": series}, content_type="application/json")
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+        lines = [json.loads(line) for line in async_to_sync(read)().decode().splitlines()]
+        self.assertEqual(sorted(line["name"] for line in lines), sorted(series))
+        self.assertTrue(all(line["status_code"] == 200 for line in lines), lines)
+
+    def test_ticker_fits_run_concurrently_on_sqlite(self):
+        from . import utils
+        running, peak = [0], [0]
+
+        async def slow_fit(data, wait_for_slot=False):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.3)
+            running[0] -= 1
+            return []
+
+        async def run():
+            return [result async for result in utils.batch_unusual_ranges(tickers=["AAPL", "MSFT", "TSLA"], period="max")]
+
+        for ticker in ("AAPL", "MSFT", "TSLA"):
+            async_to_sync(load_price_data)(ticker, "max", "1d")
+        self.assertEqual(utils.batch_concurrency(), 1)  # Loads are serialized on SQLite...
+        with mock.patch("stockdata.utils.unusual_ranges", side_effect=slow_fit):
+            results = async_to_sync(run)()
+        self.assertTrue(all(result["status_code"] == 200 for result in results), results)
+        self.assertGreater(peak[0], 1)  # ...but not the fits.
+
+    def test_rejects_oversized_batches(self):
+        with override_settings(STOCKDATA_BATCH_MAX_SERIES=1):
+            response = self.client.post("/api/unusual_range/batch/", {"tickers": ["AAPL", "MSFT"]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_ticker_ranges_are_fitted_over_the_requested_period(self):
+        from .utils import series_for_ticker, ticker_unusual_ranges
+
+        def outcome(func, *args):
+            caches["analytics"].clear()
+            try:
+                return async_to_sync(func)(*args)
+            except Exception as e:
+                return str(e)
+
+        async_to_sync(load_price_data)("AAPL", "max", "1d")  # Someone charted the whole history first.
+        series = async_to_sync(series_for_ticker)("AAPL", "60d", "1d")
+        self.assertEqual(len(series["price"]), 60)
+        posted = {"time": series["time"], "price": series["price"]}
+        self.assertEqual(outcome(ticker_unusual_ranges, "AAPL", "60d", "1d"), outcome(unusual_ranges, posted))
+
+    def test_rejects_null_series(self):
+        response = self.client.post("/api/unusual_range/batch/", {"series": {"AAPL": None}}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ProcessPoolTests(SimpleTestCase):
+    def setUp(self):
+        caches["analytics"].clear()
+
+    def test_task_timeout(self):
+        import time
+        from .executor import run_in_process
+        with self.assertRaises(TimeoutError):
+            async_to_sync(run_in_process)(time.sleep, 5, timeout=0.2)
+
+    @override_settings(STOCKDATA_MAX_PENDING_TASKS=1)
+    def test_waiting_caller_gets_the_next_free_slot(self):
+        from . import executor
+
+        async def run():
+            with self.assertRaises(executor.PoolSaturated):
+                await executor._reserve_slot(0)
+
+            async def other_task_finishes():
+                await asyncio.sleep(0.1)
+                executor._task_done(None)
+            asyncio.get_running_loop().create_task(other_task_finishes())
+            await executor._reserve_slot(5)
+            return executor.pending_tasks()
+
+        # One task pending; restored to the real count afterwards.
+        with mock.patch.object(executor, "_pending", 1):
+            self.assertEqual(async_to_sync(run)(), 1)
+
+    @override_settings(STOCKDATA_MAX_PENDING_TASKS=0)
+    def test_saturated_pool_refuses_work(self):
+        response = self.client.post("/api/unusual_range/", {"data": make_series()}, content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+
+
+class PrefetchTests(TransactionTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.ticker = FakeTicker(make_bars("2024-01-01", 400))
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.market_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.market_dir)
+
+    def test_run_once_warms_bars_metadata_and_market_data(self):
+        from .prefetch import default_jobs, run_all_once
+        with override_settings(MARKET_DATA_DIR=self.market_dir):
+            results = async_to_sync(run_all_once)(default_jobs(["AAPL"]))
+        self.assertEqual(results, {"bars:AAPL": None, "metadata:AAPL": None, "market": None})
+        self.assertEqual(StockSeries.objects.filter(ticker="AAPL").count(), 2)
+        self.assertEqual(len(load_market_series(data_dir=self.market_dir)), 400)
+
+        calls = len(self.ticker.calls)
+        response = self.client.get("/api/stock_metadata/", {"stockname": "aapl"})
+        self.assertEqual(response.json()["metadata"]["longName"], "Apple Inc.")
+        self.assertEqual(len(self.ticker.calls), calls)
+
+    @override_settings(PREFETCH_JITTER=0.1, PREFETCH_MAX_BACKOFF=100)
+    def test_failures_back_off_with_jitter(self):
+        from .prefetch import Job, run_job_once
+        outcomes = [ValueError("yahoo down"), ValueError("yahoo down"), None]
+
+        async def flaky():
+            outcome = outcomes.pop(0)
+            if outcome:
+                raise outcome
+
+        job = Job("flaky", 30, flaky)
+        highest = mock.Mock(uniform=lambda low, high: high)
+        self.assertAlmostEqual(job.next_delay(highest), 33)
+        async_to_sync(run_job_once)(job)
+        self.assertAlmostEqual(job.next_delay(highest), 66)
+        async_to_sync(run_job_once)(job)
+        self.assertAlmostEqual(job.next_delay(highest), 110)  # capped at PREFETCH_MAX_BACKOFF
+        async_to_sync(run_job_once)(job)
+        self.assertEqual(job.failures, 0)
+
+
+class MarketDirectionApiTests(SimpleTestCase):
+    def setUp(self):
+        from newsdata.tests import FakeIndexTicker, index_history
+        self.market_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.market_dir)
+        self.market = index_history(120)
+        patcher = mock.patch("newsdata.market_direction.yf.Ticker", return_value=FakeIndexTicker(self.market))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flags_ranges_that_track_the_market(self):
+        # The stock moves twice as much as the index, plus one jump of its own.
+        market_returns = self.market["Close"].pct_change().fillna(0).to_numpy()
+        stock_returns = 2 * market_returns
+        stock_returns[60] += 0.05
+        prices = 100 * np.cumprod(1 + stock_returns)
+        times = self.market.index.strftime("%Y-%m-%d").tolist()
+        market_range = (times[20], times[30])
+        own_range = (times[59], times[61])
+
+        with override_settings(MARKET_DATA_DIR=self.market_dir):
+            response = self.client.post("/api/unusual_range/market/", {
+                "data": {"time": times, "price": prices.tolist()},
+                "ranges": [market_range, own_range],
+            }, content_type="application/json")
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(body["beta"], 2, delta=0.2)
+        self.assertTrue(body["ranges"][0]["market_driven"])
+        self.assertFalse(body["ranges"][1]["market_driven"])
+        self.assertEqual(body["unexplained_ranges"], [list(own_range)])
+
+
+class UpstreamCoalescingTests(TransactionTestCase):
+    def setUp(self):
+        self.ticker = FakeTicker(make_bars("2025-01-01", 40))
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_identical_loads_share_one_fetch(self):
+        async def load_many():
+            return await asyncio.gather(*[load_price_data("msft", "max", "1d") for _ in range(5)])
+
+        def key_stats():
+            stats = self.client.get("/api/stockdata/upstream_stats/").json()["keys"]
+            return stats.get("bars:MSFT:max:1d", {"leaders": 0, "joined": 0})
+
+        before = key_stats()
+        results = async_to_sync(load_many)()
+        self.assertEqual(len([call for call in self.ticker.calls if "period" in call]), 1)
+        self.assertTrue(all(price_data is results[0][0] for price_data, _ in results))
+        after = key_stats()
+        self.assertEqual((after["leaders"] - before["leaders"], after["joined"] - before["joined"]), (1, 4))
+
+    def test_concurrent_first_loads_of_different_periods_share_the_series(self):
+        async def load_both():
+            return await asyncio.gather(load_price_data("msft", "max", "1d"), load_price_data("msft", "5d", "1d"))
+
+        (full, _), (recent, _) = async_to_sync(load_both)()
+        self.assertEqual((len(full), len(recent)), (40, 5))
+        self.assertEqual(StockSeries.objects.filter(ticker="MSFT", interval="1d").count(), 1)
+
+
+class SharedSingleFlightTests(SimpleTestCase):
+    def test_waits_for_a_call_held_by_another_process(self):
+        from stockcompass.singleflight import SingleFlight
+        flights = SingleFlight(poll_interval=0.01)
+        cache = caches["default"]
+        cache.add("singleflight:bars:X", 1)  # Held by "another worker".
+        order = []
+
+        async def other_worker_finishes():
+            await asyncio.sleep(0.05)
+            order.append("other done")
+            cache.delete("singleflight:bars:X")
+
+        async def fetch():
+            order.append("fetch")
+            return "bars"
+
+        async def run():
+            asyncio.get_running_loop().create_task(other_worker_finishes())
+            return await flights.do("bars:X", fetch, shared_cache="default")
+
+        self.assertEqual(async_to_sync(run)(), "bars")
+        self.assertEqual(order, ["other done", "fetch"])
+        self.assertEqual(flights.key_stats()["bars:X"]["waited"], 1)
+        self.assertIsNone(cache.get("singleflight:bars:X"))
+
+
+class StockDataBatchTests(TransactionTestCase):
+    def setUp(self):
+        tickers = {"AAPL": FakeTicker(make_bars("2025-01-01", 30, seed=1)),
+                   "MSFT": FakeTicker(make_bars("2025-01-01", 30, seed=2)),
+                   "NONE": FakeTicker(make_bars("2025-01-01", 0))}
+        patcher = mock.patch("stockdata.utils.yf.Ticker", side_effect=lambda symbol: tickers[symbol])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_payload_per_ticker(self):
+        params = {"period": "max", "interval": "1d"}
+        response = self.client.get("/api/stockdata/batch/", {"stocknames": "aapl,MSFT,AAPL,none", **params})
+        results = response.json()["results"]
+        self.assertEqual(list(results), ["AAPL", "MSFT", "NONE"])
+        self.assertEqual(results["NONE"]["status_code"], 500)
+        for symbol in ("AAPL", "MSFT"):
+            single = self.client.get("/api/stockdata/", {"stockname": symbol, **params}).json()
+            self.assertEqual(results[symbol], single)
+
+    @override_settings(STOCKDATA_BATCH_MAX_SERIES=2)
+    def test_rejects_oversized_batches(self):
+        response = self.client.get("/api/stockdata/batch/", {"stocknames": "A,B,C"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(STOCKDATA_BAR_REFRESH_SECONDS=60, STOCKDATA_STALE_SECONDS=900,
+                   STOCKDATA_METADATA_TTL=300, STOCKDATA_METADATA_STALE_SECONDS=3600)
+class StaleWhileRevalidateTests(TransactionTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.history = make_bars("2025-01-01", 40)
+        self.ticker = FakeTicker(self.history.iloc[:30])
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def age_series(self, seconds):
+        StockSeries.objects.filter(ticker="AAPL").update(
+            last_refreshed=django_timezone.now() - datetime.timedelta(seconds=seconds))
+
+    def load_then_settle(self):
+        """Load the bars, then let the background refresh finish."""
+        from . import utils
+
+        async def run():
+            result = await utils.load_price_data_with_age("AAPL", "max", "1d")
+            await asyncio.gather(*utils._background_refreshes)
+            return result
+        return async_to_sync(run)()
+
+    def test_stale_bars_are_served_then_refreshed(self):
+        async_to_sync(load_price_data)("AAPL", "max", "1d")
+        self.ticker.full_history = self.history
+        self.age_series(120)
+        price_data, _, refreshed_at = self.load_then_settle()
+        self.assertEqual(len(price_data), 30)
+        self.assertGreaterEqual((django_timezone.now() - refreshed_at).total_seconds(), 120)
+        self.assertEqual(len(async_to_sync(load_price_data)("AAPL", "max", "1d")[0]), 40)
+
+        self.age_series(300)
+        response = self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "max", "interval": "1d"})
+        self.assertEqual(len(response.json()["time_series"]), 40)
+        self.assertGreaterEqual(int(response["X-Data-Age"]), 300)
+
+    def test_load_joining_a_running_revalidation(self):
+        from . import utils
+        async_to_sync(load_price_data)("AAPL", "max", "1d")
+        self.ticker.full_history = self.history
+        self.age_series(120)
+        history = self.ticker.history
+
+        def slow_history(**kwargs):
+            time.sleep(0.2)
+            return history(**kwargs)
+        self.ticker.history = slow_history
+
+        async def run():
+            await utils.load_price_data_with_age("AAPL", "max", "1d")
+            await asyncio.sleep(0.05)  # The revalidation is now waiting on Yahoo.
+            result = await utils.load_price_data("AAPL", "5d", "1d")
+            await asyncio.gather(*utils._background_refreshes)
+            return result
+        price_data, _ = async_to_sync(run)()
+        self.assertEqual(price_data.index[-1], self.history.index[-1])
+
+    def test_bars_past_the_budget_wait_for_yahoo(self):
+        async_to_sync(load_price_data)("AAPL", "max", "1d")
+        self.ticker.full_history = self.history
+        self.age_series(1000)
+        price_data, _, refreshed_at = self.load_then_settle()
+        self.assertEqual(len(price_data), 40)
+        self.assertLess((django_timezone.now() - refreshed_at).total_seconds(), 60)
+
+    def test_stale_metadata_is_served_then_refreshed(self):
+        from .prefetch import cached_stock_metadata, metadata_key
+        from . import utils
+        fetched_at = django_timezone.now() - datetime.timedelta(seconds=600)
+        caches["default"].set(metadata_key("AAPL"), {"data": {"longName": "Old name"}, "fetched_at": fetched_at})
+
+        response = self.client.get("/api/stock_metadata/", {"stockname": "AAPL"})
+        self.assertEqual(response.json()["metadata"]["longName"], "Old name")
+        self.assertGreaterEqual(int(response["X-Data-Age"]), 600)
+
+        async def run():
+            result = await cached_stock_metadata("AAPL")
+            await asyncio.gather(*utils._background_refreshes)
+            return result
+        self.assertEqual(async_to_sync(run)()[0]["longName"], "Old name")
+        self.assertEqual(caches["default"].get(metadata_key("AAPL"))["data"]["longName"], "Apple Inc.")
+
+
+@override_settings(STOCKDATA_BAR_REFRESH_SECONDS=60, STOCKDATA_STALE_SECONDS=900)
+class RangeQueryTests(TransactionTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.history = make_bars("2025-01-01", 40)
+        self.ticker = FakeTicker(self.history.iloc[:30])
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        headers = {"HTTP_IF_NONE_MATCH": params.pop("etag")} if "etag" in params else {}
+        return self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "max", "interval": "1d", **params},
+                               **headers)
+
+    def test_unchanged_chart_is_not_modified(self):
+        response = self.get()
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith(f'"{int(self.history.index[29].timestamp())}-'))
+        calls = len(self.ticker.calls)
+
+        not_modified = self.get(etag=f'"other", W/{etag}')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(len(self.ticker.calls), calls)
+        # Another format or window is another representation.
+        self.assertEqual(self.get(etag=etag, format="columnar").status_code, 200)
+        columnar, binary = self.get(format="columnar"), self.get(format="binary")
+        self.assertNotEqual(columnar["ETag"], binary["ETag"])
+        self.assertIn("Accept", binary["Vary"])
+        self.assertEqual(self.get(etag=etag, since="2025-01-20").status_code, 200)
+
+        self.ticker.full_history = self.history
+        StockSeries.objects.filter(ticker="AAPL").update(
+            last_refreshed=django_timezone.now() - datetime.timedelta(seconds=1000))
+        changed = self.get(etag=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(len(changed.json()["time_series"]), 40)
+
+    def test_since_start_and_end_select_bars(self):
+        full = self.get().json()
+        since = self.get(since=self.history.index[26].isoformat()).json()
+        self.assertEqual(since["time_series"], full["time_series"][27:])
+        self.assertEqual(since["fin_data"], full["fin_data"][27:])
+        self.assertEqual(self.get(since=self.history.index[29].isoformat()).json()["time_series"], [])
+
+        window = self.get(start="2025-01-05", end="2025-01-10").json()
+        self.assertEqual([row["time"] for row in window["time_series"]],
+                         [f"2025-01-{day:02d}" for day in range(5, 11)])
+        self.assertEqual(window["fin_data"], full["fin_data"][4:10])
+
+        columnar = self.get(start="2025-01-05", end="2025-01-10", format="columnar").json()
+        self.assertEqual(columnar["length"], 6)
+        self.assertEqual(columnar["columns"]["pct_change"], [row["pct_change"] for row in full["fin_data"][4:10]])
+
+        invalid = self.get(since="yesterday-ish")
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_bound_before_the_period_is_rejected(self):
+        # 5d covers the last five sessions stored, 2025-01-26 through 2025-01-30.
+        self.assertEqual(self.get(period="5d", start="2025-01-26").status_code, 200)
+        response = self.get(period="5d", since="2025-01-02")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("period=5d", response.json()["error"])
+
+
+@override_settings(STOCKDATA_PROCESS_POOL_WORKERS=0, STOCKDATA_BAR_REFRESH_SECONDS=0,
+                   STOCKDATA_STALE_SECONDS=0, GARCH_EXTEND_MAX_BARS=5)
+class FeatureStoreTests(TransactionTestCase):
+    def setUp(self):
+        self.history = make_bars("2024-01-01", 120, seed=3)
+        self.ticker = FakeTicker(self.history.iloc[:100])
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored(self, field):
+        return np.array(StockData.objects.filter(ticker="AAPL", interval="1d")
+                        .order_by("timestamp").values_list(field, flat=True), dtype=float)
+
+    def load(self):
+        async_to_sync(load_price_data)("AAPL", "max", "1d")
+        async_to_sync(update_features)("AAPL", "1d")
+
+    def test_features_follow_ingest_incrementally(self):
+        from .garch import extend_conditional_volatility
+        self.load()
+        state = SeriesFeatures.objects.get(ticker="AAPL", interval="1d")
+        self.assertIsNone(state.dirty_from)
+        fitted = self.stored("garch_volatility")
+        self.assertTrue(np.isnan(fitted[0]) and np.isfinite(fitted[1:]).all())
+
+        self.ticker.full_history = self.history.iloc[:102]
+        self.load()
+        state.refresh_from_db()
+        self.assertEqual(state.garch_extended_bars, 2)
+        close = self.history["Close"].to_numpy()[:102]
+        returns = pd.Series(close).pct_change() * 100
+        np.testing.assert_allclose(self.stored("pct_change")[1:], returns[1:])
+        np.testing.assert_allclose(self.stored("volatility_21")[20:], returns.rolling(21).std()[20:])
+        expected = extend_conditional_volatility(state.garch_params, np.diff(close), fitted[1:])
+        np.testing.assert_allclose(self.stored("garch_volatility")[1:], expected)
+
+    def test_revised_bar_is_served_with_its_new_pct_change(self):
+        self.load()
+        revised = self.history.iloc[:100].copy()
+        revised.iloc[-1, revised.columns.get_loc("Close")] *= 1.1
+        self.ticker.full_history = revised
+        async_to_sync(load_price_data)("AAPL", "max", "1d")
+
+        self.assertTrue(np.isnan(self.stored("pct_change")[-1]))
+        self.assertTrue(np.isfinite(self.stored("garch_volatility")[-1]))
+        payload = self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "max", "interval": "1d"}).json()
+        close = revised["Close"]
+        self.assertEqual(payload["fin_data"][-1]["pct_change"], round((close.iloc[-1] / close.iloc[-2] - 1) * 100, 2))
+
+    def test_features_are_updated_in_the_background(self):
+        from . import utils
+
+        async def load_then_settle():
+            await load_price_data("AAPL", "max", "1d")
+            await asyncio.gather(*utils._background_refreshes)
+
+        with mock.patch("stockdata.utils.update_features_in_background", update_features_in_background):
+            async_to_sync(load_then_settle)()
+        self.assertIsNone(SeriesFeatures.objects.get(ticker="AAPL", interval="1d").dirty_from)
+        self.assertTrue(np.isfinite(self.stored("volatility_5")[5:]).all())
+
+    def test_features_api(self):
+        response = self.client.get("/api/stockdata/features/", {"stockname": "AAPL", "period": "max"}).json()
+        self.assertEqual(len(response["time"]), 100)
+        self.assertIsNone(response["pct_change"][0])
+        self.assertIsNone(response["volatility_63"][62])
+        self.assertIsNotNone(response["volatility_63"][63])
+        self.assertTrue(all(value is not None for value in response["garch_volatility"][1:]))
+
+        payload = self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "max", "interval": "1d"}).json()
+        self.assertEqual(payload["fin_data"][1]["pct_change"], round(response["pct_change"][1], 2))
+
+
+class RollingStatsTests(SimpleTestCase):
+    def test_streaming_matches_batch(self):
+        from .garch import extend_conditional_volatility
+        from .rolling import EWMAVolatility, LiveBarStats, RollingMoments
+        values = np.random.default_rng(4).normal(0, 1, 300)
+        moments, ewma = RollingMoments(30), EWMAVolatility(0.94)
+        means, stds, variances = [], [], []
+        for value in values:
+            moments.push(value)
+            ewma.push(value)
+            means.append(moments.mean)
+            stds.append(moments.std)
+            variances.append(ewma.variance)
+        rolling = pd.Series(values).rolling(30)
+        np.testing.assert_allclose(means[29:], rolling.mean()[29:])
+        np.testing.assert_allclose(stds[29:], rolling.std()[29:])
+        np.testing.assert_allclose(variances, pd.Series(values ** 2).ewm(alpha=0.06, adjust=False).mean())
+
+        close = 100 + np.cumsum(values)
+        params = [0.01, 0.05, 0.1, 0.85]
+        stats = LiveBarStats(garch_params=params, garch_variance=1.0)
+        for i, price in enumerate(close[:-1]):
+            stats.push(i, price)
+        expected = extend_conditional_volatility(params, np.diff(close), np.array([1.0]))
+        self.assertAlmostEqual(stats.evaluate(close[-1])["garch_volatility"], expected[-1])
+
+
+@override_settings(STOCKDATA_PROCESS_POOL_WORKERS=0, STOCKDATA_BAR_REFRESH_SECONDS=0, STOCKDATA_STALE_SECONDS=0)
+class LiveAnomalyTests(TransactionTestCase):
+    def setUp(self):
+        caches["analytics"].clear()
+        self.history = make_bars("2025-03-03 09:30", 200, freq="5min", seed=5)
+        self.ticker = FakeTicker(self.history.iloc[:150])
+        patcher = mock.patch("stockdata.utils.yf.Ticker", return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def live(self):
+        response = self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "max", "interval": "5m", "live": "1"})
+        return response.json()["live"]
+
+    def test_flags_a_jump_and_advances_incrementally(self):
+        async_to_sync(load_price_data)("AAPL", "max", "5m")
+        async_to_sync(update_features)("AAPL", "5m")
+        live = self.live()
+        self.assertFalse(live["anomaly"])
+        self.assertIsNotNone(live["garch_volatility"])
+        self.assertEqual(caches["analytics"].get("live-stats:AAPL:5m").last_time, self.history.index[148])
+
+        history = self.history.iloc[:160].copy()
+        history.iloc[-1, history.columns.get_loc("Close")] = history["Close"].iloc[-2] * 1.2
+        self.ticker.full_history = history
+        from .rolling import RollingMoments
+        with mock.patch.object(RollingMoments, "push", autospec=True, side_effect=RollingMoments.push) as push:
+            live = self.live()
+        self.assertEqual(push.call_count, 10)  # Only the bars completed since the last request
+        self.assertTrue(live["anomaly"])
+        self.assertGreater(live["zscore"], 1.96)
+        self.assertEqual(live["time"], history.index[-1].isoformat())
+
+    def test_short_period_warms_up_from_the_bar_store(self):
+        self.ticker.full_history = make_bars("2025-03-03 00:05", 600, freq="5min", seed=5)
+        async_to_sync(load_price_data)("AAPL", "max", "5m")
+        response = self.client.get("/api/stockdata/", {"stockname": "AAPL", "period": "1d", "interval": "5m", "live": "1"})
+        # The last session holds fewer bars than the rolling window.
+        self.assertLess(len(response.json()["time_series"]), settings.LIVE_STATS_WINDOW)
+        live = response.json()["live"]
+        self.assertTrue(live["window_full"])
+        self.assertIsNotNone(live["zscore"])
+
+
+@override_settings(LIVE_PUSH_INTERVAL=0.01)
+class LivePushTests(SimpleTestCase):
+    def setUp(self):
+        self.history = make_bars("2025-03-03 09:30", 60, freq="5min")
+        self.frame = self.history.iloc[:50]
+
+        async def load(ticker, period, interval):
+            return self.frame, 1_000
+
+        async def no_stats(*args):
+            return None
+
+        for name, func in (("load_price_data", load), ("live_bar_stats", no_stats)):
+            patcher = mock.patch(f"stockdata.live.{name}", side_effect=func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_subscribers_share_one_poller_and_get_deltas(self):
+        from .live import active_feeds, websocket_application
+
+        async def client(inbox, outbox):
+            scope = {"type": "websocket", "path": "/ws/stockdata/", "headers": []}
+            await websocket_application(scope, inbox.get, outbox.put)
+
+        async def next_message(outbox):
+            message = await asyncio.wait_for(outbox.get(), 5)
+            return json.loads(message["text"])
+
+        async def run():
+            clients = []
+            for since in (None, self.history.index[47].isoformat()):
+                inbox, outbox = asyncio.Queue(), asyncio.Queue()
+                task = asyncio.get_running_loop().create_task(client(inbox, outbox))
+                await inbox.put({"type": "websocket.connect"})
+                self.assertEqual((await outbox.get())["type"], "websocket.accept")
+                await inbox.put({"type": "websocket.receive", "text": json.dumps(
+                    {"action": "subscribe", "ticker": "aapl", "interval": "5m", "since": since})})
+                clients.append((inbox, outbox, task))
+
+            backlog = await next_message(clients[1][1])
+            self.assertEqual(len(backlog["timestamps"]), 2)  # Bars 48 and 49
+            self.assertEqual(active_feeds(), {"AAPL:5m": 2})
+
+            self.frame = self.history.iloc[:53]
+            for _, outbox, _ in clients:
+                delta = await next_message(outbox)
+                self.assertEqual(delta["timestamps"], [t.isoformat() for t in self.history.index[50:53]])
+                self.assertEqual(delta["time_series"][0]["close_price"], round(self.history["Close"].iloc[50], 2))
+
+
+            for inbox, _, task in clients:
+                await inbox.put({"type": "websocket.disconnect"})
+                await task
+            self.assertEqual(active_feeds(), {})
+
+        async_to_sync(run)()
+
+    def test_malformed_messages_get_an_error_reply(self):
+        from .live import active_feeds, websocket_application
+
+        async def run():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            scope = {"type": "websocket", "path": "/ws/stockdata/", "headers": []}
+            task = asyncio.get_running_loop().create_task(websocket_application(scope, inbox.get, outbox.put))
+            await inbox.put({"type": "websocket.connect"})
+            await outbox.get()
+            messages = [[], "subscribe", 1,
+                        {"action": "subscribe", "ticker": "AAPL", "interval": ["5m"]},
+                        {"action": "subscribe", "ticker": "AAPL", "interval": "5m", "since": {"at": 1}},
+                        {"action": "subscribe", "ticker": "AAPL", "interval": "5m", "since": ["2025-03-03"]}]
+            replies = []
+            for message in messages:
+                await inbox.put({"type": "websocket.receive", "text": json.dumps(message)})
+                replies.append(json.loads((await asyncio.wait_for(outbox.get(), 5))["text"]))
+            self.assertFalse(task.done())  # Still connected.
+            self.assertEqual(active_feeds(), {})
+            await inbox.put({"type": "websocket.disconnect"})
+            await task
+            return replies
+
+        replies = async_to_sync(run)()
+        self.assertEqual([reply["type"] for reply in replies], ["error"] * 6)
+
+    def test_cold_feed_does_not_block_the_connection(self):
+        from .live import active_feeds, websocket_application
+        loaded = asyncio.Event()
+
+        async def slow_load(ticker, period, interval):
+            await loaded.wait()
+            return self.frame, 1_000
+
+        async def run():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            scope = {"type": "websocket", "path": "/ws/stockdata/", "headers": []}
+            task = asyncio.get_running_loop().create_task(websocket_application(scope, inbox.get, outbox.put))
+            await inbox.put({"type": "websocket.connect"})
+            await outbox.get()
+            for ticker in ("AAPL", "MSFT"):
+                await inbox.put({"type": "websocket.receive", "text": json.dumps(
+                    {"action": "subscribe", "ticker": ticker, "interval": "5m", "since": self.history.index[47].isoformat()})})
+            await inbox.put({"type": "websocket.receive", "text": json.dumps({"action": "poll", "ticker": "AAPL"})})
+            # Handled while both feeds are still loading.
+            error = json.loads((await asyncio.wait_for(outbox.get(), 5))["text"])
+            self.assertEqual(error["error"], "Unknown action: poll")
+            self.assertEqual(active_feeds(), {"AAPL:5m": 1, "MSFT:5m": 1})
+
+            await inbox.put({"type": "websocket.disconnect"})
+            await asyncio.wait_for(task, 5)
+            self.assertEqual(active_feeds(), {})
+            loaded.set()
+
+        with mock.patch("stockdata.live.load_price_data", side_effect=slow_load):
+            async_to_sync(run)()
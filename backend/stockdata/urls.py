@@ -4,6 +4,11 @@ from .views import *
 
 urlpatterns = [
     path('api/stockdata/', stock_data_api, name='stock_data_api'),
+    path('api/stockdata/batch/', stock_data_batch_api, name='stock_data_batch_api'),
+    path('api/stockdata/features/', stock_features_api, name='stock_features_api'),
     path('api/unusual_range/', unusual_ranges_api, name='unusual_range_api'),
+    path('api/unusual_range/batch/', batch_unusual_ranges_api, name='batch_unusual_range_api'),
+    path('api/unusual_range/market/', market_direction_api, name='market_direction_api'),
     path('api/stock_metadata/', stock_metadata_api, name='stock_metadata_api'),
+    path('api/stockdata/upstream_stats/', upstream_stats_api, name='upstream_stats_api'),
 ]
@@ -1,112 +1,974 @@
 import asyncio
+import bisect
+import hashlib
+import math
+import re
 import yfinance as yf
 import datetime
 import numpy as np
 import pandas as pd
-import scipy.stats
 
 from django.conf import settings
-from .models import StockData
-from django.db import connection
-from arch import arch_model
+from django.core.cache import caches
+from django.utils import timezone
+from .models import StockData, StockSeries, SeriesFeatures
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from .garch import analyze_series
+from .features import FEATURE_FIELDS, compute_features
+from .rolling import LiveBarStats
+from .executor import run_in_process
+from stockcompass.singleflight import SingleFlight
+from stockcompass.db import run_orm
+from newsdata.market_direction import analyze_ranges_vs_market, fetch_and_store_market_data, load_market_series
 
-async def fetch_and_process_stock_data(ticker_symbol="AAPL", period="1d", interval="60m"):
+#############################################
+# Bar store
+#############################################
+
+# Calendar offsets for yfinance period strings; "Nd" periods are handled separately
+# because Yahoo counts them in trading sessions rather than calendar days.
+PERIOD_UNITS = {
+    "wk": lambda n: pd.DateOffset(weeks=n),
+    "mo": lambda n: pd.DateOffset(months=n),
+    "y": lambda n: pd.DateOffset(years=n),
+}
+
+BAR_FIELDS = ["open_price", "high_price", "low_price", "close_price", "volume"]
+BAR_COLUMNS = {"Open": "open_price", "High": "high_price", "Low": "low_price", "Close": "close_price", "Volume": "volume"}
+
+
+def _parse_period(period):
+    """Split a yfinance period string such as "5d" or "6mo" into (count, unit)."""
+    if period in ("max", "ytd"):
+        return None, period
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    return int(match.group(1)), match.group(2)
+
+
+def _period_start(period, now, tz):
     """
-    Stateless stock data fetching and processing.
-    Fetches data from Yahoo Finance, processes in memory, returns immediately.
-    NO database storage - pure in-memory processing for fast response.
+    Calendar start of a "wk"/"mo"/"y"/"ytd" period counted back from ``now``,
+    mirroring how yfinance turns a period into a start date.
     """
-    print(f"🚀 Fetching {ticker_symbol} data: period={period}, interval={interval}")
-    
-    # Create ticker object (no anti-rate limiting needed for stateless approach)
-    ticker = yf.Ticker(ticker_symbol)
+    count, unit = _parse_period(period)
+    if unit == "ytd":
+        local_now = pd.Timestamp(now).tz_convert(tz)
+        return pd.Timestamp(year=local_now.year, month=1, day=1, tz=tz).tz_convert("UTC")
+    return pd.Timestamp(now).tz_convert("UTC") - PERIOD_UNITS[unit](count)
 
-    try:
-        # Fetch price data and company info
-        print(f"📊 Fetching price history and company info...")
-        price_data = await asyncio.to_thread(ticker.history, period=period, interval=interval)
-        
-        if price_data.empty:
-            print(f"❌ No price data available for {ticker_symbol}")
+
+def _get_series(symbol, interval):
+    return StockSeries.objects.filter(ticker=symbol, interval=interval).first()
+
+
+def _store_bars(series, price_data):
+    """Upsert a yfinance history frame into the bar store for ``series``."""
+    frame = price_data[list(BAR_COLUMNS)].rename(columns=BAR_COLUMNS)
+    frame = frame.astype(object).where(frame.notna(), None)
+    timestamps = price_data.index.tz_convert("UTC").to_pydatetime()
+    bars = [
+        StockData(
+            ticker=series.ticker,
+            interval=series.interval,
+            timestamp=timestamp,
+            open_price=row[0],
+            high_price=row[1],
+            low_price=row[2],
+            close_price=row[3],
+            volume=int(row[4]) if row[4] is not None else None,
+        )
+        for timestamp, row in zip(timestamps, frame.itertuples(index=False, name=None))
+    ]
+    with transaction.atomic():
+        revised, after_revised = _revised_bars(series, bars)
+        StockData.objects.bulk_create(
+            bars,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["ticker", "interval", "timestamp"],
+            update_fields=BAR_FIELDS,
+        )
+        # Stored features of revised bars are stale until update_features runs;
+        # cleared, readers compute pct_change from the bars instead. A bar's GARCH
+        # volatility only depends on the closes before it.
+        stored = StockData.objects.filter(ticker=series.ticker, interval=series.interval)
+        if revised:
+            stored.filter(timestamp__in=revised).update(
+                **{name: None for name in FEATURE_FIELDS if name != "garch_volatility"})
+        if after_revised:
+            stored.filter(timestamp__in=after_revised).update(**{name: None for name in FEATURE_FIELDS})
+        series.save()
+        _mark_features_dirty(series, min(timestamps))
+
+
+def _revised_bars(series, bars):
+    """
+    Before ``bars`` are upserted: the stored bars whose values they change, and the
+    stored bars right after a changed or new bar (whose pct_change moves with it).
+    """
+    first = min(bar.timestamp for bar in bars)
+    last = max(bar.timestamp for bar in bars)
+    stored = StockData.objects.filter(ticker=series.ticker, interval=series.interval)
+    existing = {row[0]: row[1:] for row in stored.filter(timestamp__gte=first, timestamp__lte=last)
+                .values_list("timestamp", *BAR_FIELDS)}
+    incoming = {bar.timestamp: tuple(getattr(bar, name) for name in BAR_FIELDS) for bar in bars}
+
+    revised, after_revised = [], []
+    previous_changed = False
+    for timestamp in sorted(existing.keys() | incoming.keys()):
+        changed = timestamp in incoming and existing.get(timestamp) != incoming[timestamp]
+        if timestamp in existing:
+            if changed:
+                revised.append(timestamp)
+            elif previous_changed:
+                after_revised.append(timestamp)
+        previous_changed = changed
+    if previous_changed:
+        following = stored.filter(timestamp__gt=last).order_by("timestamp").values_list("timestamp", flat=True).first()
+        if following is not None:
+            after_revised.append(following)
+    return revised, after_revised
+
+
+def _read_bars(series, start=None):
+    """The stored bars of ``series`` from ``start`` on (all of them by default) as a yfinance-style frame, or None."""
+    bars = StockData.objects.filter(ticker=series.ticker, interval=series.interval)
+    if start is not None:
+        bars = bars.filter(timestamp__gte=start)
+    rows = list(bars.order_by("timestamp").values_list("timestamp", *BAR_FIELDS, *FEATURE_FIELDS))
+    if not rows:
+        return None
+    price_data = pd.DataFrame(rows, columns=["Date", *BAR_COLUMNS, *FEATURE_FIELDS])
+    price_data[FEATURE_FIELDS] = price_data[FEATURE_FIELDS].astype(float)
+    price_data["Date"] = pd.to_datetime(price_data["Date"], utc=True).dt.tz_convert(series.timezone)
+    price_data = price_data.set_index("Date")
+    price_data["Volume"] = price_data["Volume"].fillna(0)
+    return price_data
+
+
+def _load_bars(series, period, now):
+    """
+    Read the bars that ``period`` covers from the store as a yfinance-style frame.
+
+    Returns None when the store does not hold the whole window, in which case the
+    caller has to backfill it from Yahoo first.
+    """
+    count, unit = _parse_period(period)
+    start = None
+    if unit == "max":
+        if not series.full_history:
+            return None
+    elif unit != "d":
+        start = _period_start(period, now, series.timezone)
+        if not series.full_history and (series.covered_from is None or series.covered_from > start):
             return None
-            
-        print(f"✅ Fetched {len(price_data)} price records for {ticker_symbol}")
-        
-        # Get outstanding shares for proper market cap calculation
+
+    price_data = _read_bars(series, start)
+    if price_data is None:
+        return None
+
+    if unit == "d":
+        # "Nd" means the last N trading sessions, so keep the last N distinct dates.
+        dates = price_data.index.normalize()
+        session_dates = dates.unique()
+        if len(session_dates) < count and not series.full_history:
+            return None
+        first_date = session_dates[-count] if len(session_dates) >= count else session_dates[0]
+        if not series.full_history and (series.covered_from is None or first_date < series.covered_from):
+            return None
+        price_data = price_data[dates >= first_date]
+    return price_data
+
+
+async def _refresh_full(ticker, series, period, interval, now):
+    """Backfill ``series`` with the whole ``period`` from Yahoo and mark its coverage."""
+    price_data = await asyncio.to_thread(ticker.history, period=period, interval=interval)
+    if price_data.empty:
+        return False
+    count, unit = _parse_period(period)
+    tz = str(price_data.index.tz or "UTC")
+    if unit == "max" or (unit == "d" and price_data.index.normalize().nunique() < count):
+        # Either everything was requested or Yahoo has less history than asked for.
+        series.full_history = True
+    if unit == "d":
+        covered_from = price_data.index[0].normalize().tz_convert("UTC")
+    elif unit != "max":
+        covered_from = _period_start(period, now, tz)
+    else:
+        covered_from = price_data.index[0].tz_convert("UTC")
+    covered_from = covered_from.to_pydatetime()
+    if series.covered_from is None or covered_from < series.covered_from:
+        series.covered_from = covered_from
+    series.timezone = tz
+    series.last_refreshed = now
+    if series.shares_outstanding is None:
+        series.shares_outstanding = await _fetch_shares_outstanding(ticker)
+    await run_orm(_store_bars, series, price_data)
+    print(f"✅ Stored {len(price_data)} {interval} bars for {series.ticker} ({period})")
+    update_features_in_background(series.ticker, interval)
+    return True
+
+
+async def _refresh_incremental(ticker, series, now):
+    """Fetch only the bars from the last stored one onward and upsert them."""
+    last_bar = await run_orm(
+        lambda: StockData.objects.filter(ticker=series.ticker, interval=series.interval)
+        .order_by("-timestamp").values_list("timestamp", flat=True).first()
+    )
+    # The last stored bar is re-fetched as well because it may still have been forming.
+    price_data = await asyncio.to_thread(ticker.history, start=last_bar, interval=series.interval)
+    series.last_refreshed = now
+    if price_data.empty:
+        await run_orm(series.save)
+        return
+    await run_orm(_store_bars, series, price_data[price_data.index >= last_bar])
+    print(f"✅ Refreshed {len(price_data)} {series.interval} bars for {series.ticker}")
+    update_features_in_background(series.ticker, series.interval)
+
+
+#############################################
+# Feature store
+#############################################
+
+def _mark_features_dirty(series, first_timestamp):
+    """Record that the bars of ``series`` from ``first_timestamp`` on need their features recomputed."""
+    features = SeriesFeatures.objects.filter(ticker=series.ticker, interval=series.interval)
+    SeriesFeatures.objects.get_or_create(ticker=series.ticker, interval=series.interval)
+    features.filter(Q(dirty_from__isnull=True) | Q(dirty_from__gt=first_timestamp)).update(dirty_from=first_timestamp)
+    features.update(revision=F("revision") + 1)
+
+
+def _read_feature_inputs(symbol, interval):
+    state = SeriesFeatures.objects.filter(ticker=symbol, interval=interval).first()
+    if state is None or state.dirty_from is None:
+        return None, None
+    rows = list(
+        StockData.objects.filter(ticker=symbol, interval=interval)
+        .order_by("timestamp").values_list("timestamp", "close_price", "garch_volatility")
+    )
+    return state, rows
+
+
+def _write_features(symbol, interval, state, timestamps, result):
+    """Store computed features, then clear the dirty mark unless bars were stored meanwhile."""
+    first_row = result["first_row"]
+    values = result["features"]
+    rows = [
+        StockData(ticker=symbol, interval=interval, timestamp=timestamp,
+                  **{name: _finite(values[name][i]) for name in FEATURE_FIELDS})
+        for i, timestamp in enumerate(timestamps[first_row:])
+    ]
+    with transaction.atomic():
+        # An upsert touching only the feature columns; every row already exists.
+        StockData.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["ticker", "interval", "timestamp"],
+            update_fields=FEATURE_FIELDS,
+        )
+        features = SeriesFeatures.objects.filter(pk=state.pk)
+        features.update(garch_params=result["params"], garch_extended_bars=result["extended_bars"])
+        features.filter(revision=state.revision).update(dirty_from=None)
+
+
+def update_features_in_background(symbol, interval):
+    """
+    Start ``update_features`` after bars were stored, without holding up the
+    request that stored them. Readers meanwhile get NaN features for the new bars
+    (pct_change is then computed on the fly); ``load_features`` waits for it.
+    """
+    refresh_in_background(f"features:{symbol}:{interval}", lambda: update_features(symbol, interval))
+
+
+async def update_features(symbol, interval):
+    """
+    Bring the derived series of a (ticker, interval) in the bar store up to date
+    (see stockdata/features.py). Only bars stored since the last update are
+    recomputed, plus as many before them as the rolling windows need; the GARCH
+    volatility is extended with the last fit's parameters for up to
+    GARCH_EXTEND_MAX_BARS new bars (GARCH_INTRADAY_EXTEND_MAX_BARS for intraday
+    intervals) and refit after that.
+
+    Failures are logged and leave the series marked for the next update.
+    """
+    try:
+        state, rows = await run_orm(_read_feature_inputs, symbol, interval)
+        if state is None or not rows:
+            return
+        timestamps = [row[0] for row in rows]
+        close = np.array([row[1] for row in rows], dtype=float)
+        garch_volatility = np.array([row[2] for row in rows], dtype=float)
+        first_row = bisect.bisect_left(timestamps, state.dirty_from)
+        # Bars 1..first_row keep their volatility: every close before first_row is unchanged.
+        known_volatility = garch_volatility[1:first_row + 1]
+        if np.isnan(known_volatility).any():
+            known_volatility = known_volatility[:0]
+        extend_max_bars = (settings.GARCH_EXTEND_MAX_BARS if interval in DAILY_INTERVALS
+                           else settings.GARCH_INTRADAY_EXTEND_MAX_BARS)
+        result = await run_in_process(
+            compute_features, close, first_row, known_volatility,
+            state.garch_params, state.garch_extended_bars, extend_max_bars)
+        await run_orm(_write_features, symbol, interval, state, timestamps, result)
+    except Exception as e:
+        print(f"⚠️ Feature update failed for {symbol} {interval}: {e}")
+
+
+async def _fetch_shares_outstanding(ticker):
+    try:
+        info = await asyncio.to_thread(lambda: ticker.info)
+        shares_outstanding = info.get('sharesOutstanding', info.get('impliedSharesOutstanding', None))
+        print(f"📈 Outstanding shares: {shares_outstanding:,}" if shares_outstanding else "⚠️ Outstanding shares not available")
+        return shares_outstanding
+    except Exception as e:
+        print(f"⚠️ Could not fetch company info: {e}")
+        return None
+
+
+# Coalesces concurrent identical Yahoo-backed loads (bars, metadata, market index).
+upstream_flights = SingleFlight()
+
+
+async def coalesced(key, func):
+    """
+    ``await func()`` through ``upstream_flights``, so concurrent callers with the same
+    key share one call. Across worker processes too when STOCKDATA_SINGLEFLIGHT_CACHE
+    names a shared cache.
+    """
+    return await upstream_flights.do(key, func, shared_cache=settings.STOCKDATA_SINGLEFLIGHT_CACHE)
+
+
+# Background work (stale-while-revalidate refreshes, feature updates), referenced
+# until it finishes.
+_background_refreshes = set()
+
+
+def refresh_in_background(key, func):
+    """
+    Start ``coalesced(key, func)`` without waiting for it. A refresh already running
+    for ``key`` is joined rather than repeated; failures are only logged.
+    """
+    task = asyncio.get_running_loop().create_task(coalesced(key, func))
+    _background_refreshes.add(task)
+    task.add_done_callback(_background_refresh_done)
+    return task
+
+
+def _background_refresh_done(task):
+    _background_refreshes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Background refresh failed: {task.exception()}")
+
+
+async def load_price_data(ticker_symbol="AAPL", period="1d", interval="60m"):
+    """
+    Serve OHLCV bars for a ticker from the local bar store, going to Yahoo Finance
+    only for what the store is missing.
+
+    A series seen for the first time (or asked for further back than it is stored)
+    is backfilled with one ``history(period, interval)`` call. After that, a request
+    only fetches the bars newer than the last stored one, and at most once every
+    ``STOCKDATA_BAR_REFRESH_SECONDS`` per (ticker, interval). Up to
+    ``STOCKDATA_STALE_SECONDS`` after the last refresh, the stored bars are served
+    straight away and that fetch runs in the background; past it the request waits
+    for the fetch. Concurrent requests for the same (ticker, period, interval) share
+    one load, and every load of a (ticker, interval) shares its series' refresh.
+
+    Returns:
+        tuple: (pd.DataFrame of bars indexed by exchange-local timestamps with
+               Open/High/Low/Close/Volume columns, shares outstanding or None),
+               or (None, None) when Yahoo has no data for the ticker.
+    """
+    price_data, shares_outstanding, _ = await load_price_data_with_age(ticker_symbol, period, interval)
+    return price_data, shares_outstanding
+
+
+async def stored_price_data(ticker_symbol, interval="1d"):
+    """
+    Every bar the store already holds for (ticker, interval), without going to
+    Yahoo Finance: None when the series was never loaded. For request paths that
+    can do without the bars rather than wait for a download.
+    """
+    symbol = ticker_symbol.upper()
+
+    def read():
+        series = _get_series(symbol, interval)
+        return None if series is None else _read_bars(series)
+    return await run_orm(read)
+
+
+async def load_price_data_with_age(ticker_symbol="AAPL", period="1d", interval="60m"):
+    """
+    ``load_price_data`` plus when the returned bars were last refreshed from Yahoo.
+
+    Returns:
+        tuple: (price data, shares outstanding, refreshed-at datetime), all None
+               when Yahoo has no data for the ticker.
+    """
+    symbol = ticker_symbol.upper()
+    return await coalesced(f"bars:{symbol}:{period}:{interval}",
+                           lambda: _load_price_data(symbol, period, interval))
+
+
+async def _load_price_data(symbol, period, interval):
+    now = timezone.now()
+    # Creating and refreshing the series is shared by every load of the (ticker,
+    # interval), whatever its period; only reading the period's bars is per load.
+    # Everything run under ``refresh_key`` returns (series, revalidate), since a
+    # caller may join any of them.
+    refresh_key = f"refresh:{symbol}:{interval}"
+    series, revalidate = await coalesced(refresh_key, lambda: _sync_series(symbol, period, interval))
+    if series is None:
+        return None, None, None
+
+    price_data = await run_orm(_load_bars, series, period, now)
+    # Stored, but not as far back as ``period``. A backfill running for another
+    # period is joined first and only repeated if it did not reach far enough.
+    for _ in range(2):
+        if price_data is not None:
+            break
+        series, _ = await coalesced(refresh_key, lambda: _backfill_series(symbol, period, interval))
+        if series is None:
+            return None, None, None
+        price_data = await run_orm(_load_bars, series, period, now)
+    if price_data is None:
+        return None, None, None
+    if revalidate:
+        refresh_in_background(refresh_key, lambda: _revalidate(symbol, interval))
+    return price_data, series.shares_outstanding, series.last_refreshed
+
+
+async def _sync_series(symbol, period, interval):
+    """
+    The StockSeries of (symbol, interval), backfilled with ``period`` when it is
+    new and refreshed incrementally when due.
+
+    Returns:
+        tuple: (series or None when Yahoo has no data, whether to refresh it in
+               the background instead)
+    """
+    ticker = yf.Ticker(symbol)
+    now = timezone.now()
+    series = await run_orm(_get_series, symbol, interval)
+    if series is None:
+        series = StockSeries(ticker=symbol, interval=interval)
+        try:
+            if not await _refresh_full(ticker, series, period, interval, now):
+                return None, False
+        except IntegrityError:
+            # Another worker created the series meanwhile; use what it stored.
+            series = await run_orm(_get_series, symbol, interval)
+        return series, False
+    if series.last_refreshed is None or (now - series.last_refreshed).total_seconds() >= settings.STOCKDATA_BAR_REFRESH_SECONDS:
+        if series.last_refreshed is not None and (now - series.last_refreshed).total_seconds() < settings.STOCKDATA_STALE_SECONDS:
+            return series, True
         try:
-            info = await asyncio.to_thread(lambda: ticker.info)
-            shares_outstanding = info.get('sharesOutstanding', info.get('impliedSharesOutstanding', None))
-            print(f"📈 Outstanding shares: {shares_outstanding:,}" if shares_outstanding else "⚠️ Outstanding shares not available")
+            await _refresh_incremental(ticker, series, now)
         except Exception as e:
-            print(f"⚠️ Could not fetch company info: {e}")
-            shares_outstanding = None
-        
-        # Process data in memory (no database storage)
-        from datetime import datetime
-        from django.utils import timezone
-        
-        time_series = []
-        fin_data = []
-        
-        # Calculate percentage change
-        price_data['pct_change'] = price_data['Close'].pct_change().fillna(0) * 100
-        
-        for timestamp, row in price_data.iterrows():
-            # Format timestamp properly
-            dt = timestamp.to_pydatetime()
-            if dt.tzinfo is None:
-                dt = timezone.make_aware(dt, timezone.utc)
-            time_str = dt.strftime("%Y-%m-%d")
-            
-            # Time series data
-            time_series.append({
-                "time": time_str,
-                "close_price": round(float(row['Close']), 2),
-                "volume": int(row['Volume'])
-            })
-            
-            # Financial data with correct market cap calculation
-            if shares_outstanding:
-                market_cap = float(row['Close']) * shares_outstanding  # Correct: Price × Outstanding Shares
-            else:
-                market_cap = None  # Don't show incorrect market cap
-                
-            fin_data.append({
-                "time": time_str,
-                "free_cash_flow": 0.0,  # Simplified for performance
-                "eps": None,  # Can be added later if needed
-                "profit_margin": None,  # Can be added later if needed
-                "market_cap": round(market_cap, 2) if market_cap else None,
-                "pct_change": round(float(row['pct_change']), 2),
-                "pe": 0.0  # Simplified for performance
-            })
-        
-        print(f"✅ Processed {len(time_series)} records in memory")
-        
-        return {
-            "time_series": time_series,
-            "fin_data": fin_data
+            # Serve what is stored rather than failing the request.
+            print(f"⚠️ Incremental refresh failed for {symbol}: {e}")
+    return series, False
+
+
+async def _backfill_series(symbol, period, interval):
+    """
+    Extend a stored series back to the start of ``period``.
+
+    Returns:
+        tuple: (series or None when Yahoo has no data, False), like _sync_series.
+    """
+    series = await run_orm(_get_series, symbol, interval)
+    if not await _refresh_full(yf.Ticker(symbol), series, period, interval, timezone.now()):
+        return None, False
+    return series, False
+
+
+async def _revalidate(symbol, interval):
+    """
+    Background incremental refresh of a stale series, unless another caller just did it.
+
+    Returns:
+        tuple: (series, False), like _sync_series, for loads that join it.
+    """
+    now = timezone.now()
+    series = await run_orm(_get_series, symbol, interval)
+    if (now - series.last_refreshed).total_seconds() >= settings.STOCKDATA_BAR_REFRESH_SECONDS:
+        await _refresh_incremental(yf.Ticker(symbol), series, now)
+    return series, False
+
+
+#############################################
+# Response building
+#############################################
+
+def round2(values):
+    """
+    Element-wise ``round(x, 2)`` for a float array.
+
+    ``np.round`` scales by 100 before rounding, which can land on the other side of
+    a tie than Python's correctly-rounded ``round()``; those few elements are
+    redone in Python so the output matches exactly.
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) <= np.spacing(np.abs(scaled))
+    if ties.any():
+        rounded[ties] = [round(value, 2) for value in values[ties].tolist()]
+    return rounded
+
+
+def bar_dates(price_data):
+    """Bar dates as ``datetime64[D]``, taken in the bars' own (exchange) timezone."""
+    index = price_data.index
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.to_numpy().astype("datetime64[D]")
+
+
+def bar_pct_changes(price_data):
+    """
+    Close-to-close change of every bar in percent, 0 for the first one. Read from
+    the feature store when it covers the bars, computed otherwise.
+    """
+    if "pct_change" in price_data and len(price_data) > 1:
+        stored = price_data["pct_change"].to_numpy(dtype=float)
+        if not np.isnan(stored[1:]).any():
+            pct_changes = stored.copy()
+            pct_changes[0] = 0.0
+            return pct_changes
+    return price_data['Close'].pct_change().fillna(0).to_numpy(dtype=float) * 100
+
+
+def build_stock_payload(price_data, shares_outstanding, context_rows=0):
+    """
+    Turn a frame of bars into the ``time_series`` / ``fin_data`` rows returned by
+    /api/stockdata/. Every column is computed in one vectorized pass; only the
+    final dicts are assembled in Python.
+
+    The first ``context_rows`` bars only give the bar after them its pct_change
+    and are left out of the rows.
+    """
+    pct_changes = round2(bar_pct_changes(price_data)[context_rows:]).tolist()
+    price_data = price_data.iloc[context_rows:]
+    close = price_data['Close'].to_numpy(dtype=float)
+    times = bar_dates(price_data).astype(str).tolist()
+    close_prices = round2(close).tolist()
+    volumes = price_data['Volume'].to_numpy().astype(np.int64).tolist()
+
+    # Market cap is Price × Outstanding Shares; without the share count it is left
+    # out rather than shown wrong.
+    if shares_outstanding:
+        market_cap = close * shares_outstanding
+        market_caps = [
+            value if raw else None
+            for value, raw in zip(round2(market_cap).tolist(), market_cap.tolist())
+        ]
+    else:
+        market_caps = [None] * len(times)
+
+    time_series = [
+        {"time": time_str, "close_price": close_price, "volume": volume}
+        for time_str, close_price, volume in zip(times, close_prices, volumes)
+    ]
+    fin_data = [
+        {
+            "time": time_str,
+            "free_cash_flow": 0.0,  # Simplified for performance
+            "eps": None,  # Can be added later if needed
+            "profit_margin": None,  # Can be added later if needed
+            "market_cap": market_cap,
+            "pct_change": pct_change,
+            "pe": 0.0  # Simplified for performance
         }
-        
+        for time_str, market_cap, pct_change in zip(times, market_caps, pct_changes)
+    ]
+
+    return {
+        "time_series": time_series,
+        "fin_data": fin_data
+    }
+
+
+def build_columnar_payload(price_data, shares_outstanding, context_rows=0):
+    """
+    Column-per-field variant of ``build_stock_payload`` for ``format=columnar`` and
+    ``format=binary`` (``context_rows`` as there).
+
+    The shared ``time`` column appears once and any column holding a single value
+    for every bar is moved to ``constants``. Columns are NumPy arrays; missing market
+    caps are NaN. Encoding them is left to the renderer.
+
+    Returns:
+        dict: {"length": int, "columns": {name: np.ndarray}, "constants": {name: value}}
+    """
+    pct_changes = round2(bar_pct_changes(price_data)[context_rows:])
+    price_data = price_data.iloc[context_rows:]
+    close = price_data['Close'].to_numpy(dtype=float)
+    if shares_outstanding:
+        market_cap = round2(close * shares_outstanding)
+        market_cap[market_cap == 0] = np.nan
+    else:
+        market_cap = np.full(len(close), np.nan)
+
+    columns = {
+        "time": bar_dates(price_data),
+        "close_price": round2(close),
+        "volume": price_data['Volume'].to_numpy().astype(np.int64),
+        "free_cash_flow": np.zeros(len(close)),
+        "eps": np.full(len(close), np.nan),
+        "profit_margin": np.full(len(close), np.nan),
+        "market_cap": market_cap,
+        "pct_change": pct_changes,
+        "pe": np.zeros(len(close)),
+    }
+
+    constants = {}
+    for name, values in list(columns.items()):
+        if name == "time" or len(values) == 0:
+            continue
+        if values.dtype.kind == "f" and np.isnan(values).all():
+            constants[name] = None
+        elif (values == values[0]).all():
+            constants[name] = values[0].item()
+        else:
+            continue
+        del columns[name]
+
+    return {"length": len(close), "columns": columns, "constants": constants}
+
+
+def parse_bar_bound(value):
+    """
+    Parse a ``since``/``start``/``end`` query value: a date (YYYY-MM-DD) or an ISO
+    8601 timestamp.
+
+    Returns:
+        datetime.date or pd.Timestamp
+    Raises:
+        ValueError: When ``value`` is neither.
+    """
+    value = value.strip()
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+        return datetime.date.fromisoformat(value)
+    timestamp = pd.Timestamp(value)
+    if pd.isna(timestamp):
+        raise ValueError(f"Invalid date or timestamp: {value!r}")
+    return timestamp
+
+
+class BoundBeforePeriod(ValueError):
+    """Raised when a ``since``/``start`` bound lies before the first bar ``period`` covers."""
+
+
+def _localize_bound(timestamp, tz):
+    """A ``parse_bar_bound`` timestamp in ``tz``, taken as local time when it has no offset."""
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize(tz) if tz is not None else timestamp
+    return timestamp.tz_convert(tz)
+
+
+def check_period_covers(price_data, period, now, *bounds):
+    """
+    Raise BoundBeforePeriod when one of ``bounds`` (``parse_bar_bound`` values or
+    None) lies before the start of ``period``: its calendar start, the first
+    stored session for "Nd" periods, never for "max". The bars before it are not
+    part of the loaded window, so a range reaching back there needs a longer period.
+    """
+    _, unit = _parse_period(period)
+    if unit == "max":
+        return
+    tz = price_data.index.tz
+    if unit == "d":
+        period_start = price_data.index[0].normalize()
+    else:
+        period_start = _period_start(period, now, str(tz or "UTC")).tz_convert(tz)
+    for bound in bounds:
+        if bound is None:
+            continue
+        if isinstance(bound, pd.Timestamp):
+            before = _localize_bound(bound, tz) < period_start
+        else:
+            before = bound < period_start.date()
+        if before:
+            raise BoundBeforePeriod(
+                f"{bound} is before the start of period={period} ({period_start.date()}); pass a longer period")
+
+
+def bar_window(price_data, since=None, start=None, end=None):
+    """
+    Rows of the bars after ``since`` and from ``start`` through ``end``, each a
+    ``parse_bar_bound`` value or None. Dates cover whole days in the bars' own
+    (exchange) timezone, which is also assumed for timestamps without an offset.
+
+    Returns:
+        tuple: (first_row, stop) with the bars in ``price_data.iloc[first_row:stop]``
+    """
+    index = price_data.index
+    dates = bar_dates(price_data)
+
+    def position(bound, side):
+        if isinstance(bound, pd.Timestamp):
+            return int(index.searchsorted(_localize_bound(bound, index.tz), side=side))
+        return int(np.searchsorted(dates, np.datetime64(bound, "D"), side=side))
+
+    first_row, stop = 0, len(price_data)
+    if since is not None:
+        first_row = position(since, "right")
+    if start is not None:
+        first_row = max(first_row, position(start, "left"))
+    if end is not None:
+        stop = position(end, "right")
+    return first_row, max(first_row, stop)
+
+
+def bars_etag(price_data, first_row, stop, shares_outstanding, variant):
+    """
+    Strong ETag for the payload of bars ``first_row:stop``: the last bar's Unix
+    timestamp and a digest of everything the payload is built from, i.e. the bars'
+    times, closes and volumes (plus the close before ``first_row`` that its
+    pct_change depends on), the share count and ``variant``, the request options
+    that shape the body.
+    """
+    bars = price_data.iloc[max(first_row - 1, 0):stop]
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(bars.index.asi8.tobytes())
+    digest.update(bars['Close'].to_numpy(dtype=float).tobytes())
+    digest.update(bars['Volume'].to_numpy(dtype=float).tobytes())
+    digest.update(repr((first_row > 0, str(price_data.index.tz), shares_outstanding, variant)).encode())
+    last = int(bars.index[-1].timestamp()) if len(bars) else 0
+    return f'"{last}-{digest.hexdigest()}"'
+
+
+async def fetch_stock_window(ticker_symbol="AAPL", period="1d", interval="60m", columnar=False, live=False,
+                             since=None, start=None, end=None, if_none_match=(), renderer_format="json"):
+    """
+    The /api/stockdata/ payload for the stored bars of ``period`` narrowed down by
+    ``bar_window``, with its ETag (which also covers ``renderer_format``, the
+    encoding the payload will be rendered in).
+
+    Nothing is built when the ETag is one of ``if_none_match`` (or that holds
+    "*"), so a client revalidating an unchanged chart only costs reading the bar
+    store. A ``live`` payload changes with every bar and is always built.
+
+    Returns:
+        tuple: (processed payload or None when unavailable or not modified, ETag or
+               None when unavailable, refreshed-at datetime or None)
+    Raises:
+        BoundBeforePeriod: ``since``/``start`` lies before the start of ``period``.
+    """
+    print(f"🚀 Fetching {ticker_symbol} data: period={period}, interval={interval}")
+
+    try:
+        price_data, shares_outstanding, refreshed_at = await load_price_data_with_age(ticker_symbol, period, interval)
+
+        if price_data is None or price_data.empty:
+            print(f"❌ No price data available for {ticker_symbol}")
+            return None, None, None
+
+        check_period_covers(price_data, period, timezone.now(), since, start)
+        first_row, stop = bar_window(price_data, since, start, end)
+        etag = bars_etag(price_data, first_row, stop, shares_outstanding, (columnar, live, renderer_format))
+        if not live and (etag in if_none_match or "*" in if_none_match):
+            print(f"♻️ {ticker_symbol} not modified ({stop - first_row} records)")
+            return None, etag, refreshed_at
+
+        context_rows = 1 if first_row > 0 else 0
+        window = price_data.iloc[first_row - context_rows:stop]
+        if columnar:
+            processed = build_columnar_payload(window, shares_outstanding, context_rows)
+        else:
+            processed = build_stock_payload(window, shares_outstanding, context_rows)
+        if live:
+            processed["live"] = await live_bar_stats(ticker_symbol.upper(), interval, price_data)
+        print(f"✅ Processed {stop - first_row} records in memory")
+        return processed, etag, refreshed_at
+
+    except BoundBeforePeriod:
+        raise
     except Exception as e:
         print(f"❌ Error fetching data for {ticker_symbol}: {e}")
+        return None, None, None
+
+async def fetch_and_process_stock_data(ticker_symbol="AAPL", period="1d", interval="60m", columnar=False):
+    """
+    Stock data fetching and processing.
+    Serves bars from the local bar store (refreshing it incrementally from Yahoo
+    Finance), then builds the time series and financial metrics in memory.
+    With ``columnar=True`` the result is a ``build_columnar_payload`` dict instead.
+    """
+    processed, _ = await fetch_and_process_stock_data_with_age(ticker_symbol, period, interval, columnar)
+    return processed
+
+async def fetch_and_process_stock_data_with_age(ticker_symbol="AAPL", period="1d", interval="60m", columnar=False, live=False):
+    """
+    ``fetch_and_process_stock_data`` plus when its bars were last refreshed from
+    Yahoo Finance. With ``live=True`` the payload also gets a ``live`` entry with
+    the statistics and anomaly flag of the latest bar (see ``live_bar_stats``).
+
+    Returns:
+        tuple: (processed payload or None, refreshed-at datetime or None)
+    """
+    processed, _, refreshed_at = await fetch_stock_window(ticker_symbol, period, interval, columnar, live)
+    return processed, refreshed_at
+
+async def live_bar_stats(symbol, interval, price_data):
+    """
+    Rolling z-score, EWMA and GARCH volatility and the anomaly flag of the latest
+    bar in ``price_data`` (see ``LiveBarStats``).
+
+    The statistics of each (ticker, interval) are kept in the "analytics" cache and
+    only advanced over the bars completed since the previous call, so a request
+    costs O(new bars) and never refits anything. The last bar is scored without
+    being pushed because it may still be forming. A missing state, or one that no
+    longer matches the bars (a completed bar was revised, or ``price_data`` no
+    longer reaches back to it), is rebuilt from the last LIVE_STATS_WARMUP_BARS
+    bars in the bar store, however short the requested period, seeded with the
+    stored GARCH fit. It is also rebuilt once the feature store has a GARCH fit
+    the state was built without.
+
+    Returns:
+        dict: {"time", "pct_change", "zscore", "rolling_mean", "rolling_volatility",
+               "ewma_volatility", "garch_volatility", "anomaly", "window_full"}, or
+               None when the latest bar cannot be scored. ``zscore`` stays None
+               (and ``anomaly`` false) until ``window_full``, i.e. while fewer than
+               LIVE_STATS_WINDOW returns are known.
+    """
+    close = price_data["Close"].to_numpy(dtype=float).tolist()
+    if len(close) < 2 or not math.isfinite(close[-1]):
+        return None
+    times = price_data.index
+    last_complete = len(close) - 2
+    cache = caches["analytics"]
+    key = f"live-stats:{symbol}:{interval}"
+
+    stats = cache.get(key)
+    start = None
+    if stats is not None:
+        i = int(times.searchsorted(stats.last_time))
+        if i <= last_complete and times[i] == stats.last_time and close[i] == stats.last_close:
+            start = i + 1
+        if stats.garch_variance is None and "garch_volatility" in price_data and \
+                math.isfinite(price_data["garch_volatility"].iloc[last_complete]):
+            start = None
+    if start is None:
+        stats = await run_orm(_warm_up_live_stats, symbol, interval, times[last_complete])
+        start = last_complete + 1
+
+    for i in range(start, last_complete + 1):
+        if math.isfinite(close[i]):
+            stats.push(times[i], close[i])
+    if stats.last_close is None:
         return None
+    cache.set(key, stats)
+    return {"time": times[-1].isoformat(), **stats.evaluate(close[-1], settings.LIVE_ANOMALY_Z)}
+
+def _warm_up_live_stats(symbol, interval, last_time):
+    """
+    LiveBarStats pushed with the last LIVE_STATS_WARMUP_BARS stored bars of
+    (symbol, interval) up to ``last_time``, seeded with the stored GARCH fit when
+    the feature store has one.
+    """
+    rows = list(
+        StockData.objects.filter(ticker=symbol, interval=interval, timestamp__lte=last_time.to_pydatetime())
+        .order_by("-timestamp").values_list("timestamp", "close_price", "garch_volatility")
+        [:settings.LIVE_STATS_WARMUP_BARS + 1]
+    )[::-1]
+    garch_params, garch_variance = None, None
+    # The conditional volatility of the first change pushed, from the first bar to the second.
+    seed = rows[1][2] if len(rows) > 1 else None
+    if seed is not None and math.isfinite(seed):
+        garch_params = (SeriesFeatures.objects.filter(ticker=symbol, interval=interval)
+                        .values_list("garch_params", flat=True).first())
+        garch_variance = seed ** 2
+    stats = LiveBarStats(settings.LIVE_STATS_WINDOW, settings.LIVE_STATS_EWMA_LAMBDA, garch_params, garch_variance)
+    for timestamp, close, _ in rows:
+        if close is not None and math.isfinite(close):
+            stats.push(pd.Timestamp(timestamp).tz_convert(last_time.tz), close)
+    return stats
+
+
+def batch_concurrency():
+    """
+    Tickers a batch loads through the bar store at a time: STOCKDATA_BATCH_CONCURRENCY,
+    or one on SQLite, which fails concurrent writers ("database table is locked")
+    rather than queueing them.
+    """
+    if connection.vendor == "sqlite":
+        return 1
+    return settings.STOCKDATA_BATCH_CONCURRENCY
+
+
+async def fetch_and_process_stock_data_batch(ticker_symbols, period="1d", interval="60m", columnar=False):
+    """
+    fetch_and_process_stock_data for many tickers, running at most
+    ``batch_concurrency()`` of them at a time.
+
+    Parameters:
+        ticker_symbols (list): Ticker symbols; case and duplicates are ignored.
+    Returns:
+        dict: {SYMBOL: payload or None}, in the order the symbols were given.
+    """
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in ticker_symbols if symbol.strip()))
+    limit = asyncio.Semaphore(batch_concurrency())
+
+    async def fetch(symbol):
+        async with limit:
+            return await fetch_and_process_stock_data(symbol, period, interval, columnar)
+
+    payloads = await asyncio.gather(*[fetch(symbol) for symbol in symbols])
+    return dict(zip(symbols, payloads))
 
 # Keep original function for backward compatibility if needed
 async def fetch_price_av():
     # Placeholder for async implementation for Alpha Vantage or similar.
     pass
 
-async def unusual_ranges(data):
+def series_digest(times, prices):
+    """
+    Content hash of a posted (times, prices) series, used to key cached analytics.
+    The time strings are hashed as sent so a cache hit never has to parse them.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update("\0".join(map(str, times)).encode("utf-8"))
+    digest.update(np.asarray(prices, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def series_identity(data):
+    """
+    Identify which series a posted payload belongs to across calls, so a later call
+    with more bars can pick up the earlier GARCH fit. An explicit "ticker" (with
+    "interval" and "period") wins; otherwise a series is known by its first bar.
+    """
+    if data.get("ticker"):
+        return f"{data['ticker'].upper()}:{data.get('interval', '1d')}:{data.get('period', '')}"
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{data['time'][0]}|{float(data['price'][0])!r}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def unusual_ranges(data, wait_for_slot=False):
     """
     Asynchronously identify unusual date ranges using a GARCH-based volatility test 
     and a Central Limit Theorem test on daily price changes.
 
+    Results are memoized in the "analytics" cache under a hash of the time and price
+    arrays, so re-sending an identical series skips the GARCH fit entirely. A series
+    that only gained bars since the last call reuses that call's fit (see
+    ``incremental_conditional_volatility``).
+
     Parameters:
         data (dict): Dictionary with keys "time", "price", and optionally "volume".
                      - "time": list of date strings (format "YYYY-MM-DD")
                      - "price": list of price values (floats)
                      - "volume": list of volumes (ignored in this function)
+                     - "ticker"/"interval": optional, identify the series across calls
+        wait_for_slot (bool): Wait for room in a saturated process pool instead of
+                     raising PoolSaturated (see ``run_in_process``).
     Returns:
         List of tuples, where each tuple contains two strings representing the start 
         and end dates ("YYYY-MM-DD") of an unusual range. Each range will span at least 2 days.
@@ -115,81 +977,191 @@ async def unusual_ranges(data):
     if not data or "time" not in data or "price" not in data:
         raise ValueError("Data must contain 'time' and 'price' arrays")
     
-    # Convert the time strings to numpy.datetime64 objects.
-    times = np.array([np.datetime64(t) for t in data["time"]])
     prices = np.array(data["price"], dtype=float)
     
     if len(prices) < 2:
         raise ValueError("Not enough price data to compute daily changes.")
-    
-    # Compute daily changes as the difference between consecutive prices.
-    # The daily change corresponding to a day is taken as the difference from the previous day.
-    daily_changes = np.diff(prices)
-    # The corresponding dates for these daily changes are the dates from the second element onward.
-    daily_dates = times[1:]
-    
-    # Compute the critical value for a two-tailed 95% confidence interval.
-    crit_value = scipy.stats.norm.ppf(1 - 0.05 / 2)
-    
-    # Offload the GARCH model fitting to a separate thread.
-    garch_fit = await asyncio.to_thread(
-        lambda: arch_model(daily_changes, vol='Garch', p=1, q=1).fit(disp='off')
-    )
-    forecast = garch_fit.conditional_volatility  # same length as daily_changes
-    
-    # Calculate basic statistics.
-    mean = np.mean(daily_changes)
-    stdev = np.std(daily_changes)
-    
-    # Apply the combined test to determine unusual days.
-    mask = (np.abs(daily_changes) > (crit_value * forecast))
-    mask = mask & ((np.abs(daily_changes - mean) / stdev) > crit_value)
-    unusual_dates = daily_dates[mask]
-    
-    if unusual_dates.size == 0:
+
+    # The analytics cache is process-local memory, so it is read synchronously
+    # rather than paying a thread hop through aget().
+    cache = caches["analytics"]
+    key = "garch:" + series_digest(data["time"], prices)
+    result = cache.get(key)
+    if result is None:
+        # Convert the time strings to numpy.datetime64 objects.
+        times = np.array(data["time"], dtype="datetime64")
+        # Offload the GARCH model fitting to the process pool, reusing the previous
+        # fit of this series when the new data only extends it.
+        state_key = "garch-state:" + series_identity(data)
+        args = (cache.get(state_key), times, prices, settings.GARCH_EXTEND_MAX_BARS)
+        ranges, forecast, state = await run_in_process(analyze_series, *args, wait_for_slot=wait_for_slot)
+        cache.set(state_key, state)
+        result = {
+            "conditional_volatility": forecast,
+            "params": state["params"],
+            "ranges": ranges,
+        }
+        cache.set(key, result)
+
+    if not result["ranges"]:
         raise Exception("No unusual dates found with combined tests")
-    
-    # Sort the unusual dates.
-    unusual_dates = np.sort(unusual_dates)
-    # Compute the gaps between consecutive unusual dates.
-    gaps = np.diff(unusual_dates)
-    # Convert gaps to days (as integers) for comparison.
-    gaps_in_days = gaps.astype('timedelta64[D]').astype(int)
-    median_gap = np.median(gaps_in_days)
-    # Identify indices where the gap is greater than the median gap.
-    gap_indices = np.where(gaps_in_days > median_gap)[0]
-    
-    # Group consecutive unusual dates into ranges.
-    if gap_indices.size == 0:
-        ranges = [(unusual_dates[0], unusual_dates[-1])]
-    else:
-        start_indices = np.r_[0, gap_indices + 1]
-        end_indices = np.r_[gap_indices, unusual_dates.size - 1]
-        ranges = [(unusual_dates[s], unusual_dates[e]) for s, e in zip(start_indices, end_indices) if s != e]
-    
-    # Sort the ranges by duration (in days) in descending order.
-    ranges.sort(key=lambda pair: (pair[1] - pair[0]).astype('timedelta64[D]').astype(int), reverse=True)
-    
-    # Convert the numpy.datetime64 objects to strings in "YYYY-MM-DD" format.
-    formatted_ranges = [(str(start.astype('M8[D]')), str(end.astype('M8[D]'))) for start, end in ranges]
-    
-    # --- Ensure each range spans at least 2 days ---
-    # Determine the maximum date in the input (to avoid extending beyond available data).
-    max_date = times.max()
-    adjusted_ranges = []
-    for start_str, end_str in formatted_ranges:
-        start_date = np.datetime64(start_str)
-        end_date = np.datetime64(end_str)
-        if start_date == end_date:
-            # If start is not the maximum date, extend by one day.
-            if start_date < max_date:
-                end_date = start_date + np.timedelta64(1, 'D')
-            else:
-                # Otherwise, if start is the maximum date, shift the range back by one day.
-                start_date = start_date - np.timedelta64(1, 'D')
-        adjusted_ranges.append((str(start_date.astype('M8[D]')), str(end_date.astype('M8[D]'))))
-    
-    return adjusted_ranges
+    return result["ranges"]
+
+
+DAILY_INTERVALS = {"1d", "5d", "1wk", "1mo", "3mo"}
+
+
+def _bar_times(price_data, interval):
+    if interval in DAILY_INTERVALS:
+        return bar_dates(price_data)
+    return price_data.index.tz_localize(None).to_numpy().astype("datetime64[m]")
+
+
+async def series_for_ticker(ticker_symbol, period="1y", interval="1d"):
+    """
+    Resolve a ticker to the {"time", "price", "ticker", "interval", "period"}
+    payload that unusual_ranges takes, using the bar store.
+    """
+    price_data, _ = await load_price_data(ticker_symbol, period, interval)
+    if price_data is None or price_data.empty:
+        raise ValueError(f"No data available for {ticker_symbol}")
+    return {
+        "time": _bar_times(price_data, interval).astype(str).tolist(),
+        "price": price_data["Close"].tolist(),
+        "ticker": ticker_symbol,
+        "interval": interval,
+        "period": period,
+    }
+
+
+async def ticker_unusual_ranges(ticker_symbol, period="1y", interval="1d", wait_for_slot=False):
+    """
+    unusual_ranges for the bars of ``period`` of a ticker in the bar store, fitted
+    over exactly those bars as if they had been posted. Its incremental fit state
+    is kept per period, so the result does not depend on which other periods of the
+    ticker were loaded before.
+    """
+    return await unusual_ranges(await series_for_ticker(ticker_symbol, period, interval), wait_for_slot)
+
+
+async def load_features(ticker_symbol="AAPL", period="1y", interval="1d"):
+    """
+    The bars of a ticker with their derived series (see stockdata/features.py),
+    updating the feature store first if bars were stored since its last update.
+
+    Returns:
+        pd.DataFrame: Close plus the FEATURE_FIELDS columns (NaN where undefined),
+                      or None when there is no data for the ticker.
+    """
+    symbol = ticker_symbol.upper()
+    price_data, _ = await load_price_data(symbol, period, interval)
+    if price_data is None or price_data.empty:
+        return None
+    dirty = await run_orm(
+        SeriesFeatures.objects.filter(ticker=symbol, interval=interval, dirty_from__isnull=False).exists)
+    if dirty:
+        await coalesced(f"features:{symbol}:{interval}", lambda: update_features(symbol, interval))
+        price_data, _ = await load_price_data(symbol, period, interval)
+    return price_data[["Close", *FEATURE_FIELDS]]
+
+
+async def batch_unusual_ranges(series=None, tickers=(), period="1y", interval="1d"):
+    """
+    Run unusual_ranges over many series at once, fitting them in parallel in the
+    process pool, and yield each result as soon as it is ready.
+
+    Parameters:
+        series (dict): {name: {"time": [...], "price": [...]}} posted by the client.
+        tickers (iterable): Ticker symbols to resolve through the bar store with
+            ``period``/``interval``.
+    Yields:
+        dict: {"name", "source", "status_code", "unusual_ranges"} or {"name", "source",
+              "status_code", "error"}, in completion order. ``source`` is "series"
+              or "ticker", so a posted series and a ticker of the same name stay apart.
+    """
+    # At most half the pool's pending-task limit at a time, so a large batch leaves
+    # room for the fits of other requests; a fit that still finds the pool full
+    # waits for a slot rather than failing.
+    limit = asyncio.Semaphore(max(1, settings.STOCKDATA_MAX_PENDING_TASKS // 2))
+    # Tickers are first loaded through the bar store (and possibly Yahoo), as many
+    # at a time as in /api/stockdata/batch/; their fits then run like posted series.
+    loads = asyncio.Semaphore(batch_concurrency())
+
+    async def posted(data):
+        return data
+
+    async def load_ticker(ticker):
+        async with loads:
+            return await series_for_ticker(ticker, period, interval)
+
+    async def run(name, source, load):
+        try:
+            data = await load
+            async with limit:
+                ranges = await unusual_ranges(data, wait_for_slot=True)
+            return {"name": name, "source": source, "status_code": 200, "unusual_ranges": ranges}
+        except Exception as e:
+            return {"name": name, "source": source, "status_code": 500, "error": str(e)}
+
+    jobs = [run(name, "series", posted(data)) for name, data in (series or {}).items()]
+    jobs += [run(ticker, "ticker", load_ticker(ticker)) for ticker in tickers]
+    for next_result in asyncio.as_completed(jobs):
+        yield await next_result
+
+
+async def market_series():
+    """The stored MARKET_INDEX_SYMBOL history, downloaded first if nothing is stored yet."""
+    symbol = settings.MARKET_INDEX_SYMBOL
+
+    async def load_or_fetch():
+        try:
+            return load_market_series(symbol)
+        except FileNotFoundError:
+            return await fetch_and_store_market_data(index_symbol=symbol)
+
+    try:
+        return load_market_series(symbol)
+    except FileNotFoundError:
+        return await coalesced(f"market:{symbol}", load_or_fetch)
+
+
+def _finite(value):
+    return float(value) if np.isfinite(value) else None
+
+
+async def ranges_vs_market(data, ranges, fetch_market=True):
+    """
+    Compare each of a stock's ranges with the market index in one vectorized pass
+    (see ``analyze_ranges_vs_market``).
+
+    Parameters:
+        data (dict): The stock series, with "time" and "price" arrays.
+        ranges (list): ("YYYY-MM-DD", "YYYY-MM-DD") pairs, e.g. from unusual_ranges.
+        fetch_market (bool): Download the index history when none is stored yet;
+            otherwise FileNotFoundError is raised.
+    Returns:
+        dict: {"beta": float or None, "ranges": [{"start", "end", "stock_return",
+              "market_return", "excess_return", "same_direction", "market_driven"}]}
+              with returns as fractions (None where a range has no bars).
+    """
+    if not data or "time" not in data or "price" not in data:
+        raise ValueError("Data must contain 'time' and 'price' arrays")
+    market = await market_series() if fetch_market else load_market_series(settings.MARKET_INDEX_SYMBOL)
+    result = analyze_ranges_vs_market(
+        data["time"], data["price"], ranges, market, settings.MARKET_DRIVEN_MAX_EXCESS_RATIO)
+    return {
+        "beta": _finite(result["beta"]),
+        "ranges": [{
+            "start": str(start),
+            "end": str(end),
+            "stock_return": _finite(result["stock_return"][i]),
+            "market_return": _finite(result["market_return"][i]),
+            "excess_return": _finite(result["excess_return"][i]),
+            "same_direction": bool(result["same_direction"][i]),
+            "market_driven": bool(result["market_driven"][i]),
+        } for i, (start, end) in enumerate(ranges)],
+    }
+
 
 async def get_stock_metadata_info(ticker_symbol="AAPL"):
     """
@@ -197,7 +1169,12 @@ async def get_stock_metadata_info(ticker_symbol="AAPL"):
       - currency
       - exchangeName
       - longName
-      - last close price (using 'previousClose')
+      - last close date
+      - monthly and yearly percentage change
+
+    The history metadata and one 400-session daily history are fetched concurrently;
+    the last close and both percentage changes are all derived from that one series,
+    over the same windows the bar store serves for period="1mo" and "1y".
     
     Parameters:
         ticker_symbol (str): The stock ticker symbol (default "AAPL").
@@ -205,38 +1182,30 @@ async def get_stock_metadata_info(ticker_symbol="AAPL"):
     Returns:
         dict: A dictionary with the extracted information.
     """
-    # Create the Ticker object
-    ticker = yf.Ticker(ticker_symbol)
-    
-    # Run the synchronous call in a separate thread.
-    metadata = await asyncio.to_thread(ticker.get_history_metadata)
+    # Each call gets its own Ticker: yfinance caches history metadata on the Ticker
+    # object, so sharing one between the two threads would race.
+    # "400d" is 400 trading sessions, as everywhere else: enough for "1y".
+    metadata, hist = await asyncio.gather(
+        asyncio.to_thread(yf.Ticker(ticker_symbol).get_history_metadata),
+        asyncio.to_thread(yf.Ticker(ticker_symbol).history, period="400d"),
+    )
     
     # Navigate the nested metadata structure.
     # Typically the useful info is nested inside the 'chart' key.
     currency = metadata["currency"]
     exchangeName = metadata["fullExchangeName"]
     longName = metadata["longName"]
-    hist = ticker.history(period="1d")
-    lastClose = hist.index[-1].date()  
-    # Calculate monthly percentage change:
-    # Retrieve approximately 35 days of data to cover "30 days ago".
-    hist_month = await asyncio.to_thread(ticker.history, period="35d")
-    if not hist_month.empty:
-        price_today_month = hist_month["Close"].iloc[-1]
-        price_30_days_ago = hist_month["Close"].iloc[0]
-        monthly_pct_change = (price_today_month / price_30_days_ago) - 1
-    else:
-        monthly_pct_change = None
-
-    # Calculate annual percentage change:
-    # Retrieve approximately 400 days of data to cover "365 days ago".
-    hist_year = await asyncio.to_thread(ticker.history, period="400d")
-    if not hist_year.empty:
-        price_today_year = hist_year["Close"].iloc[-1]
-        price_365_days_ago = hist_year["Close"].iloc[0]
-        yearly_pct_change = (price_today_year / price_365_days_ago) - 1
-    else:
-        yearly_pct_change = None
+    lastClose = hist.index[-1].date()
+
+    # Percentage change from the first close of ``period`` counted back from the
+    # last bar, i.e. the first bar _load_bars would serve for that period.
+    closes = hist["Close"].to_numpy()
+    def pct_change_over(period):
+        start = hist.index.searchsorted(_period_start(period, hist.index[-1], str(hist.index.tz)))
+        return (closes[-1] / closes[start]) - 1
+
+    monthly_pct_change = pct_change_over("1mo")
+    yearly_pct_change = pct_change_over("1y")
 
     return {
         "currency": currency,
@@ -245,4 +1214,4 @@ async def get_stock_metadata_info(ticker_symbol="AAPL"):
         "lastClose": lastClose,
         "montly_pct_change": monthly_pct_change,
         "yearly_pct_change": yearly_pct_change
-    }
\ No newline at end of file
+    }
@@ -1,32 +1,93 @@
-from asgiref.sync import async_to_sync, sync_to_async
-from rest_framework.decorators import api_view, renderer_classes
+import asyncio
+import json
+from adrf.decorators import api_view
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.decorators import renderer_classes
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 from .utils import *
 from .models import StockData
 from .serializers import StockDataSerializer
+from .renderers import ColumnarJSONRenderer, PackedColumnsRenderer
+from .executor import PoolSaturated
+from .prefetch import cached_stock_metadata
 from datetime import datetime
 
 
+def with_data_age(response, fetched_at):
+    """Report in ``X-Data-Age`` how many seconds ago the data was fetched from Yahoo."""
+    if fetched_at is not None:
+        response["X-Data-Age"] = str(max(0, int((timezone.now() - fetched_at).total_seconds())))
+    return response
+
+
+def with_etag(response, etag):
+    """Tag ``response`` and have clients revalidate it with ``If-None-Match`` before reuse."""
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    # The renderer can be picked by the Accept header, and each encodes differently.
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
 @api_view(['GET'])
-@renderer_classes([JSONRenderer])
-def stock_data_api(request):
-    """API endpoint to fetch stock data with time series and financial metrics."""
-    return async_to_sync(async_stock_data_api)(request)
+@renderer_classes([JSONRenderer, ColumnarJSONRenderer, PackedColumnsRenderer])
+async def stock_data_api(request):
+    """
+    API endpoint to fetch stock data with time series and financial metrics.
+
+    ``?format=columnar`` returns one array per column with constant columns moved to
+    ``constants``; ``?format=binary`` returns the same columns as packed arrays
+    (see ``PackedColumnsRenderer``).
 
-async def async_stock_data_api(request):
+    Stale bars within STOCKDATA_STALE_SECONDS are served without waiting for Yahoo;
+    the ``X-Data-Age`` header gives their age in seconds.
+
+    ``?live=1`` adds ``live``: rolling statistics of the latest bar and whether it
+    is an anomaly, updated incrementally as bars arrive (see ``live_bar_stats``).
+
+    Range and delta queries narrow the bars of ``period`` down (see ``bar_window``):
+      - since: Only bars after this date or ISO timestamp, e.g. the last one a
+        client already has.
+      - start, end: Only bars from ``start`` through ``end`` (inclusive).
+    A ``since``/``start`` before the start of ``period`` is a 400; pass a period
+    reaching back far enough (e.g. ``period=max``).
+
+    Responses carry a strong ``ETag``; a request whose ``If-None-Match`` holds it
+    gets an empty 304 Not Modified instead (``live`` responses excepted).
+    """
+    refreshed_at = None
+    etag = None
     try:
         # Get parameters with defaults if not provided
         stock_name = request.query_params.get('stockname', 'AAPL')
         period = request.query_params.get('period', '1d')
         interval = request.query_params.get('interval', '60m')
+        columnar = request.accepted_renderer.format in ("columnar", "binary")
+        live = request.query_params.get('live') == '1'
+        try:
+            bounds = {
+                name: parse_bar_bound(request.query_params[name])
+                for name in ("since", "start", "end") if request.query_params.get(name)
+            }
+        except ValueError as e:
+            return Response({"status_code": 400, "error": str(e)}, status=400)
+        if_none_match = [tag.removeprefix("W/") for tag in parse_etags(request.headers.get("If-None-Match", ""))]
     
-        # Fetch and process data in memory (stateless approach)
-        import asyncio
-        processed_data = await asyncio.wait_for(
-            fetch_and_process_stock_data(ticker_symbol=stock_name, period=period, interval=interval),
+        # Serve bars from the bar store and process them in memory
+        processed_data, etag, refreshed_at = await asyncio.wait_for(
+            fetch_stock_window(ticker_symbol=stock_name, period=period, interval=interval, columnar=columnar,
+                               live=live, if_none_match=if_none_match,
+                               renderer_format=request.accepted_renderer.format, **bounds),
             timeout=60.0  # Increased timeout for processing
         )
+
+        if processed_data is None and etag is not None:
+            return with_etag(with_data_age(Response(status=304), refreshed_at), etag)
         
         if not processed_data:
             return Response({
@@ -34,13 +95,19 @@ async def async_stock_data_api(request):
                 "error": "No data available for the specified stock"
             })
     
-        # Return processed data immediately (no database storage)
-        response_data = {
-            "status_code": 200,
-            "time_series": processed_data["time_series"],
-            "fin_data": processed_data["fin_data"],
-        }
+        if columnar:
+            response_data = {"status_code": 200, **processed_data}
+        else:
+            response_data = {
+                "status_code": 200,
+                "time_series": processed_data["time_series"],
+                "fin_data": processed_data["fin_data"],
+            }
+            if live:
+                response_data["live"] = processed_data["live"]
         
+    except BoundBeforePeriod as e:
+        return Response({"status_code": 400, "error": str(e)}, status=400)
     except asyncio.TimeoutError:
         response_data = {
             "status_code": 500,
@@ -52,11 +119,107 @@ async def async_stock_data_api(request):
             "error": str(e)
         }
     
+    response = with_data_age(Response(response_data), refreshed_at)
+    if etag is not None and not live and response_data["status_code"] == 200:
+        with_etag(response, etag)
+    return response
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+async def stock_data_batch_api(request):
+    """
+    API endpoint to fetch stock data for several tickers at once.
+
+    Query Parameters:
+      - stocknames: Comma-separated ticker symbols (at most STOCKDATA_BATCH_MAX_SERIES).
+      - period, interval: As for /api/stockdata/, applied to every ticker.
+
+    Response JSON structure:
+    {
+        "status_code": 200,
+        "results": {
+            "AAPL": {"status_code": 200, "time_series": [...], "fin_data": [...]},
+            "XXXX": {"status_code": 500, "error": "No data available for the specified stock"},
+            ...
+        }
+    }
+    """
+    stocknames = [name for name in request.query_params.get('stocknames', '').split(',') if name.strip()]
+    period = request.query_params.get('period', '1d')
+    interval = request.query_params.get('interval', '60m')
+    if not stocknames:
+        return Response({"status_code": 400, "error": "Missing 'stocknames'"}, status=400)
+    if len(stocknames) > settings.STOCKDATA_BATCH_MAX_SERIES:
+        return Response({
+            "status_code": 400,
+            "error": f"At most {settings.STOCKDATA_BATCH_MAX_SERIES} tickers per batch"
+        }, status=400)
+
+    try:
+        payloads = await asyncio.wait_for(
+            fetch_and_process_stock_data_batch(stocknames, period=period, interval=interval),
+            timeout=60.0
+        )
+    except asyncio.TimeoutError:
+        return Response({
+            "status_code": 500,
+            "error": "Request timeout - data processing took too long"
+        })
+
+    results = {}
+    for symbol, processed_data in payloads.items():
+        if processed_data:
+            results[symbol] = {"status_code": 200, **processed_data}
+        else:
+            results[symbol] = {"status_code": 500, "error": "No data available for the specified stock"}
+    return Response({"status_code": 200, "results": results})
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+async def stock_features_api(request):
+    """
+    API endpoint to fetch the precomputed derived series of a stock.
+
+    Query Parameters:
+      - stockname, period, interval: As for /api/stockdata/ (defaults AAPL, 1y, 1d).
+
+    Response JSON structure:
+    {
+        "status_code": 200,
+        "time": ["2025-01-02", ...],
+        "pct_change": [null, 0.53, ...],
+        "volatility_5": [...], "volatility_21": [...], "volatility_63": [...],
+        "garch_volatility": [...]
+    }
+    Values are null where a series is not defined yet (e.g. before a window fills).
+    """
+    stock_name = request.query_params.get('stockname', 'AAPL')
+    period = request.query_params.get('period', '1y')
+    interval = request.query_params.get('interval', '1d')
+    try:
+        features = await asyncio.wait_for(load_features(stock_name, period, interval), timeout=60.0)
+    except asyncio.TimeoutError:
+        return Response({
+            "status_code": 500,
+            "error": "Request timeout - data processing took too long"
+        })
+    except Exception as e:
+        return Response({"status_code": 500, "error": str(e)})
+    if features is None:
+        return Response({
+            "status_code": 500,
+            "error": "No data available for the specified stock"
+        })
+
+    response_data = {"status_code": 200, "time": bar_dates(features).astype(str).tolist()}
+    for name in FEATURE_FIELDS:
+        values = features[name]
+        response_data[name] = values.astype(object).where(values.notna(), None).tolist()
     return Response(response_data)
 
 @api_view(['POST'])
 @renderer_classes([JSONRenderer])
-def unusual_ranges_api(request):
+async def unusual_ranges_api(request):
     """
     API endpoint to calculate unusual date ranges.
     
@@ -79,7 +242,8 @@ def unusual_ranges_api(request):
         ]
     }
     
-    On error, it returns a 500 status with the error message.
+    On error, it returns a 500 status with the error message; 503 when the
+    statistics pool is saturated and 504 when the fit times out.
     """
     # Extract input data from the request body.
     input_data = request.data.get('data', None)
@@ -87,20 +251,129 @@ def unusual_ranges_api(request):
         return Response({"status_code": 400, "error": "Missing 'data' in request"}, status=400)
     
     try:
-        # Call the async unusual_ranges function using async_to_sync.
-        ranges = async_to_sync(unusual_ranges)(input_data)
+        ranges = await unusual_ranges(input_data)
         return Response({
             "status_code": 200,
             "unusual_ranges": ranges
         })
+    except PoolSaturated as e:
+        return Response({"status_code": 503, "error": str(e)}, status=503)
+    except TimeoutError as e:
+        return Response({"status_code": 504, "error": str(e)}, status=504)
     except Exception as e:
         return Response({
             "status_code": 500,
             "error": str(e)
         }, status=500)
+@api_view(['POST'])
+@renderer_classes([JSONRenderer])
+async def batch_unusual_ranges_api(request):
+    """
+    API endpoint to calculate unusual date ranges for many series in one call.
+
+    Expected request JSON structure (either or both of "series" and "tickers"):
+    {
+        "series": {
+            "AAPL": {"time": ["2025-01-01", ...], "price": [243.85, ...]},
+            ...
+        },
+        "tickers": ["MSFT", "NVDA"],
+        "period": "1y",      # used to fetch "tickers" (default "1y")
+        "interval": "1d"     # used to fetch "tickers" (default "1d")
+    }
+    A ticker's ranges are fitted over exactly the bars of "period", the same as
+    posting that series.
+
+    The series are fitted in parallel in the process pool and the response streams
+    one JSON object per line (application/x-ndjson) as each finishes, with
+    "source" telling posted series ("series") and tickers ("ticker") apart:
+        {"name": "AAPL", "source": "series", "status_code": 200, "unusual_ranges": [["2025-01-10", "2025-01-15"], ...]}
+        {"name": "MSFT", "source": "ticker", "status_code": 500, "error": "..."}
+    """
+    series = request.data.get('series') or {}
+    tickers = request.data.get('tickers') or []
+    if not isinstance(series, dict) or not isinstance(tickers, list) or not (series or tickers):
+        return Response({"status_code": 400, "error": "Provide 'series' (object) and/or 'tickers' (list)"}, status=400)
+    if not all(isinstance(data, dict) for data in series.values()):
+        return Response({"status_code": 400, "error": "Every entry of 'series' must be an object with 'time' and 'price'"}, status=400)
+    if not all(isinstance(ticker, str) and ticker.strip() for ticker in tickers):
+        return Response({"status_code": 400, "error": "Every entry of 'tickers' must be a ticker symbol"}, status=400)
+    if len(series) + len(tickers) > settings.STOCKDATA_BATCH_MAX_SERIES:
+        return Response({
+            "status_code": 400,
+            "error": f"At most {settings.STOCKDATA_BATCH_MAX_SERIES} series per request"
+        }, status=400)
+
+    results = batch_unusual_ranges(
+        series=series,
+        tickers=tickers,
+        period=request.data.get('period', '1y'),
+        interval=request.data.get('interval', '1d'),
+    )
+
+    async def stream():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
+@api_view(['POST'])
+@renderer_classes([JSONRenderer])
+async def market_direction_api(request):
+    """
+    API endpoint comparing a stock's unusual ranges with the market index.
+
+    Expected request JSON structure:
+    {
+        "data": {"time": [...], "price": [...]},
+        "ranges": [["2025-01-10", "2025-01-15"], ...]    (optional)
+    }
+    When "ranges" is omitted they are computed with unusual_ranges(data).
+
+    Response JSON structure on success:
+    {
+        "status_code": 200,
+        "beta": 1.12,
+        "ranges": [
+            {"start": "2025-01-10", "end": "2025-01-15", "stock_return": -0.08,
+             "market_return": -0.06, "excess_return": -0.013,
+             "same_direction": true, "market_driven": true},
+            ...
+        ],
+        "unexplained_ranges": [["2025-02-03", "2025-02-04"], ...]
+    }
+    "unexplained_ranges" keeps only the ranges the market does not account for,
+    i.e. the ones worth sending to /api/news/, ranked by the size of their
+    beta-adjusted excess return (most stock-specific first).
+    """
+    input_data = request.data.get('data', None)
+    if input_data is None:
+        return Response({"status_code": 400, "error": "Missing 'data' in request"}, status=400)
+
+    try:
+        ranges = request.data.get('ranges')
+        if ranges is None:
+            ranges = await unusual_ranges(input_data)
+        result = await ranges_vs_market(input_data, ranges)
+        unexplained = sorted(
+            (r for r in result["ranges"] if not r["market_driven"]),
+            key=lambda r: -abs(r["excess_return"]) if r["excess_return"] is not None else 0,
+        )
+        return Response({
+            "status_code": 200,
+            **result,
+            "unexplained_ranges": [[r["start"], r["end"]] for r in unexplained],
+        })
+    except PoolSaturated as e:
+        return Response({"status_code": 503, "error": str(e)}, status=503)
+    except TimeoutError as e:
+        return Response({"status_code": 504, "error": str(e)}, status=504)
+    except Exception as e:
+        return Response({"status_code": 500, "error": str(e)}, status=500)
+
 @api_view(["GET"])
 @renderer_classes([JSONRenderer])
-def stock_metadata_api(request):
+async def stock_metadata_api(request):
     """
     API endpoint to fetch stock metadata.
 
@@ -113,21 +386,33 @@ def stock_metadata_api(request):
         - exchangeName
         - longName
         - lastClose
+      The ``X-Data-Age`` header gives the age of the metadata in seconds; stale
+      metadata within STOCKDATA_METADATA_STALE_SECONDS is served while it refreshes.
     """
     # Get the ticker symbol from query parameters (default to AAPL)
     ticker_symbol = request.query_params.get("stockname", "AAPL")
     print(ticker_symbol)
     
     try:
-        # Wrap the async function to run synchronously.
-        data = async_to_sync(get_stock_metadata_info)(ticker_symbol)
+        data, fetched_at = await cached_stock_metadata(ticker_symbol)
         response_data = {
             "status_code": 200,
             "metadata": data
         }
-        return Response(response_data, status=200)
+        return with_data_age(Response(response_data, status=200), fetched_at)
     except Exception as e:
         return Response({
             "status_code": 500,
             "error": str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+async def upstream_stats_api(request):
+    """Coalescing counters for the Yahoo-backed loads of the serving process, per key."""
+    return Response({
+        "status_code": 200,
+        "in_flight": upstream_flights.in_flight(),
+        "totals": upstream_flights.stats,
+        "keys": upstream_flights.key_stats(),
+    })
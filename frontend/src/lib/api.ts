@@ -22,6 +22,17 @@ interface NewsData {
   text_summary: string;
 }
 
+// New bars pushed over /ws/stockdata/, in the same row shapes as /api/stockdata/
+interface StockBarsUpdate {
+  type: 'bars';
+  ticker: string;
+  interval: string;
+  timestamps: string[];
+  time_series: { time: string; close_price: number; volume: number }[];
+  fin_data: Record<string, number | string | null>[];
+  live: Record<string, number | boolean | string | null> | null;
+}
+
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
 export async function fetchStockData(
@@ -92,4 +103,60 @@ export async function fetchNewsData(
     }
     throw error; // Re-throw to handle in the component
   }
-} 
\ No newline at end of file
+} 
+
+/**
+ * Subscribe to new bars of a ticker instead of polling fetchStockData.
+ * `since` (ISO timestamp of the last bar already loaded) fills any gap since
+ * that load. When the server drops the connection for falling behind (close
+ * code 1013) it reconnects with `since` set to the last bar received. Returns a
+ * function that closes the subscription.
+ */
+export function subscribeStockUpdates(
+  symbol: string,
+  interval: string,
+  onBars: (update: StockBarsUpdate) => void,
+  since?: string
+): () => void {
+  let lastTimestamp = since;
+  let socket: WebSocket;
+  let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+  let closed = false;
+
+  const connect = () => {
+    socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/ws/stockdata/`);
+
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ action: 'subscribe', ticker: symbol, interval, since: lastTimestamp }));
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'bars') {
+        const update = message as StockBarsUpdate;
+        if (update.timestamps.length > 0) {
+          lastTimestamp = update.timestamps[update.timestamps.length - 1];
+        }
+        onBars(update);
+      } else if (message.type === 'error') {
+        console.error('Error in stock updates:', message.error);
+      }
+    };
+    socket.onerror = (error) => {
+      console.error('Stock updates connection error:', error);
+    };
+    socket.onclose = (event) => {
+      // 1013: too far behind; the server holds the missed bars for `since`.
+      if (!closed && event.code === 1013) {
+        reconnectTimer = setTimeout(connect, 1000);
+      }
+    };
+  };
+
+  connect();
+
+  return () => {
+    closed = true;
+    clearTimeout(reconnectTimer);
+    socket.close();
+  };
+}